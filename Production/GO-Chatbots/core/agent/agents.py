@@ -7,11 +7,12 @@ from keras.models import Sequential
 from keras.layers import Dense, Activation
 
 from rl.agents.dqn import DQNAgent
+import numpy as np
 import logging
 
 from core import constants as const
 
-class GODQNAgent():
+class GODQNAgent(DQNAgent):
 
     def __init__(self, output_dim=0, state_dimension=0, hidden_size=80, act_func=const.RELU, *args, **kwargs):
 
@@ -47,6 +48,46 @@ class GODQNAgent():
 
         return model
 
+    def train_on_memory(self, memory):
+        """
+        Method to train the Q-network on batches randomly drawn from a memory, as many as fit in its size, after every
+        simulation epoch. The targets are computed by the target network, as in the `DQNAgent` backward pass.
+
+        # Arguments:
+
+            - ** memory **: the memory of the agent, having the `sample_batch` method (e.g. `GOMemory`)
+
+        ** return **: the mean loss of the batches
+        """
+        logging.info("Calling `GODQNAgent` train_on_memory method")
+
+        batch_idx = np.arange(self.batch_size)
+        losses = []
+        for _ in xrange(memory.memory_size() // self.batch_size):
+            s_curr, actions, rewards, s_next, done = memory.sample_batch(self.batch_size)
+
+            target_q_values = self.target_model.predict_on_batch(s_next)
+            if self.enable_double_dqn:
+                q_next = target_q_values[batch_idx, np.argmax(self.model.predict_on_batch(s_next), axis=1)]
+            else:
+                q_next = np.max(target_q_values, axis=1)
+            returns = (rewards + self.gamma * q_next * (1. - done)).astype(np.float32)
+
+            # only the Q-values of the taken actions are trained
+            targets = np.zeros((self.batch_size, self.nb_actions), dtype=np.float32)
+            masks = np.zeros((self.batch_size, self.nb_actions), dtype=np.float32)
+            targets[batch_idx, actions] = returns
+            masks[batch_idx, actions] = 1.
+
+            metrics = self.trainable_model.train_on_batch([s_curr, targets, masks], [returns, targets])
+            losses.append(metrics[0])
+
+            self.step += 1
+            if self.target_model_update >= 1 and self.step % self.target_model_update == 0:
+                self.update_target_model_hard()
+
+        return np.mean(losses) if losses else 0.
+
 
 
 
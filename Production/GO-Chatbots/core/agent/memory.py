@@ -4,6 +4,8 @@ Author: Vladimir Ilievski <ilievski.vladimir@live.com>
 A Python file for the Goal-Oriented Dialogue Memory classes.
 """
 
+from core.dst.sparse import dense_to_sparse, sparse_states_to_csr, csr_to_dense
+import numpy as np
 import random
 
 class GOMemory(object):
@@ -82,5 +84,90 @@ class GOMemory(object):
         batch = [random.choice(self.experience_pool) for i in xrange(batch_size)]
         return batch
 
+    def sample_batch(self, batch_size):
+        """
+        Method to create a batch of randomly drawn experiences from the memory, with the sampled states stacked, as
+        consumed by the models of the agents.
+
+        # Arguments:
+
+            - ** batch_size **: number of examples in one batch
+
+        ** return **: the current states and the next states of shape (batch_size, state_dim), and the arrays of the
+                      actions, the rewards and the terminal flags
+        """
+
+        batch = self.sample(batch_size)
+
+        return np.vstack([experience[0] for experience in batch]), np.array([experience[1] for experience in batch]), \
+               np.array([experience[2] for experience in batch]), np.vstack([experience[3] for experience in batch]), \
+               np.array([experience[4] for experience in batch], dtype=np.bool_)
+
     def memory_size(self):
         return len(self.experience_pool)
+
+
+class GOSparseMemory(GOMemory):
+    """
+    Agent memory keeping the states in the sparse form (see `core/dst/sparse.py`), as the pairs of the indices and the
+    values of their non-zero elements. The states of the rule-based state tracker are almost entirely zeros, so the
+    experiences take a small fraction of the memory of the dense states, and a sampled batch is densified at once.
+
+    # Arguments:
+
+        - ** warmup_size **: the number of experience tuples to be saved during a warm-up
+        - ** state_dim **: the dimension of the dense states
+    """
+
+    def __init__(self, warmup_size, state_dim):
+        super(GOSparseMemory, self).__init__(warmup_size)
+        self.state_dim = state_dim
+
+    def append(self, s_curr, a_curr, r_curr, s_next, done):
+        """
+        Method to append new experience in the buffer, with the states in the sparse form
+
+        # Arguments:
+
+            - ** s_curr **: the current state the agent is perceiving, dense or sparse (e.g. from
+                            `produce_sparse_state`)
+            - ** a_curr **: the action that agent took in s_curr
+            - ** r_curr **: the reward that agent experienced after taking the action a_curr in s_curr
+            - ** s_next **: the next state returned by the environment, dense or sparse
+            - ** done **: is the new state terminal or not
+        """
+
+        super(GOSparseMemory, self).append(self.__sparse_state(s_curr), a_curr, r_curr, self.__sparse_state(s_next),
+                                           done)
+
+    def __sparse_state(self, state):
+        """
+        Private helper method to convert a dense state to the sparse form, the sparse states are kept as they are.
+        """
+
+        if isinstance(state, tuple):
+            return state
+
+        return dense_to_sparse(state)
+
+    def sample_batch(self, batch_size):
+        """
+        Method to create a batch of randomly drawn experiences from the memory, with the sampled states stacked in the
+        CSR form and densified by `csr_to_dense`, as consumed by the models of the agents.
+
+        # Arguments:
+
+            - ** batch_size **: number of examples in one batch
+
+        ** return **: the current states and the next states of shape (batch_size, state_dim), and the arrays of the
+                      actions, the rewards and the terminal flags
+        """
+
+        batch = self.sample(batch_size)
+
+        s_curr = csr_to_dense(sparse_states_to_csr([experience[0] for experience in batch]), self.state_dim)
+        s_next = csr_to_dense(sparse_states_to_csr([experience[3] for experience in batch]), self.state_dim)
+
+        return s_curr, np.array([experience[1] for experience in batch]), \
+               np.array([experience[2] for experience in batch]), s_next, \
+               np.array([experience[4] for experience in batch], dtype=np.bool_)
@@ -6,6 +6,7 @@ A Python file for the Goal-Oriented Dialogue Policy classes.
 
 from rl.policy import Policy
 from core import constants as const
+from core.dst.sparse import csr_dot
 import numpy as np
 
 class GORuleBasedPolicy(Policy):
@@ -122,3 +123,128 @@ class GORuleBasedPolicy(Policy):
 
     def get_config(self):
         return {}
+
+
+class GOPolicySnapshot(object):
+    """
+    Class for a snapshot of the Q-network of a DQN agent, as a NumPy multilayer perceptron, such that the policy can be
+    run in other processes without the deep learning framework. With a prob. epsilon it takes a random action,
+    otherwise it selects the action with the highest Q-value.
+
+    # Arguments:
+
+        ** weights **: the weights of the Q-network as returned by `model.get_weights()`, the kernel and the bias of
+                       every dense layer
+        ** act_func **: the activation function of the hidden layers, the output layer is linear, or the list of the
+                        activation functions of every dense layer
+        ** eps **: the probability of a random action
+        ** dueling_type **: the type of the dueling head of the Q-network ('avg', 'max' or 'naive'), whose last dense
+                            layer outputs the state value followed by the advantages of the actions, None without it
+    """
+
+    def __init__(self, weights=None, act_func=const.RELU, eps=0., dueling_type=None):
+        self.layers = [(np.asarray(weights[idx]), np.asarray(weights[idx + 1])) for idx in xrange(0, len(weights), 2)]
+        if isinstance(act_func, list):
+            self.activations = act_func
+        else:
+            self.activations = [act_func] * (len(self.layers) - 1) + [const.LINEAR]
+        self.eps = eps
+
+        if dueling_type not in [None, 'avg', 'max', 'naive']:
+            raise Exception("Unknown dueling type: '{0}'".format(dueling_type))
+        self.dueling_type = dueling_type
+
+        self.nb_actions = self.layers[-1][1].shape[0] - (1 if dueling_type is not None else 0)
+
+    @classmethod
+    def from_model(cls, model, eps=0., dueling_type=None):
+        """
+        Method to take a snapshot of the current weights of a (keras) model. The model is a stack of dense layers,
+        each one optionally followed by an activation layer, and it ends with the dueling head if `dueling_type` is
+        given (as built by the keras-rl `DQNAgent`).
+        """
+
+        weights = []
+        activations = []
+        for layer_idx, layer in enumerate(model.layers):
+            layer_type = layer.__class__.__name__
+
+            if layer_type == 'InputLayer':
+                continue
+            elif layer_type == 'Dense' and len(layer.get_weights()) == 2:
+                weights.extend(layer.get_weights())
+                activations.append(layer.get_config()['activation'])
+            elif layer_type == 'Activation' and activations and activations[-1] == const.LINEAR:
+                activations[-1] = layer.get_config()['activation']
+            elif layer_type == 'Lambda' and dueling_type is not None and layer_idx == len(model.layers) - 1:
+                continue
+            else:
+                raise Exception("The layer '{0}' of type {1} cannot be taken in a policy snapshot".format(
+                    layer.name, layer_type))
+
+        if dueling_type is not None and model.layers[-1].__class__.__name__ != 'Lambda':
+            raise Exception("The model has no dueling head of type '{0}'".format(dueling_type))
+
+        return cls(weights, activations, eps, dueling_type)
+
+    def __activation(self, x, act_func):
+        """
+        Private helper method applying an activation function.
+        """
+
+        if act_func == const.RELU:
+            return np.maximum(x, 0.)
+        elif act_func == const.SIGMOID:
+            return 1. / (1. + np.exp(-x))
+        elif act_func == const.TANH:
+            return np.tanh(x)
+        elif act_func == const.LINEAR:
+            return x
+
+        raise Exception("Unknown activation function: '{0}'".format(act_func))
+
+    def q_values(self, states):
+        """
+        Method to compute the Q-values of a batch of states.
+
+        # Arguments:
+
+            ** states **: array of shape (batch_size, state_dim), or a batch of sparse states in the CSR form (see
+                          `core.dst.sparse`), whose first layer only gathers the weights of the non-zero elements
+
+        ** return **: array of shape (batch_size, nb_actions)
+        """
+
+        x = states
+        for layer_idx, (kernel, bias) in enumerate(self.layers):
+            if layer_idx == 0 and isinstance(x, tuple):
+                x = csr_dot(x, kernel) + bias
+            else:
+                x = np.dot(x, kernel) + bias
+
+            x = self.__activation(x, self.activations[layer_idx])
+
+        # the dueling head combines the state value with the advantages of the actions
+        if self.dueling_type == 'avg':
+            x = x[:, :1] + x[:, 1:] - np.mean(x[:, 1:], axis=1, keepdims=True)
+        elif self.dueling_type == 'max':
+            x = x[:, :1] + x[:, 1:] - np.max(x[:, 1:], axis=1, keepdims=True)
+        elif self.dueling_type == 'naive':
+            x = x[:, :1] + x[:, 1:]
+
+        return x
+
+    def reset(self):
+        """
+        Method to reset the policy, the snapshot keeps no state between the dialogues
+        """
+
+        pass
+
+    def select_action(self, state=None, **kwargs):
+        """A method to select an action for a state of shape (1, state_dim)"""
+
+        if np.random.uniform() < self.eps:
+            return np.random.randint(self.nb_actions)
+
+        return int(np.argmax(self.q_values(state)[0]))
@@ -67,6 +67,8 @@ RULE_BASED_STATE_TRACKER = "rule_based_state_tracker"
 MODEL_BASED_STATE_TRACKER = "model_based_state_tracker"
 # key for specifying a path to an already trained model-based state tracker
 MODEL_BASED_STATE_TRACKER_PATH_KEY = "model_based_state_tracker_path"
+# default maximal number of memoized encodings of the actions which are not feasible agent actions
+DEFAULT_ACTION_ENCODING_CACHE_SIZE = 10000
 
 ########################################################################################################################
 # Agent training related constants                                                                                     #
@@ -82,6 +84,10 @@ NL_SIMULATION_MODE = "nl_simulation_mode"
 IS_TRAINING_KEY = "is_training"
 # key for specifying the maximal number of dialogue turns
 MAX_NB_TURNS = "max_nb_turns"
+# key for specifying the number of processes simulating the dialogues
+NB_ROLLOUT_WORKERS_KEY = "nb_rollout_workers"
+# default number of processes simulating the dialogues, the dialogues are simulated in the main process
+DEFAULT_NB_ROLLOUT_WORKERS = 1
 
 
 # key for specifying the path to the nlu unit
@@ -127,8 +133,44 @@ TURN_NB_KEY = "turn"
 
 # key for specifying a path to the knowledge base
 KB_PATH_KEY = "kb_path"
+# key for specifying the format of the knowledge base found on the kb path
+KB_BACKEND_KEY = "kb_backend"
+# value for a knowledge base pickled as a dictionary of a form {entity_id: {slot: value}}
+PICKLE_KB_BACKEND = "pickle_kb_backend"
+# value for a knowledge base saved in the compact columnar format, which is memory-mapped
+MMAP_KB_BACKEND = "mmap_kb_backend"
+# value for a knowledge base stored in a SQLite database, the kb path is the path to the database file
+SQLITE_KB_BACKEND = "sqlite_kb_backend"
+# key for specifying the maximal number of cached results of each kb query type
+KB_CACHE_SIZE_KEY = "kb_cache_size"
+# default maximal number of cached results of each kb query type
+DEFAULT_KB_CACHE_SIZE = 10000
+# version of the cache keys and the cached results, the saved caches of other versions are not loaded
+KB_CACHE_FORMAT_VERSION = 2
+# the names of the query caches of the kb helper
+KB_QUERY_CACHE_NAMES = ['cached_kb', 'cached_kb_slot', 'cached_kb_histogram']
+# key for specifying the path to the file where the kb query caches are saved and loaded from, None for no file
+KB_CACHE_PATH_KEY = "kb_cache_path"
+# key for specifying whether the kb query caches are filled with the constraints of all user goals at startup
+KB_PRECOMPUTE_KEY = "kb_precompute"
+# key for specifying the number of processes filling the kb query caches at startup, all cores by default
+KB_PRECOMPUTE_WORKERS_KEY = "kb_precompute_workers"
+# key for specifying the query caches shared between processes, as created by `create_shared_kb_caches`
+KB_SHARED_CACHES_KEY = "kb_shared_caches"
+# the number of new query results written at once to the caches shared between processes
+DEFAULT_SHARED_CACHE_FLUSH_SIZE = 64
+# key for specifying the minimal similarity for matching the noisy slot values to the kb values, None for exact matching
+KB_FUZZY_THRESHOLD_KEY = "kb_fuzzy_threshold"
+# maximal number of cached constraint subsets probed before a kb query is answered from the inverted index
+KB_MAX_SUBSET_PROBES = 64
 # key for specifying a kb querying result where all of the constraints were matched
 KB_MATCHING_ALL_CONSTRAINTS_KEY = "matching_all_constraints"
+# code in the kb columns for an entity not having a value for the slot
+KB_MISSING_VALUE_CODE = -1
+# code of a constraint value which is not present in the kb, it does not match any entity
+KB_NO_MATCH_CODE = -2
+# cache key shared by all queries having a constraint which does not match any entity
+KB_NO_MATCH_QUERY_KEY = frozenset([(None, KB_NO_MATCH_CODE)])
 
 ########################################################################################################################
 # Dialog status related constants                                                                                      #
@@ -138,6 +180,8 @@ KB_MATCHING_ALL_CONSTRAINTS_KEY = "matching_all_constraints"
 FAILED_DIALOG = -1
 SUCCESS_DIALOG = 1
 NO_OUTCOME_YET = 0
+# key for specifying the dialogue status in the info returned by the environment step
+DIALOGUE_STATUS_KEY = "dialogue_status"
 
 # Rewards
 SUCCESS_REWARD = 50
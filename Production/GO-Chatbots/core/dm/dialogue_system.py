@@ -6,11 +6,15 @@ A Python file for the entire Goal-Oriented Dialogue System.
 
 from core import constants as const
 from core.environment.environment import GOEnv
+from core.environment.rollout import GORolloutWorkers, summarize_episodes
+from core.agent.policy import GOPolicySnapshot
 import core.agent.agents as agents
 from core.agent.processor import GOProcessor
 from core.dm.kb_helper import GOKBHelper
+from core.dm.kb_columns import GOKBColumns
+from core.dm.kb_sqlite import GOSQLiteKBHelper
 import cPickle as pickle
-import logging
+import itertools, json, logging, multiprocessing
 from keras.optimizers import Adam
 from rl.callbacks import FileLogger, ModelIntervalCheckpoint
 
@@ -65,14 +69,27 @@ class GODialogSys(object):
         self.max_nb_turns = params[const.MAX_NB_TURNS]
 
         # create the knowledge base helper class
-        self.knowledge_dict = pickle.load(open(params[const.KB_PATH_KEY], 'rb'))
-        self.kb_helper = GOKBHelper(self.ultimate_request_slot, self.kb_special_slots, self.kb_filter_slots,
-                                    self.knowledge_dict)
+        self.kb_helper = self.__create_kb_helper(params)
+        self.knowledge_dict = self.kb_helper.knowledge_dict
+
+        # start with the query caches of the previous runs on the same knowledge base, if any
+        self.kb_cache_path = params.get(const.KB_CACHE_PATH_KEY)
+        if self.kb_cache_path is not None:
+            self.kb_helper.load_cache(self.kb_cache_path)
+
+        # answer the constraints of all user goals before the training, so the dialogues never query the kb
+        if params.get(const.KB_PRECOMPUTE_KEY, False):
+            self.__precompute_kb_caches(params.get(const.KB_PRECOMPUTE_WORKERS_KEY, multiprocessing.cpu_count()),
+                                        params.get(const.KB_CACHE_SIZE_KEY, const.DEFAULT_KB_CACHE_SIZE))
         self.agt_feasible_actions = agt_feasible_actions
 
         # create the environment
         self.env = self.__create_env(params)
 
+        # the rollout workers are forked by the first simulation, if there are several of them
+        self.nb_rollout_workers = params.get(const.NB_ROLLOUT_WORKERS_KEY, const.DEFAULT_NB_ROLLOUT_WORKERS)
+        self.rollout_workers = None
+
         # agent-related
         self.go_processor = GOProcessor(feasible_actions=self.agt_feasible_actions)
         self.nb_actions = len(self.agt_feasible_actions)
@@ -96,6 +113,78 @@ class GODialogSys(object):
         # create the specified agent type
         self.agent = self.__create_agent(params)
 
+    def __create_kb_helper(self, params):
+        """
+        Private helper method for loading the knowledge base and creating the knowledge base helper.
+
+        # Arguments:
+
+            - ** params **: the params for loading the knowledge base
+
+        ** return **: the newly created knowledge base helper
+        """
+        logging.info('Calling `GODialogSys` __create_kb_helper method')
+
+        kb_path = params[const.KB_PATH_KEY]
+        kb_backend = params.get(const.KB_BACKEND_KEY, const.PICKLE_KB_BACKEND)
+        cache_size = params.get(const.KB_CACHE_SIZE_KEY, const.DEFAULT_KB_CACHE_SIZE)
+        shared_caches = params.get(const.KB_SHARED_CACHES_KEY)
+        fuzzy_threshold = params.get(const.KB_FUZZY_THRESHOLD_KEY)
+
+        if kb_backend == const.PICKLE_KB_BACKEND:
+            knowledge_dict = pickle.load(open(kb_path, 'rb'))
+            kb_helper = GOKBHelper(self.ultimate_request_slot, self.kb_special_slots, self.kb_filter_slots,
+                                   knowledge_dict, cache_size, shared_caches=shared_caches,
+                                   fuzzy_threshold=fuzzy_threshold)
+        elif kb_backend == const.MMAP_KB_BACKEND:
+            kb_columns = GOKBColumns.load(kb_path)
+            kb_helper = GOKBHelper(self.ultimate_request_slot, self.kb_special_slots, self.kb_filter_slots,
+                                   None, cache_size, kb_columns, shared_caches, fuzzy_threshold)
+        elif kb_backend == const.SQLITE_KB_BACKEND:
+            kb_helper = GOSQLiteKBHelper(self.ultimate_request_slot, self.kb_special_slots, self.kb_filter_slots,
+                                         kb_path, cache_size, shared_caches, fuzzy_threshold)
+        else:
+            raise Exception("Unknown knowledge base backend: '{0}'".format(kb_backend))
+
+        return kb_helper
+
+    def __precompute_kb_caches(self, nb_workers, cache_size):
+        """
+        Private helper method for filling the knowledge base query caches with the constraints reachable from the user
+        goals. During a dialogue, the user informs the slots of its goal one by one, so the constraints are the subsets
+        of the inform slots of the goal.
+
+        Every set of constraints takes one entry of each cache, so when there are more sets than the capacity of the
+        caches, only the smallest ones are precomputed, since every dialogue goes through them first. Otherwise the
+        precomputed entries would evict each other before the training starts.
+
+        # Arguments:
+
+            - ** nb_workers **: the number of processes filling the caches
+            - ** cache_size **: the capacity of each query cache, None for unbounded caches
+        """
+        logging.info('Calling `GODialogSys` __precompute_kb_caches method')
+
+        inform_slots_list = []
+        seen_inform_slots = set()
+        for goal in self.goal_set:
+            goal_inform_slots = goal[const.INFORM_SLOTS_KEY].items()
+
+            for subset_size in xrange(len(goal_inform_slots) + 1):
+                for subset in itertools.combinations(goal_inform_slots, subset_size):
+                    if frozenset(subset) not in seen_inform_slots:
+                        seen_inform_slots.add(frozenset(subset))
+                        inform_slots_list.append(dict(subset))
+
+        if cache_size is not None and len(inform_slots_list) > cache_size:
+            logging.warning("The user goals have {0} constraint sets, more than the kb cache size {1}, only the {1} "
+                            "smallest ones are precomputed".format(len(inform_slots_list), cache_size))
+            inform_slots_list = sorted(inform_slots_list, key=len)[:cache_size]
+
+        nb_entries = self.kb_helper.precompute_caches(inform_slots_list, nb_workers)
+        logging.info("Precomputed {0} kb cache entries for {1} constraint sets".format(nb_entries,
+                                                                                      len(inform_slots_list)))
+
     def __create_env(self, params):
         """
         Private helper method for creating an environment given the parameters.
@@ -144,15 +233,114 @@ class GODialogSys(object):
 
     def train(self, nb_epochs, nb_warmup_episodes, nb_episodes_per_epoch, res_path, weights_file_name):
         """
-        Method for training the system.
-        
+        Method for training the system. The dialogues of the warm-up policy fill the memory of the agent, then every
+        epoch simulates dialogues with the current Q-network, adding their experiences to the memory and recording its
+        performance, and trains the Q-network on the memory.
+
         # Arguments:
+
+            - ** nb_epochs **: the number of epochs
+            - ** nb_warmup_episodes **: the number of warm-up dialogues
+            - ** nb_episodes_per_epoch **: the number of simulated dialogues in every epoch
+            - ** res_path **: path of the file of the performance records of the epochs
+            - ** weights_file_name **: path of the file of the trained weights of the agent
         """
+        logging.info('Calling `GODialogSys` train method')
+
+        self.simulate(nb_warmup_episodes, policy=self.agt_warmup_policy, memory=self.agt_memory, warmup=True)
+
+        performance_records = {'success_rate': {}, 'ave_reward': {}, 'ave_turns': {}}
+        for epoch in xrange(nb_epochs):
+            res = self.simulate(nb_episodes_per_epoch, eps=getattr(self.agt_policy, 'eps', 0.), memory=self.agt_memory)
+            for key in performance_records:
+                performance_records[key][epoch] = res[key]
 
-        self.agent.fit(env=self.env, nb_epochs=nb_epochs, nb_warmup_episodes=nb_warmup_episodes,
-                       nb_episodes_per_epoch=nb_episodes_per_epoch, res_path=res_path)
+            loss = self.agent.train_on_memory(self.agt_memory)
+            logging.info("Epoch {0}: success rate {1}, loss {2}".format(epoch, res['success_rate'], loss))
+
+        json.dump(performance_records, open(res_path, 'wb'))
 
         self.agent.save_weights(weights_file_name, overwrite=True)
+        self.save_kb_cache()
+
+    def simulate(self, nb_episodes, policy=None, eps=0., memory=None, warmup=False):
+        """
+        Method for simulating dialogues, in the rollout worker processes if there are several of them, e.g. for the
+        warm-up or the epoch evaluation. The new query results of the workers are merged into the kb query caches.
+
+        # Arguments:
+
+            - ** nb_episodes **: the number of dialogues
+            - ** policy **: the policy of the agent in the dialogues (e.g. the warm-up policy), by default a snapshot of
+                            the current Q-network of the agent
+            - ** eps **: the probability of a random action of the Q-network snapshot
+            - ** memory **: optional memory of the agent, the experiences of the dialogues are appended to it
+            - ** warmup **: whether the experiences are appended as the warm-up ones, up to the warm-up size of the
+                            memory
+
+        ** return **: dictionary of the success rate, the average reward and the average number of turns
+        """
+        logging.info('Calling `GODialogSys` simulate method')
+
+        if policy is None:
+            dueling_type = self.dueling_type if self.enable_dueling_network else None
+            policy = GOPolicySnapshot.from_model(self.agent.model, eps, dueling_type)
+
+        episode_stats_list = []
+        for transitions, episode_stats in self.__get_rollout_workers().run_episodes(policy, nb_episodes):
+            if memory is not None:
+                for experience in transitions:
+                    if warmup:
+                        memory.append_warmup(*experience)
+                    else:
+                        memory.append_simulation(*experience)
+
+            episode_stats_list.append(episode_stats)
+
+        res = summarize_episodes(episode_stats_list)
+        logging.info("Simulation of {0} dialogues: success rate {1}, ave reward {2}, ave turns {3}".format(
+            nb_episodes, res['success_rate'], res['ave_reward'], res['ave_turns']))
+
+        return res
+
+    def __get_rollout_workers(self):
+        """
+        Private helper method for getting the rollout workers, forked by the first simulation. The workers answer from
+        the knowledge base as it was when they were forked, so they are forked again after its updates (e.g. by
+        `self.kb_helper.add_entity`).
+
+        ** return **: the rollout workers
+        """
+
+        if self.rollout_workers is not None and self.rollout_workers.is_stale():
+            logging.info('The knowledge base was updated, the rollout workers are forked again')
+            self.rollout_workers.close()
+            self.rollout_workers = None
+
+        if self.rollout_workers is None:
+            self.rollout_workers = GORolloutWorkers(self.env, self.nb_rollout_workers)
+
+        return self.rollout_workers
+
+    def close(self):
+        """
+        Method for stopping the rollout worker processes, if any.
+        """
+        logging.info('Calling `GODialogSys` close method')
+
+        if self.rollout_workers is not None:
+            self.rollout_workers.close()
+            self.rollout_workers = None
+
+    def save_kb_cache(self):
+        """
+        Method for saving the knowledge base query caches, if a cache file is given, such that the next runs on the
+        same knowledge base start with warm caches.
+        """
+        logging.info('Calling `GODialogSys` save_kb_cache method')
+
+        if self.kb_cache_path is not None:
+            self.kb_helper.save_cache(self.kb_cache_path)
 
     def initialize(self):
         """
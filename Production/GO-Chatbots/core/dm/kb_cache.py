@@ -0,0 +1,365 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the cache of the Knowledge Base query results
+"""
+
+from core import constants as const
+from collections import OrderedDict
+import logging
+
+
+class GOLRUCache(object):
+    """
+    Size-bounded cache with a least recently used eviction policy. It keeps statistics of the hits, misses and
+    evictions, in order to size the cache against the real query distribution.
+
+    # Class members:
+
+        - ** capacity **: the maximal number of entries in the cache, None for unbounded cache
+        - ** entries **: ordered dictionary of the entries, from the least to the most recently used
+        - ** hits **: the number of lookups that found an entry
+        - ** misses **: the number of lookups that did not find an entry
+        - ** evictions **: the number of entries evicted because the cache was full
+        - ** invalidations **: the number of entries removed because they were no longer valid
+        - ** new_entries **: the entries put since the last `take_new_entries`, None if they are not recorded
+    """
+
+    def __init__(self, capacity=None):
+        """Constructor of the `GOLRUCache` class"""
+        logging.info('Calling `GOLRUCache` constructor')
+
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.new_entries = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Look up an entry and mark it as the most recently used. A lookup never inserts an entry.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** default **: the value returned when there is no entry for the key
+
+        ** return **: the cached value, or the default one
+        """
+
+        if key not in self.entries:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        value = self.entries.pop(key)
+        self.entries[key] = value
+
+        return value
+
+    def peek(self, key, default=None):
+        """
+        Look up an entry without marking it as used and without counting it in the statistics.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** default **: the value returned when there is no entry for the key
+
+        ** return **: the cached value, or the default one
+        """
+
+        return self.entries.get(key, default)
+
+    def put(self, key, value):
+        """
+        Insert or replace an entry, evicting the least recently used entries if the cache is full.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** value **: the value to be cached
+        """
+
+        if key in self.entries:
+            del self.entries[key]
+
+        self.entries[key] = value
+        if self.new_entries is not None:
+            self.new_entries[key] = value
+
+        while self.capacity is not None and len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Method to remove all entries. The statistics are kept.
+        """
+
+        self.entries.clear()
+
+    def flush(self):
+        """
+        Method to write the pending entries to the entries shared with other processes. A local cache has none.
+        """
+
+        pass
+
+    def invalidate(self, is_stale):
+        """
+        Remove the entries whose key is no longer valid.
+
+        # Arguments:
+
+            - ** is_stale **: function taking a key and returning True if its entry is no longer valid
+
+        ** return **: the number of removed entries
+        """
+
+        stale_keys = [key for key in self.entries if is_stale(key)]
+        for key in stale_keys:
+            del self.entries[key]
+
+        if self.new_entries is not None:
+            for key in [key for key in self.new_entries if is_stale(key)]:
+                del self.new_entries[key]
+
+        self.invalidations += len(stale_keys)
+
+        return len(stale_keys)
+
+    def record_new_entries(self):
+        """
+        Method to start recording the entries put in the cache, such that they can be merged into the cache of another
+        process (see `take_new_entries`).
+        """
+
+        self.new_entries = OrderedDict()
+
+    def take_new_entries(self):
+        """
+        ** return **: list of the key and value pairs of the entries put since the last call, or since the recording
+                      started, the evicted ones included
+        """
+
+        new_entries = self.new_entries.items()
+        self.new_entries.clear()
+
+        return new_entries
+
+    def items(self):
+        """
+        ** return **: list of the key and value pairs of the entries, from the least to the most recently used
+        """
+
+        return self.entries.items()
+
+    def stats(self):
+        """
+        ** return **: dictionary of the cache statistics
+        """
+
+        nb_lookups = self.hits + self.misses
+
+        return {'size': len(self.entries), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations,
+                'hit_rate': float(self.hits) / nb_lookups if nb_lookups > 0 else 0.}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class GOSharedKBCache(object):
+    """
+    Cache of the knowledge base query results, shared between several processes. It is made for read-mostly use:
+    every process keeps its own `GOLRUCache` in front of a dictionary shared through a `multiprocessing.Manager`.
+    A lookup first checks the local cache, and then the shared dictionary, so the result of a query computed in one
+    process is reused by all other processes. The keys must be canonical constraint sets, which are the same in all
+    processes loading the same knowledge base, and the knowledge base must not be updated (see `invalidate`).
+
+    Every access to the shared dictionary is an inter-process round trip, so only the local misses read it, and the
+    new entries are written in batches of `flush_size` entries. The size of the shared dictionary is read only when a
+    batch is written. A round trip costs about as much as a query on the inverted index, so the shared caches pay off
+    only for the backends with costlier queries, e.g. the SQLite one (see `experiments/kb_benchmark.py --kb_caches`),
+    and they are never used by default.
+
+    It has the same interface as `GOLRUCache`, so it can replace it in the `GOKBHelper`.
+
+    # Class members:
+
+        - ** local_cache **: the cache of this process
+        - ** shared_entries **: the dictionary proxy shared between the processes
+        - ** shared_capacity **: the maximal number of shared entries, afterwards no new entries are shared
+        - ** shared_hits **: the number of lookups that were missing locally and found in the shared entries
+        - ** pending_entries **: the new entries not written to the shared entries yet
+        - ** flush_size **: the number of pending entries written to the shared entries at once
+        - ** shared_size **: the number of shared entries, as of the last write
+    """
+
+    def __init__(self, capacity=None, shared_entries=None, shared_capacity=None,
+                 flush_size=const.DEFAULT_SHARED_CACHE_FLUSH_SIZE):
+        """Constructor of the `GOSharedKBCache` class"""
+        logging.info('Calling `GOSharedKBCache` constructor')
+
+        self.local_cache = GOLRUCache(capacity)
+        self.shared_entries = shared_entries
+        self.shared_capacity = shared_capacity
+        self.shared_hits = 0
+        self.pending_entries = {}
+        self.flush_size = flush_size
+        self.shared_size = 0
+
+    def get(self, key, default=None):
+        """
+        Look up an entry in the local cache, and then in the shared entries. An entry found in the shared entries is
+        copied to the local cache.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** default **: the value returned when there is no entry for the key
+
+        ** return **: the cached value, or the default one
+        """
+
+        value = self.local_cache.get(key)
+        if value is not None:
+            return value
+
+        # an entry evicted from the local cache before it was written to the shared entries
+        value = self.pending_entries.get(key)
+        if value is None:
+            value = self.shared_entries.get(key)
+        if value is None:
+            return default
+
+        # the lookup was counted as a miss in the local cache
+        self.local_cache.misses -= 1
+        self.local_cache.hits += 1
+        self.shared_hits += 1
+        self.local_cache.put(key, value)
+
+        return value
+
+    def peek(self, key, default=None):
+        """
+        Look up an entry only in the local cache, without any inter-process communication.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** default **: the value returned when there is no entry for the key
+
+        ** return **: the cached value, or the default one
+        """
+
+        return self.local_cache.peek(key, default)
+
+    def put(self, key, value):
+        """
+        Insert an entry in the local cache and share it with the next batch, if the shared entries are not full.
+
+        # Arguments:
+
+            - ** key **: the key of the entry
+            - ** value **: the value to be cached
+        """
+
+        self.local_cache.put(key, value)
+
+        if self.shared_capacity is None or self.shared_size + len(self.pending_entries) < self.shared_capacity:
+            self.pending_entries[key] = value
+
+            if len(self.pending_entries) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Method to write the pending entries to the shared entries, in a single round trip, and to read the number of
+        shared entries.
+        """
+
+        if len(self.pending_entries) > 0:
+            self.shared_entries.update(self.pending_entries)
+            self.pending_entries.clear()
+            self.shared_size = len(self.shared_entries)
+
+    def clear(self):
+        """
+        Method to remove all local entries. The shared entries are kept for the other processes.
+        """
+
+        self.local_cache.clear()
+        self.pending_entries.clear()
+
+    def invalidate(self, is_stale):
+        """
+        The shared entries cannot be invalidated: the local caches of the other processes would keep the stale entries,
+        and copy them back from each other. The knowledge base must not be updated while its caches are shared.
+
+        # Arguments:
+
+            - ** is_stale **: function taking a key and returning True if its entry is no longer valid
+        """
+
+        raise Exception("The entries of the shared knowledge base caches cannot be invalidated")
+
+    def record_new_entries(self):
+        """
+        Method to start recording the entries put in the local cache (see `GOLRUCache.record_new_entries`).
+        """
+
+        self.local_cache.record_new_entries()
+
+    def take_new_entries(self):
+        """
+        ** return **: list of the key and value pairs of the entries put in the local cache since the last call
+        """
+
+        return self.local_cache.take_new_entries()
+
+    def items(self):
+        """
+        ** return **: list of the key and value pairs of the local entries, from the least to the most recently used
+        """
+
+        return self.local_cache.items()
+
+    def stats(self):
+        """
+        ** return **: dictionary of the cache statistics
+        """
+
+        stats = self.local_cache.stats()
+        stats['shared_hits'] = self.shared_hits
+        stats['shared_size'] = self.shared_size
+
+        return stats
+
+    def __contains__(self, key):
+        return key in self.local_cache
+
+    def __len__(self):
+        return len(self.local_cache)
+
+
+def create_shared_kb_caches(manager):
+    """
+    Create the dictionaries shared between the processes for all query caches of the `GOKBHelper`. They are passed
+    to the `GOKBHelper` of every process.
+
+    # Arguments:
+
+        - ** manager **: a started `multiprocessing.Manager`
+
+    ** return **: dictionary mapping the name of each query cache to its shared dictionary proxy
+    """
+
+    return {cache_name: manager.dict() for cache_name in const.KB_QUERY_CACHE_NAMES}
@@ -0,0 +1,937 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the columnar representation of the Knowledge Base
+"""
+
+from core import constants as const
+from core.dm.kb_fuzzy import GOFuzzyValueIndex
+import cPickle as pickle
+import numpy as np
+import atexit, hashlib, logging, os, shutil, tempfile
+
+# file names of the compact on-disk format of the columns
+KB_META_FILE_NAME = 'meta.p'
+KB_ENTITY_IDS_FILE_NAME = 'entity_ids.npy'
+KB_CODES_FILE_NAME = 'codes.{0}.npy'
+KB_NORMALIZED_CODES_FILE_NAME = 'normalized_codes.{0}.npy'
+KB_POSTINGS_FILE_NAME = 'postings.{0}.npy'
+KB_POSTING_OFFSETS_FILE_NAME = 'posting_offsets.{0}.npy'
+KB_FORMAT_VERSION = 1
+
+# the minimal capacity of the growable row and posting buffers
+KB_MIN_BUFFER_CAPACITY = 16
+
+
+def remove_shared_kb_dir(kb_dir, owner_pid):
+    """
+    Remove the temporary directory of shared columns, at the exit of the process which created it. The forked workers
+    inherit the exit handlers, but they do not own the directory.
+
+    # Arguments:
+
+        - ** kb_dir **: the directory of the shared columns
+        - ** owner_pid **: the id of the process which created the directory
+    """
+
+    if os.getpid() == owner_pid:
+        shutil.rmtree(kb_dir, ignore_errors=True)
+
+
+def append_row(array, value):
+    """
+    Append a row to a row array in amortized constant time. The array is a view of the first rows of a buffer, which
+    is reallocated with twice the capacity when it is full, so every row is copied a constant number of times on
+    average, instead of all rows at every append.
+
+    # Arguments:
+
+        - ** array **: the row array, an array owning its data or a view of the first rows of its buffer
+        - ** value **: the value of the new row
+
+    ** return **: the row array with the new row
+    """
+
+    buffer = array if array.base is None else array.base
+    nb_rows = len(array)
+    if nb_rows == len(buffer):
+        buffer = np.empty(max(2 * nb_rows, KB_MIN_BUFFER_CAPACITY), dtype=array.dtype)
+        buffer[:nb_rows] = array
+
+    buffer[nb_rows] = value
+
+    return buffer[:nb_rows + 1]
+
+
+def insert_position(posting, position):
+    """
+    Insert a position in a growable posting, keeping it sorted. Only the positions after the new one are moved, so
+    appending the position of a new entity costs an amortized constant time.
+
+    # Arguments:
+
+        - ** posting **: the sorted positions, an array owning its data or a view of the first elements of its buffer
+        - ** position **: the position to insert
+
+    ** return **: the posting with the new position
+    """
+
+    buffer = posting if posting.base is None else posting.base
+    size = len(posting)
+    idx = np.searchsorted(posting, position)
+    if size == len(buffer):
+        buffer = np.empty(max(2 * size, KB_MIN_BUFFER_CAPACITY), dtype=posting.dtype)
+        buffer[:idx] = posting[:idx]
+        buffer[idx + 1:size + 1] = posting[idx:]
+    else:
+        buffer[idx + 1:size + 1] = buffer[idx:size]
+
+    buffer[idx] = position
+
+    return buffer[:size + 1]
+
+
+def delete_position(posting, position):
+    """
+    Delete a position from a growable posting, in place. Only the positions after the deleted one are moved.
+
+    # Arguments:
+
+        - ** posting **: the sorted positions, an array owning its data or a view of the first elements of its buffer
+        - ** position **: the position to delete, it must be in the posting
+
+    ** return **: the posting without the position
+    """
+
+    idx = np.searchsorted(posting, position)
+    posting[idx:-1] = posting[idx + 1:]
+
+    return posting[:-1]
+
+
+def normalize_value(value):
+    """
+    Normalize a slot value, such that the matching against the knowledge base is case insensitive.
+
+    # Arguments:
+
+        - ** value **: the value of the slot
+
+    ** return **: the normalized value
+    """
+
+    return str(value).lower()
+
+
+class GOKBColumns(object):
+    """
+    Columnar representation of the knowledge base. Every slot is one column of integer codes, one code per entity,
+    which point into the dictionary of the distinct values of that slot. The entities not having the slot are coded
+    with `KB_MISSING_VALUE_CODE`.
+
+    Two code spaces are kept for every slot. The raw codes point to the values as they are written in the knowledge
+    base and are used to decode the entities. The normalized codes point to the normalized (lowercase) values and
+    are used for the case insensitive matching of the constraints.
+
+    The columns also keep an inverted index of the normalized values. For every slot, the positions of the entities
+    are sorted by their normalized code, such that the (sorted) positions of the entities having a value are one
+    contiguous slice of that array, starting at the offset of the value.
+
+    The columns can be saved in a compact on-disk format: a directory with the value dictionaries in a small pickle
+    file and one `.npy` file per code and posting array. Loading memory-maps these arrays, so several processes
+    loading the same knowledge base share its pages through the OS. Columns built in memory can be made shareable
+    with `share`.
+
+    # Class members:
+
+        - ** entity_ids **: the ids of all entities, the position of the id is the row of the entity in every column
+        - ** slots **: the list of all slots appearing in the knowledge base
+        - ** values **: dictionary mapping each slot to the list of its distinct raw values, indexed by the raw code
+        - ** codes **: dictionary mapping each slot to the array of raw codes of all entities
+        - ** normalized_values **: dictionary mapping each slot to the list of its distinct normalized values, the
+                                   values are interned strings
+        - ** normalized_value_codes **: dictionary mapping each slot to a dictionary from a normalized value to its code
+        - ** raw_value_codes **: dictionary mapping each slot to a dictionary from a raw value to its normalized code,
+                                 such that a constraint written as in the knowledge base is encoded without normalizing
+        - ** normalized_codes **: dictionary mapping each slot to the array of normalized codes of all entities
+        - ** postings **: dictionary mapping each slot to a pair of arrays, the entity positions sorted by normalized
+                          code and the offset of every normalized code in it
+        - ** kb_dir **: the directory of the memory-mapped columns, None for columns held in the memory of the process
+        - ** removed **: boolean array marking the removed entities, None if the knowledge base was never updated.
+                         The rows of the removed entities are kept, such that the other positions do not change
+        - ** writable **: whether the row arrays are in growable buffers of this process (see `append_row`), as
+                          they are since the first update
+        - ** value_postings **: dictionary mapping each updated slot to a dictionary from a normalized code to the
+                                growable posting of the value (see `insert_position`), for the values changed since
+                                the inverted index was built. They replace the postings of the index until they are
+                                merged into it by `save`
+        - ** entity_positions **: dictionary mapping each entity id to its position, built by the first update
+        - ** value_raw_codes **: dictionary mapping each updated slot to a dictionary from a raw value to its raw code
+        - ** fuzzy_indexes **: dictionary mapping each slot to the trigram index of its normalized values, built by the
+                               first approximate lookup of the slot
+    """
+
+    def __init__(self, entity_ids=None, values=None, codes=None, normalized_codes=None, postings=None):
+        """Constructor of the `GOKBColumns` class"""
+        logging.info('Calling `GOKBColumns` constructor')
+
+        self.entity_ids = entity_ids
+        self.slots = sorted(values.keys())
+        self.values = values
+        self.codes = codes
+
+        self.normalized_values = {}
+        self.normalized_value_codes = {}
+        self.raw_value_codes = {}
+        self.normalized_codes = dict(normalized_codes) if normalized_codes else {}
+        self.postings = dict(postings) if postings else {}
+        self.kb_dir = None
+        self.removed = None
+        self.writable = False
+        self.value_postings = {}
+        self.entity_positions = None
+        self.value_raw_codes = {}
+        self.fuzzy_indexes = {}
+        for slot in self.slots:
+            self.__normalize_column(slot)
+            if slot not in self.postings:
+                self.__index_column(slot)
+
+    @classmethod
+    def from_knowledge_dict(cls, knowledge_dict):
+        """
+        Create the columnar representation from a knowledge dictionary of a form {entity_id: {slot: value}}.
+
+        # Arguments:
+
+            - ** knowledge_dict **: the knowledge dictionary
+
+        ** return **: the columnar knowledge base
+        """
+        logging.info('Calling `GOKBColumns` from_knowledge_dict method')
+
+        entity_ids = sorted(knowledge_dict.keys())
+        nb_entities = len(entity_ids)
+
+        values = {}
+        value_codes = {}
+        codes = {}
+        for position, entity_id in enumerate(entity_ids):
+            for slot, value in knowledge_dict[entity_id].items():
+                if slot not in codes:
+                    values[slot] = []
+                    value_codes[slot] = {}
+                    codes[slot] = np.empty(nb_entities, dtype=np.int32)
+                    codes[slot].fill(const.KB_MISSING_VALUE_CODE)
+
+                code = value_codes[slot].get(value)
+                if code is None:
+                    code = len(values[slot])
+                    value_codes[slot][value] = code
+                    values[slot].append(value)
+
+                codes[slot][position] = code
+
+        return cls(entity_ids, values, codes)
+
+    def __normalize_column(self, slot):
+        """
+        Private helper method to build the normalized code space of a slot from its raw code space.
+
+        # Arguments:
+
+            - ** slot **: the slot (column) to normalize
+        """
+
+        normalized_values = []
+        normalized_value_codes = {}
+        raw_value_codes = {}
+        raw_to_normalized = np.empty(len(self.values[slot]) + 1, dtype=np.int32)
+
+        for raw_code, value in enumerate(self.values[slot]):
+            normalized_value = normalize_value(value)
+            code = normalized_value_codes.get(normalized_value)
+            if code is None:
+                code = len(normalized_values)
+                normalized_value = intern(normalized_value)
+                normalized_value_codes[normalized_value] = code
+                normalized_values.append(normalized_value)
+
+            raw_value_codes[value] = code
+            raw_to_normalized[raw_code] = code
+
+        # the last element maps the missing value code (-1) to itself
+        raw_to_normalized[-1] = const.KB_MISSING_VALUE_CODE
+
+        self.normalized_values[slot] = normalized_values
+        self.normalized_value_codes[slot] = normalized_value_codes
+        self.raw_value_codes[slot] = raw_value_codes
+
+        # the normalized column was already loaded from the disk
+        if slot in self.normalized_codes:
+            return
+
+        # when the raw values are already normalized, the two code spaces are the same
+        if np.array_equal(raw_to_normalized[:-1], np.arange(len(self.values[slot]))):
+            self.normalized_codes[slot] = self.codes[slot]
+        else:
+            self.normalized_codes[slot] = raw_to_normalized[self.codes[slot]]
+
+    def __index_column(self, slot):
+        """
+        Private helper method to build the inverted index of a slot from its normalized column.
+
+        # Arguments:
+
+            - ** slot **: the slot (column) to index
+        """
+
+        column = self.normalized_codes[slot]
+
+        # a stable sort keeps the positions having the same code in increasing order
+        order = np.argsort(column, kind='mergesort').astype(np.int32)
+        offsets = np.searchsorted(column[order], np.arange(len(self.normalized_values[slot]) + 1))
+
+        # the entities not having the slot are sorted first, they are not part of any posting
+        self.postings[slot] = (order[offsets[0]:], (offsets - offsets[0]).astype(np.int64))
+
+    @classmethod
+    def load(cls, kb_dir, mmap_mode='r'):
+        """
+        Load the columns saved in the compact on-disk format.
+
+        # Arguments:
+
+            - ** kb_dir **: the directory where the columns are saved
+            - ** mmap_mode **: the memory-map mode of the code arrays, None to read them in memory
+
+        ** return **: the columnar knowledge base
+        """
+        logging.info('Calling `GOKBColumns` load method')
+
+        meta = pickle.load(open(os.path.join(kb_dir, KB_META_FILE_NAME), 'rb'))
+        if meta['version'] != KB_FORMAT_VERSION:
+            raise Exception("Unsupported knowledge base format version: '{0}'".format(meta['version']))
+
+        entity_ids = np.load(os.path.join(kb_dir, KB_ENTITY_IDS_FILE_NAME), mmap_mode=mmap_mode)
+
+        codes = {}
+        normalized_codes = {}
+        postings = {}
+        for idx, slot in enumerate(meta['slots']):
+            codes[slot] = np.load(os.path.join(kb_dir, KB_CODES_FILE_NAME.format(idx)), mmap_mode=mmap_mode)
+            postings[slot] = (np.load(os.path.join(kb_dir, KB_POSTINGS_FILE_NAME.format(idx)), mmap_mode=mmap_mode),
+                              np.load(os.path.join(kb_dir, KB_POSTING_OFFSETS_FILE_NAME.format(idx))))
+
+            if slot in meta['normalized_slots']:
+                normalized_codes[slot] = np.load(os.path.join(kb_dir, KB_NORMALIZED_CODES_FILE_NAME.format(idx)),
+                                                 mmap_mode=mmap_mode)
+            else:
+                normalized_codes[slot] = codes[slot]
+
+        kb_columns = cls(entity_ids, meta['values'], codes, normalized_codes, postings)
+        if meta.get('removed'):
+            kb_columns.removed = np.zeros(len(entity_ids), dtype=np.bool_)
+            kb_columns.removed[meta['removed']] = True
+
+        if mmap_mode is not None:
+            kb_columns.kb_dir = kb_dir
+
+        return kb_columns
+
+    def save(self, kb_dir):
+        """
+        Save the columns in the compact on-disk format, such that they can be memory-mapped by `load`.
+
+        # Arguments:
+
+            - ** kb_dir **: the directory where to save the columns, it is created if it does not exist
+        """
+        logging.info('Calling `GOKBColumns` save method')
+
+        if not os.path.isdir(kb_dir):
+            os.makedirs(kb_dir)
+
+        # the postings of the updated values are merged in the inverted index of their slot
+        for slot in self.value_postings.keys():
+            self.__index_column(slot)
+        self.value_postings = {}
+
+        # the normalized columns are saved only when they differ from the raw ones
+        normalized_slots = [slot for slot in self.slots if self.normalized_codes[slot] is not self.codes[slot]]
+
+        np.save(os.path.join(kb_dir, KB_ENTITY_IDS_FILE_NAME), np.asarray(self.entity_ids))
+        for idx, slot in enumerate(self.slots):
+            np.save(os.path.join(kb_dir, KB_CODES_FILE_NAME.format(idx)), np.asarray(self.codes[slot]))
+            np.save(os.path.join(kb_dir, KB_POSTINGS_FILE_NAME.format(idx)), np.asarray(self.postings[slot][0]))
+            np.save(os.path.join(kb_dir, KB_POSTING_OFFSETS_FILE_NAME.format(idx)), self.postings[slot][1])
+
+            if slot in normalized_slots:
+                np.save(os.path.join(kb_dir, KB_NORMALIZED_CODES_FILE_NAME.format(idx)),
+                        np.asarray(self.normalized_codes[slot]))
+
+        meta = {'version': KB_FORMAT_VERSION, 'slots': self.slots, 'values': self.values,
+                'normalized_slots': normalized_slots,
+                'removed': np.flatnonzero(self.removed).tolist() if self.removed is not None else []}
+        pickle.dump(meta, open(os.path.join(kb_dir, KB_META_FILE_NAME), 'wb'), pickle.HIGHEST_PROTOCOL)
+
+    def share(self, kb_dir=None):
+        """
+        Make the columns shareable between processes. Columns held in memory are saved in the compact format and the
+        arrays are replaced by their memory-mapped versions, so the forked workers and the workers loading the
+        returned directory all share the same pages.
+
+        # Arguments:
+
+            - ** kb_dir **: the directory where to save the columns, owned by the caller. If not given, a new temporary
+                            directory is created, and it is removed when this process exits
+
+        ** return **: the directory of the memory-mapped columns, to be loaded by the workers
+        """
+        logging.info('Calling `GOKBColumns` share method')
+
+        if self.kb_dir is not None:
+            return self.kb_dir
+
+        if kb_dir is None:
+            kb_dir = tempfile.mkdtemp(prefix='go_kb_')
+            atexit.register(remove_shared_kb_dir, kb_dir, os.getpid())
+
+        self.save(kb_dir)
+        shared = GOKBColumns.load(kb_dir)
+
+        self.entity_ids = shared.entity_ids
+        self.codes = shared.codes
+        self.normalized_codes = shared.normalized_codes
+        self.postings = shared.postings
+        self.kb_dir = kb_dir
+        self.writable = False
+
+        return kb_dir
+
+    def content_hash(self):
+        """
+        Compute the hash of the content of the knowledge base, i.e. of the value dictionaries and the raw columns. The
+        same knowledge base has the same hash in every run, no matter how it was loaded.
+
+        ** return **: the hexadecimal SHA-1 digest
+        """
+        logging.info('Calling `GOKBColumns` content_hash method')
+
+        # the pickled values are not canonical (the pickle memo differs), their representation is
+        sha1 = hashlib.sha1()
+        sha1.update(repr(np.asarray(self.entity_ids).tolist()))
+        for slot in self.slots:
+            sha1.update(repr((slot, self.values[slot])))
+            sha1.update(np.ascontiguousarray(self.codes[slot], dtype=np.int32).tobytes())
+
+        if self.removed is not None:
+            sha1.update(np.flatnonzero(self.removed).tobytes())
+
+        return sha1.hexdigest()
+
+    def nb_entities(self):
+        """
+        ** return **: the number of entity rows in the knowledge base, including the rows of the removed entities
+        """
+
+        return len(self.entity_ids)
+
+    def all_positions(self):
+        """
+        ** return **: sorted array of the positions of all entities, without the removed ones
+        """
+
+        if self.removed is None:
+            return np.arange(self.nb_entities(), dtype=np.int32)
+
+        return np.flatnonzero(~self.removed).astype(np.int32)
+
+    def entity_mask(self):
+        """
+        ** return **: boolean array with one element per entity row, False for the removed entities
+        """
+
+        if self.removed is None:
+            return np.ones(self.nb_entities(), dtype=np.bool_)
+
+        return ~self.removed
+
+    def value_code(self, slot, value):
+        """
+        Find the normalized code of a value of a slot. A value written exactly as in the knowledge base is found
+        without normalizing it, every other value is normalized once.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** value **: the value of the slot
+
+        ** return **: the normalized code, or `KB_NO_MATCH_CODE` if no entity has this value
+        """
+
+        if slot not in self.normalized_value_codes:
+            return const.KB_NO_MATCH_CODE
+
+        code = self.raw_value_codes[slot].get(value)
+        if code is not None:
+            return code
+
+        return self.normalized_value_codes[slot].get(normalize_value(value), const.KB_NO_MATCH_CODE)
+
+    def fuzzy_value_code(self, slot, value, threshold):
+        """
+        Find the normalized code of the value of a slot most similar to a (noisy) value, with the trigram index of the
+        slot.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** value **: the value of the slot
+            - ** threshold **: the minimal similarity of the values, between 0 and 1
+
+        ** return **: the normalized code, or `KB_NO_MATCH_CODE` if no value of the slot is similar enough
+        """
+
+        if slot not in self.normalized_values:
+            return const.KB_NO_MATCH_CODE
+
+        if slot not in self.fuzzy_indexes:
+            self.fuzzy_indexes[slot] = GOFuzzyValueIndex(self.normalized_values[slot])
+
+        return self.fuzzy_indexes[slot].lookup(value, threshold)
+
+    def encode_constraints(self, constraints):
+        """
+        Encode the constraints to normalized codes, such that every constraint is normalized only once per query.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and value pairs
+
+        ** return **: dictionary of slot and normalized code pairs
+        """
+
+        return {slot: self.value_code(slot, value) for slot, value in constraints.items()}
+
+    def match_mask(self, slot, code):
+        """
+        Create the boolean mask of the entities having the given value for the slot.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** code **: the normalized code of the value
+
+        ** return **: boolean array with one element per entity
+        """
+
+        if code == const.KB_NO_MATCH_CODE:
+            return np.zeros(self.nb_entities(), dtype=np.bool_)
+
+        return self.normalized_codes[slot] == code
+
+    def posting(self, slot, code):
+        """
+        Find the positions of the entities having the given value for the slot, using the inverted index.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** code **: the normalized code of the value
+
+        ** return **: sorted array of the positions of the matching entities
+        """
+
+        if code == const.KB_NO_MATCH_CODE:
+            return np.zeros(0, dtype=np.int32)
+
+        if slot in self.value_postings and code in self.value_postings[slot]:
+            return self.value_postings[slot][code]
+
+        positions, offsets = self.postings[slot]
+        return positions[offsets[code]:offsets[code + 1]]
+
+    def filter_positions(self, positions, slot, code):
+        """
+        Keep only the positions of the entities having the given value for the slot.
+
+        # Arguments:
+
+            - ** positions **: array of positions of the candidate entities
+            - ** slot **: the slot
+            - ** code **: the normalized code of the value
+
+        ** return **: array of positions of the matching entities, in the same order
+        """
+
+        if code == const.KB_NO_MATCH_CODE:
+            return positions[:0]
+
+        return positions[self.normalized_codes[slot][positions] == code]
+
+    def value_histogram(self, slot, positions):
+        """
+        Count the raw values of the slot among the given entities, with a vectorized `bincount` over the codes.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** positions **: array of positions of the entities
+
+        ** return **: the raw codes present among the entities and the count of every code
+        """
+
+        if slot not in self.codes or len(positions) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+
+        slot_codes = self.codes[slot][positions]
+        counts = np.bincount(slot_codes[slot_codes != const.KB_MISSING_VALUE_CODE])
+
+        present_codes = np.flatnonzero(counts).astype(np.int32)
+        return present_codes, counts[present_codes]
+
+    def top_values(self, slot, histogram, k=None):
+        """
+        Find the most frequent raw values of the slot in a histogram. The top k codes are selected with
+        `argpartition`, and only they are sorted. The ties are broken by the code, i.e. by the order of appearance in
+        the knowledge base.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** histogram **: the raw codes and their counts, as returned by `value_histogram`
+            - ** k **: the number of values to return, None for all of them
+
+        ** return **: list of the most frequent values, from the most to the least frequent
+        """
+
+        present_codes, counts = histogram
+        if len(counts) == 0:
+            return []
+
+        if k is not None and k < len(counts):
+            top = np.argpartition(-counts, k - 1)[:k]
+        else:
+            top = np.arange(len(counts))
+
+        # sort by decreasing count, then by increasing code
+        top = top[np.lexsort((present_codes[top], -counts[top]))]
+
+        slot_values = self.values[slot]
+        return [slot_values[code] for code in present_codes[top]]
+
+    def entity_ids_at(self, positions):
+        """
+        Find the ids of the entities at the given positions.
+
+        # Arguments:
+
+            - ** positions **: array of positions (rows) of the entities
+
+        ** return **: list of the ids of the entities
+        """
+
+        if isinstance(self.entity_ids, np.ndarray):
+            return self.entity_ids[positions].tolist()
+
+        return [self.entity_ids[position] for position in positions]
+
+    def entities_at(self, positions):
+        """
+        Decode the entities at the given positions. The codes are gathered one column at a time, which is much faster
+        than decoding the entities one by one.
+
+        # Arguments:
+
+            - ** positions **: array of positions (rows) of the entities
+
+        ** return **: list of dictionaries of a form {slot: value}
+        """
+
+        entities = [{} for _ in xrange(len(positions))]
+        for slot in self.slots:
+            slot_values = self.values[slot]
+            for entity, code in zip(entities, self.codes[slot][positions].tolist()):
+                if code != const.KB_MISSING_VALUE_CODE:
+                    entity[slot] = slot_values[code]
+
+        return entities
+
+    def entity(self, position):
+        """
+        Decode the entity at the given position to a dictionary of its slots and raw values.
+
+        # Arguments:
+
+            - ** position **: the position (row) of the entity
+
+        ** return **: dictionary of a form {slot: value}
+        """
+
+        entity = {}
+        for slot in self.slots:
+            code = self.codes[slot][position]
+            if code != const.KB_MISSING_VALUE_CODE:
+                entity[slot] = self.values[slot][code]
+
+        return entity
+
+    def position(self, entity_id):
+        """
+        Find the position of an entity.
+
+        # Arguments:
+
+            - ** entity_id **: the id of the entity
+
+        ** return **: the position (row) of the entity, None if there is no such entity
+        """
+
+        if self.entity_positions is None:
+            entity_ids = self.entity_ids_at(np.arange(self.nb_entities()))
+            self.entity_positions = {entity_id: position for position, entity_id in enumerate(entity_ids)
+                                     if self.removed is None or not self.removed[position]}
+
+        return self.entity_positions.get(entity_id)
+
+    def entity_pairs(self, position):
+        """
+        Find the (slot, normalized code) pairs of an entity, i.e. all constraints the entity matches.
+
+        # Arguments:
+
+            - ** position **: the position (row) of the entity
+
+        ** return **: frozen set of slot and normalized code pairs
+        """
+
+        return frozenset((slot, int(self.normalized_codes[slot][position])) for slot in self.slots
+                         if self.normalized_codes[slot][position] != const.KB_MISSING_VALUE_CODE)
+
+    def __make_writable(self):
+        """
+        Private helper method to copy the row arrays to the memory of the process before the first update, such that
+        the shared knowledge base files are never written, and the rows can be appended to them (see `append_row`).
+        The normalized columns sharing the array of the raw columns get their own array, since an update can add a
+        value which is not normalized. The postings are never written, the ones of the changed values are copied by
+        `__value_posting`.
+        """
+
+        if self.writable:
+            return
+
+        if self.removed is None:
+            self.removed = np.zeros(self.nb_entities(), dtype=np.bool_)
+        else:
+            self.removed = np.array(self.removed)
+
+        if isinstance(self.entity_ids, np.ndarray):
+            self.entity_ids = np.array(self.entity_ids)
+        for slot in self.slots:
+            self.codes[slot] = np.array(self.codes[slot])
+            self.normalized_codes[slot] = np.array(self.normalized_codes[slot])
+
+        self.kb_dir = None
+        self.writable = True
+
+    def __value_posting(self, slot, code):
+        """
+        Private helper method to get the growable posting of a value, copying its posting from the inverted index the
+        first time the value changes.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** code **: the normalized code of the value
+
+        ** return **: the sorted positions of the entities having the value
+        """
+
+        value_postings = self.value_postings.setdefault(slot, {})
+        if code not in value_postings:
+            positions, offsets = self.postings[slot]
+            value_postings[code] = np.array(positions[offsets[code]:offsets[code + 1]])
+
+        return value_postings[code]
+
+    def __add_slot(self, slot):
+        """
+        Private helper method to add an empty column for a slot appearing for the first time.
+
+        # Arguments:
+
+            - ** slot **: the new slot
+        """
+
+        self.slots = sorted(self.slots + [slot])
+        self.values[slot] = []
+        self.codes[slot] = np.empty(self.nb_entities(), dtype=np.int32)
+        self.codes[slot].fill(const.KB_MISSING_VALUE_CODE)
+        self.normalized_codes[slot] = self.codes[slot].copy()
+
+        self.__normalize_column(slot)
+        self.__index_column(slot)
+
+    def __encode_value(self, slot, value):
+        """
+        Private helper method to find the raw and the normalized code of a value, adding the value to the dictionaries
+        of the slot if it is new.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** value **: the raw value
+
+        ** return **: the raw code and the normalized code
+        """
+
+        if slot not in self.values:
+            self.__add_slot(slot)
+
+        if slot not in self.value_raw_codes:
+            self.value_raw_codes[slot] = {value: code for code, value in enumerate(self.values[slot])}
+
+        raw_code = self.value_raw_codes[slot].get(value)
+        if raw_code is not None:
+            return raw_code, self.raw_value_codes[slot][value]
+
+        raw_code = len(self.values[slot])
+        self.values[slot].append(value)
+        self.value_raw_codes[slot][value] = raw_code
+
+        normalized_value = normalize_value(value)
+        normalized_code = self.normalized_value_codes[slot].get(normalized_value)
+        if normalized_code is None:
+            normalized_code = len(self.normalized_values[slot])
+            normalized_value = intern(normalized_value)
+            self.normalized_value_codes[slot][normalized_value] = normalized_code
+            self.normalized_values[slot].append(normalized_value)
+            self.fuzzy_indexes.pop(slot, None)
+
+            # a new (empty) posting, which is not in the inverted index
+            self.value_postings.setdefault(slot, {})[normalized_code] = np.zeros(0, dtype=np.int32)
+
+        self.raw_value_codes[slot][value] = normalized_code
+
+        return raw_code, normalized_code
+
+    def __set_code(self, slot, position, raw_code, normalized_code):
+        """
+        Private helper method to set the value of a slot of an entity, keeping the postings of the old and the new
+        value sorted. The cost is proportional to the lengths of these two postings, not to the size of the knowledge
+        base.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** position **: the position (row) of the entity
+            - ** raw_code **: the new raw code, `KB_MISSING_VALUE_CODE` for removing the value
+            - ** normalized_code **: the new normalized code
+        """
+
+        old_code = self.normalized_codes[slot][position]
+        if old_code != const.KB_MISSING_VALUE_CODE:
+            self.value_postings[slot][old_code] = delete_position(self.__value_posting(slot, old_code), position)
+
+        if normalized_code != const.KB_MISSING_VALUE_CODE:
+            self.value_postings[slot][normalized_code] = insert_position(self.__value_posting(slot, normalized_code),
+                                                                         position)
+
+        self.codes[slot][position] = raw_code
+        self.normalized_codes[slot][position] = normalized_code
+
+    def add_entity(self, entity_id, entity):
+        """
+        Add a new entity as the last row of the columns. The row is appended to the growable buffers of the columns,
+        and its position to the postings of its values, the other postings are not changed.
+
+        # Arguments:
+
+            - ** entity_id **: the id of the new entity
+            - ** entity **: dictionary of a form {slot: value}
+
+        ** return **: the position of the new entity
+        """
+        logging.info('Calling `GOKBColumns` add_entity method')
+
+        if self.position(entity_id) is not None:
+            raise Exception("The entity '{0}' is already in the knowledge base".format(entity_id))
+
+        self.__make_writable()
+
+        # the ids which do not fit in the array of the ids, as a string id among integer ids, are kept in a list
+        position = self.nb_entities()
+        if not isinstance(self.entity_ids, np.ndarray):
+            self.entity_ids.append(entity_id)
+        elif np.can_cast(np.asarray(entity_id).dtype, self.entity_ids.dtype, casting='safe'):
+            self.entity_ids = append_row(self.entity_ids, entity_id)
+        else:
+            self.entity_ids = self.entity_ids.tolist() + [entity_id]
+
+        self.removed = append_row(self.removed, False)
+        for slot in self.slots:
+            self.codes[slot] = append_row(self.codes[slot], const.KB_MISSING_VALUE_CODE)
+            self.normalized_codes[slot] = append_row(self.normalized_codes[slot], const.KB_MISSING_VALUE_CODE)
+
+        self.entity_positions[entity_id] = position
+        self.update_entity(position, entity)
+
+        return position
+
+    def update_entity(self, position, entity):
+        """
+        Replace the values of an entity. Only the postings of the changed values are updated.
+
+        # Arguments:
+
+            - ** position **: the position (row) of the entity
+            - ** entity **: dictionary of a form {slot: value}, the slots not in it are removed from the entity
+        """
+        logging.info('Calling `GOKBColumns` update_entity method')
+
+        self.__make_writable()
+
+        for slot, value in entity.items():
+            raw_code, normalized_code = self.__encode_value(slot, value)
+            if self.codes[slot][position] != raw_code:
+                self.__set_code(slot, position, raw_code, normalized_code)
+
+        for slot in self.slots:
+            if slot not in entity and self.codes[slot][position] != const.KB_MISSING_VALUE_CODE:
+                self.__set_code(slot, position, const.KB_MISSING_VALUE_CODE, const.KB_MISSING_VALUE_CODE)
+
+    def remove_entity(self, position):
+        """
+        Remove an entity. Its row is kept, but it is removed from all postings and it does not match any query.
+
+        # Arguments:
+
+            - ** position **: the position (row) of the entity
+        """
+        logging.info('Calling `GOKBColumns` remove_entity method')
+
+        self.update_entity(position, {})
+        self.removed[position] = True
+        if self.entity_positions is not None:
+            self.entity_positions.pop(self.entity_ids_at([position])[0], None)
+
+
+def convert_pickle_kb(knowledge_dict_path, kb_dir):
+    """
+    Convert a pickled knowledge dictionary of a form {entity_id: {slot: value}} to the compact on-disk format.
+
+    # Arguments:
+
+        - ** knowledge_dict_path **: the path to the pickled knowledge dictionary
+        - ** kb_dir **: the directory where to save the columns
+
+    ** return **: the columnar knowledge base
+    """
+    logging.info('Calling convert_pickle_kb method')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_columns = GOKBColumns.from_knowledge_dict(knowledge_dict)
+    kb_columns.save(kb_dir)
+
+    return kb_columns
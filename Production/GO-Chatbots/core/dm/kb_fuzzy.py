@@ -0,0 +1,149 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the approximate matching of the slot values against the Knowledge Base values
+"""
+
+from core import constants as const
+from core.dm.kb_cache import GOLRUCache
+import numpy as np
+import logging, re
+
+# every run of characters which are neither letters nor digits is a word separator
+FUZZY_SEPARATORS = re.compile(r'[^a-z0-9]+')
+# the posting of a trigram which no value has
+EMPTY_POSTING = np.zeros(0, dtype=np.int32)
+
+
+def fuzzy_normalize_value(value):
+    """
+    Normalize a slot value for the approximate matching: the value is lowercased, and the punctuation and the
+    repeated whitespaces are replaced by one space.
+
+    # Arguments:
+
+        - ** value **: the value of the slot
+
+    ** return **: the normalized value
+    """
+
+    return FUZZY_SEPARATORS.sub(' ', str(value).lower()).strip()
+
+
+def value_trigrams(value):
+    """
+    Split a value in the set of its character trigrams. The value is padded with one space on each side, such that
+    the first and the last characters of short values also have their trigrams.
+
+    # Arguments:
+
+        - ** value **: the value, normalized with `fuzzy_normalize_value`
+
+    ** return **: the set of trigrams, empty for an empty value
+    """
+
+    if not value:
+        return set()
+
+    padded_value = ' {0} '.format(value)
+    return set(padded_value[idx:idx + 3] for idx in xrange(len(padded_value) - 2))
+
+
+class GOFuzzyValueIndex(object):
+    """
+    Trigram index of the distinct values of one slot, for finding the knowledge base value closest to a noisy value,
+    as the values produced by the NLU. The postings of every trigram are the sorted codes of the values having it,
+    so a lookup only examines the values in the (shortest) postings of the trigrams of the noisy value, and never
+    compares it against every distinct value. The similarity is the Jaccard index of the trigram sets.
+
+    # Class members:
+
+        - ** nb_values **: the number of indexed values
+        - ** nb_trigrams **: array of the number of distinct trigrams of every value
+        - ** postings **: dictionary mapping each trigram to the sorted array of the codes of the values having it
+        - ** cached_lookups **: size-bounded LRU cache of the looked up values and their codes
+    """
+
+    def __init__(self, values, cache_size=const.DEFAULT_KB_CACHE_SIZE):
+        """
+        Constructor of the `GOFuzzyValueIndex` class.
+
+        # Arguments:
+
+            - ** values **: list of the values, the position of a value is its code
+            - ** cache_size **: the capacity of the lookup cache
+        """
+        logging.info('Calling `GOFuzzyValueIndex` constructor')
+
+        self.nb_values = len(values)
+        self.nb_trigrams = np.zeros(self.nb_values, dtype=np.int32)
+
+        postings = {}
+        for code, value in enumerate(values):
+            trigrams = value_trigrams(fuzzy_normalize_value(value))
+            self.nb_trigrams[code] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(code)
+
+        self.postings = {trigram: np.array(codes, dtype=np.int32) for trigram, codes in postings.items()}
+        self.cached_lookups = GOLRUCache(cache_size)
+
+    def lookup(self, value, threshold):
+        """
+        Find the code of the indexed value most similar to a value. The ties are broken by the code.
+
+        # Arguments:
+
+            - ** value **: the (noisy) value
+            - ** threshold **: the minimal Jaccard similarity of the trigrams of the two values, between 0 and 1
+
+        ** return **: the code of the most similar value, or `KB_NO_MATCH_CODE` if no value is similar enough
+        """
+
+        cache_key = (value, threshold)
+        code = self.cached_lookups.get(cache_key)
+        if code is None:
+            code = self.__lookup(value, threshold)
+            self.cached_lookups.put(cache_key, code)
+
+        return code
+
+    def __lookup(self, value, threshold):
+        """
+        Private helper method to find the code of the most similar value, without the cache. A value with a Jaccard
+        similarity of at least the threshold shares at least `ceil(threshold * nb_trigrams)` trigrams with the noisy
+        value, so it is in one of the shortest postings, all but that number minus one. Only the values of these
+        postings with a similar number of trigrams are candidates, and their shared trigrams are counted with a
+        binary search in every posting.
+        """
+
+        trigrams = value_trigrams(fuzzy_normalize_value(value))
+        trigram_postings = sorted((self.postings.get(trigram, EMPTY_POSTING) for trigram in trigrams), key=len)
+
+        min_nb_shared = max(1, int(np.ceil(threshold * len(trigrams) - 1e-9)))
+        if len(trigram_postings) < min_nb_shared:
+            return const.KB_NO_MATCH_CODE
+
+        candidate_codes = np.unique(np.concatenate(trigram_postings[:len(trigram_postings) - min_nb_shared + 1]))
+
+        # the similarity is at most the ratio of the numbers of trigrams of the two values
+        candidate_nb_trigrams = self.nb_trigrams[candidate_codes]
+        candidate_codes = candidate_codes[(candidate_nb_trigrams >= threshold * len(trigrams)) &
+                                          (threshold * candidate_nb_trigrams <= len(trigrams))]
+        if len(candidate_codes) == 0:
+            return const.KB_NO_MATCH_CODE
+
+        # the number of shared trigrams of every candidate value
+        nb_shared = np.zeros(len(candidate_codes), dtype=np.int32)
+        for posting in trigram_postings:
+            if len(posting) > 0:
+                idx = np.minimum(np.searchsorted(posting, candidate_codes), len(posting) - 1)
+                nb_shared += posting[idx] == candidate_codes
+
+        similarity = nb_shared / (self.nb_trigrams[candidate_codes] + len(trigrams) - nb_shared).astype(np.float64)
+
+        best = np.argmax(similarity)
+        if similarity[best] < threshold:
+            return const.KB_NO_MATCH_CODE
+
+        return int(candidate_codes[best])
@@ -4,9 +4,11 @@ Author: Vladimir Ilievski <ilievski.vladimir@live.com>
 A Python file for the helper Knowledge Base class
 """
 
-from collections import defaultdict
 from core import constants as const
-import logging
+from core.dm.kb_columns import GOKBColumns
+from core.dm.kb_cache import GOLRUCache, GOSharedKBCache
+import numpy as np
+import hashlib, itertools, logging, multiprocessing, os
 import cPickle as pickle
 import pprint
 
@@ -20,13 +22,29 @@ class GOKBHelper(object):
         - ** ultimate_request_slot **: the slot that is the actual goal of the user, and everything is around this slot.
         - ** special_slots **: list of special slots to check, if any
         - ** filter_slots **: the list of slots to filter out
-        - ** knowledge_dict **: the dictionary to help query the knowledge base
-        - ** cached_kb **:
-        - ** cached_kb_slot **:
+        - ** knowledge_dict **: the dictionary to help query the knowledge base, None when the helper runs only on
+                                top of the kb columns
+        - ** kb_columns **: the columnar representation of the knowledge base, one integer-coded column per slot and
+                            an inverted index mapping each (slot, normalized value) pair to the sorted positions of
+                            the entities having that value
+        - ** shared_caches **: optional dictionaries shared between processes (see `create_shared_kb_caches`), when
+                               given, every query cache is backed by its shared dictionary, and the knowledge base
+                               cannot be updated
+        - ** fuzzy_threshold **: the minimal similarity for matching a value not in the knowledge base to the most
+                                 similar value of its slot, None for matching only the exact (case insensitive) values
+        - ** cached_kb **: size-bounded LRU cache of the positions of the entities matching a query
+        - ** cached_kb_slot **: size-bounded LRU cache of the count statistics of a query
+        - ** cached_kb_histogram **: size-bounded LRU cache of the value histograms of a slot among the entities
+                                     matching a query, kept alongside the cached entities
+        - ** query_stats **: statistics of the entity queries, including the number of entities examined
+        - ** nb_entity_updates **: the number of entities added, updated or removed since the helper was created, the
+                                   results computed before an update may be stale
     
     """
 
-    def __init__(self, ultimate_request_slot = None, special_slots = None, filter_slots = None, knowledge_dict = None):
+    def __init__(self, ultimate_request_slot = None, special_slots = None, filter_slots = None, knowledge_dict = None,
+                 cache_size = const.DEFAULT_KB_CACHE_SIZE, kb_columns = None, shared_caches = None,
+                 fuzzy_threshold = None):
         """Constructor of the `GOKBHelper` class"""
         logging.info('Calling `GOKBHelper` constructor ')
         self.pp = pprint.PrettyPrinter(indent=4)
@@ -37,10 +55,307 @@ class GOKBHelper(object):
 
         # load the knowledge dictionary
         self.knowledge_dict = knowledge_dict
-        logging.debug("Knowledge dictionary: '{0}'".format(self.pp.pformat(self.knowledge_dict)))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Knowledge dictionary: '{0}'".format(self.pp.pformat(self.knowledge_dict)))
 
-        self.cached_kb = defaultdict(list)
-        self.cached_kb_slot = defaultdict(list)
+        # build the columns and the inverted index once (if not given), all queries are answered from them
+        self.kb_columns = self._create_kb_columns(knowledge_dict, kb_columns)
+
+        self.fuzzy_threshold = fuzzy_threshold
+        self.shared_caches = shared_caches
+        self.cached_kb = self._create_cache('cached_kb', cache_size)
+        self.cached_kb_slot = self._create_cache('cached_kb_slot', cache_size)
+        self.cached_kb_histogram = self._create_cache('cached_kb_histogram', cache_size)
+
+        self.query_stats = {'queries': 0, 'refined_queries': 0, 'entities_examined': 0,
+                            'last_entities_examined': 0}
+        self.nb_entity_updates = 0
+
+    def _create_kb_columns(self, knowledge_dict, kb_columns):
+        """
+        Protected helper method to get the columns the queries are answered from. The backends answering the queries
+        from other structures override it.
+
+        # Arguments:
+
+            - ** knowledge_dict **: the knowledge dictionary, the columns are built from it if not given
+            - ** kb_columns **: the columnar knowledge base, if already built
+
+        ** return **: the columnar knowledge base
+        """
+
+        return kb_columns if kb_columns is not None else GOKBColumns.from_knowledge_dict(knowledge_dict)
+
+    def _create_cache(self, cache_name, cache_size):
+        """
+        Protected helper method to create a query cache, local to the process or backed by a shared dictionary.
+
+        # Arguments:
+
+            - ** cache_name **: the name of the cache in the shared caches
+            - ** cache_size **: the capacity of the cache of this process
+
+        ** return **: the newly created cache
+        """
+
+        if self.shared_caches is None:
+            return GOLRUCache(cache_size)
+
+        return GOSharedKBCache(cache_size, self.shared_caches[cache_name], cache_size)
+
+    def value_code(self, slot, value):
+        """
+        Find the normalized code of a value of a slot. With a fuzzy threshold, a value which is not in the knowledge
+        base, as a noisy value of the NLU, is resolved to the most similar value of the slot.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** value **: the value of the slot
+
+        ** return **: the normalized code, or `KB_NO_MATCH_CODE` for an unknown slot or value
+        """
+
+        code = self.kb_columns.value_code(slot, value)
+        if code == const.KB_NO_MATCH_CODE and self.fuzzy_threshold is not None:
+            code = self.kb_columns.fuzzy_value_code(slot, value, self.fuzzy_threshold)
+
+        return code
+
+    def canonical_constraints(self, inform_slots, excluded_slots):
+        """
+        Bring the constraints to their canonical form, which is shared by all queries: the excluded slots and the
+        slots the user does not care about are dropped, and the values are encoded to normalized codes, such that
+        the values differing only in the case are the same constraint, and every unknown slot or value is the
+        `KB_NO_MATCH_CODE`.
+
+        # Arguments:
+
+            - ** inform_slots **: dictionary of slot and value pairs
+            - ** excluded_slots **: the slots which are not constraints of the query
+
+        ** return **: dictionary of slot and normalized code pairs
+        """
+
+        return {slot: self.value_code(slot, value) for slot, value in inform_slots.items()
+                if slot not in excluded_slots and value != const.I_DO_NOT_CARE}
+
+    def canonical_query_key(self, constraints):
+        """
+        Create the cache key of the entities matching the canonical constraints. All constraints not matching any
+        entity have the same key.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs
+
+        ** return **: the cache key
+        """
+
+        if const.KB_NO_MATCH_CODE in constraints.values():
+            return const.KB_NO_MATCH_QUERY_KEY
+
+        return frozenset(constraints.items())
+
+    def __match_constraints(self, constraints):
+        """
+        Private helper method to find the positions of the entities matching all of the constraints. The postings of
+        the constraints are intersected starting from the shortest one, so the cost is proportional to the size of
+        the shortest posting and not to the size of the knowledge base.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs, every entity must match all of them
+
+        ** return **: sorted array of positions of the matching entities and the number of entities examined
+        """
+
+        if len(constraints) == 0:
+            positions = self.kb_columns.all_positions()
+            return positions, len(positions)
+
+        postings = [self.kb_columns.posting(slot, code) for slot, code in constraints.items()]
+        postings.sort(key=len)
+
+        positions = postings[0]
+        nb_examined = len(positions)
+        for posting in postings[1:]:
+            if len(positions) == 0:
+                break
+
+            # binary search the current candidates in the (longer) posting
+            idx = np.searchsorted(posting, positions)
+            idx[idx == len(posting)] = 0
+            positions = positions[posting[idx] == positions]
+            nb_examined += len(idx)
+
+        return positions, nb_examined
+
+    def __refine_cached_subset(self, constraints):
+        """
+        Private helper method to answer a query by refining the cached result of the largest already seen subset of
+        the constraints. Since the dialogue adds about one constraint per turn, the result of the previous turn is
+        usually cached, and only its (few) entities are filtered by the new constraints.
+
+        At most `KB_MAX_SUBSET_PROBES` subsets are probed, from the largest to the smallest one.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs, every entity must match all of them
+
+        ** return **: sorted array of positions of the matching entities and the number of entities examined, or
+                      None if no subset of the constraints is cached
+        """
+
+        items = constraints.items()
+        nb_probes = 0
+        for subset_size in xrange(len(items) - 1, 0, -1):
+            for subset in itertools.combinations(items, subset_size):
+                nb_probes += 1
+                if nb_probes > const.KB_MAX_SUBSET_PROBES:
+                    return None
+
+                positions = self.cached_kb.peek(self.canonical_query_key(dict(subset)))
+                if positions is None:
+                    continue
+
+                # filter the candidates only by the constraints not in the subset
+                nb_examined = 0
+                for slot, code in set(items) - set(subset):
+                    if len(positions) == 0:
+                        break
+
+                    nb_examined += len(positions)
+                    positions = self.kb_columns.filter_positions(positions, slot, code)
+
+                return positions, nb_examined
+
+        return None
+
+    def _query(self, current_slots):
+        """
+        Protected helper method to answer the query of the current constraints. The other backends override it, and
+        the methods taking its result (`_has_results`, `_results` and `_slot_values`), with their own form of the
+        matching entities.
+
+        Here, the positions of the matching entities are found either from the cache or by querying the columns.
+
+        # Arguments:
+
+            - ** current_slots **: record of filled slots in the dialogue so far
+
+        ** return **: the cache key of the query and the sorted array of positions of the matching entities
+        """
+
+        # take only the constraints, in their canonical form, the query is answered only in terms of normalized codes
+        constraints = self.canonical_constraints(current_slots[const.INFORM_SLOTS_KEY], self.filter_slots)
+
+        return self.__constraint_positions(constraints)
+
+    def __constraint_positions(self, constraints):
+        """
+        Private helper method to find the positions of the entities matching the canonical constraints, either from
+        the cache or by querying the columns.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs, every entity must match all of them
+
+        ** return **: the cache key of the query and the sorted array of positions of the matching entities
+        """
+
+        # for the given query index set, are there any cached results
+        query_idx_keys = self.canonical_query_key(constraints)
+        positions = self.cached_kb.get(query_idx_keys)
+
+        # if not, refine the result of a cached subset of the constraints, or intersect the postings of the
+        # constraints from the inverted index, and cache the positions
+        if positions is None:
+            refined = self.__refine_cached_subset(constraints)
+            if refined is not None:
+                positions, nb_examined = refined
+                self.query_stats['refined_queries'] += 1
+            else:
+                positions, nb_examined = self.__match_constraints(constraints)
+
+            self.query_stats['queries'] += 1
+            self.query_stats['entities_examined'] += nb_examined
+            self.query_stats['last_entities_examined'] = nb_examined
+            self.cached_kb.put(query_idx_keys, positions)
+
+        return query_idx_keys, positions
+
+    def __slot_value_histogram(self, query_key, positions, slot):
+        """
+        Private helper method to get the histogram of the values of a slot among the entities matching a query, either
+        from the cache or by counting the codes of the entities.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** positions **: the positions of the entities matching the query
+            - ** slot **: the slot
+
+        ** return **: the raw codes present among the entities and the count of every code
+        """
+
+        histogram_key = (query_key, slot)
+        histogram = self.cached_kb_histogram.get(histogram_key)
+
+        if histogram is None:
+            histogram = self.kb_columns.value_histogram(slot, positions)
+            self.cached_kb_histogram.put(histogram_key, histogram)
+
+        return histogram
+
+    def _has_results(self, query_key, positions):
+        """
+        Protected helper method to check whether any entity matches a query.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** positions **: the positions of the entities matching the query, as found by `_query`
+
+        ** return **: True if there is at least one matching entity
+        """
+
+        return len(positions) > 0
+
+    def _slot_values(self, query_key, positions, slot, nb_values=None):
+        """
+        Protected helper method to find the most frequent values of a slot among the entities matching a query.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** positions **: the positions of the entities matching the query, as found by `_query`
+            - ** slot **: the slot
+            - ** nb_values **: the number of values, None for all of them
+
+        ** return **: list of the values, from the most to the least frequent one
+        """
+
+        return self.kb_columns.top_values(slot, self.__slot_value_histogram(query_key, positions, slot), nb_values)
+
+    def _results(self, query_key, positions):
+        """
+        Protected helper method to convert the positions of the entities to a dictionary of a form {entity_id: entity}.
+        Without a knowledge dictionary, the entities are decoded from the kb columns.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** positions **: the positions of the entities matching the query, as found by `_query`
+
+        ** return **: dictionary of the entities
+        """
+
+        entity_ids = self.kb_columns.entity_ids_at(positions)
+        if self.knowledge_dict is not None:
+            return {id: self.knowledge_dict[id] for id in entity_ids}
+
+        return dict(zip(entity_ids, self.kb_columns.entities_at(positions)))
 
     def fill_inform_slots(self, inform_slots_to_be_filled, current_slots):
         """
@@ -54,11 +369,12 @@ class GOKBHelper(object):
         ** return **: a dictionary of filled slots
         """
         logging.info('Calling `GOKBHelper` fill_inform_slots method')
-        logging.debug("Inform slots to be  filled: '{0}'".format(self.pp.pformat(inform_slots_to_be_filled)))
-        logging.debug("Current slots '{0}'".format(self.pp.pformat(current_slots)))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Inform slots to be  filled: '{0}'".format(self.pp.pformat(inform_slots_to_be_filled)))
+            logging.debug("Current slots '{0}'".format(self.pp.pformat(current_slots)))
 
         # Get the available entities based on the history
-        kb_results = self.available_results_from_kb(current_slots)
+        query_key, positions = self._query(current_slots)
         filled_in_slots = {}
 
         # this happens in the end
@@ -81,53 +397,26 @@ class GOKBHelper(object):
 
             # if the slot is the ultimate one or the one indicating the task is completed
             if slot == self.ultimate_request_slot or slot == const.TASK_COMPLETE_SLOT:
-                filled_in_slots[slot] = const.TICKET_AVAILABLE if len(kb_results) > 0 else const.NO_VALUE_MATCH
+                available = self._has_results(query_key, positions)
+                filled_in_slots[slot] = const.TICKET_AVAILABLE if available else const.NO_VALUE_MATCH
                 continue
 
             # how can I interpret this shit?
             if slot == 'closing': continue
 
             # Take the slot with the highest count and fill it
-            values_dict = self.available_slot_values(slot, kb_results)
-            values_counts = [(v, values_dict[v]) for v in values_dict.keys()]
+            top_values = self._slot_values(query_key, positions, slot, 1)
 
             # if there are any results
-            if len(values_counts) > 0:
-                filled_in_slots[slot] = sorted(values_counts, key=lambda x: -x[1])[0][0]
+            if len(top_values) > 0:
+                filled_in_slots[slot] = top_values[0]
             else:
                 filled_in_slots[slot] = const.NO_VALUE_MATCH
 
-        logging.debug("Filled in slots '{0}'".format(self.pp.pformat(filled_in_slots)))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Filled in slots '{0}'".format(self.pp.pformat(filled_in_slots)))
         return filled_in_slots
 
-    def available_slot_values(self, slot, kb_results):
-        """
-        Return the set of values available for the slot based on the current constraints
-        
-        # Arguments:
-            
-            - ** slot **: 
-            - ** kb_results **: the results from the KB
-             
-        ** return **: 
-        """
-        logging.info('Calling `GOKBHelper` available_slot_values method')
-        slot_values = {}
-
-        # iterate over the kb results
-        for entity_id in kb_results.keys():
-
-            # count
-            if slot in kb_results[entity_id].keys():
-                slot_val = kb_results[entity_id][slot]
-
-                if slot_val in slot_values.keys():
-                    slot_values[slot_val] += 1
-                else:
-                    slot_values[slot_val] = 1
-
-        return slot_values
-
     def available_results_from_kb(self, current_slots):
         """
         Return the available entities in the knowledge base, based on the current constraints.
@@ -141,109 +430,407 @@ class GOKBHelper(object):
         """
         logging.info('Calling `GOKBHelper` available_results_from_kb method')
 
-        # the resulting list of the available entities
-        result = []
+        query_key, positions = self._query(current_slots)
 
-        # take only the constraints
-        current_slots = current_slots[const.INFORM_SLOTS_KEY]
-        constrain_keys = current_slots.keys()
+        # convert to dictionary
+        return self._results(query_key, positions)
 
-        # filter out the slots
-        constrain_keys = filter(lambda k: k not in self.filter_slots, constrain_keys)
-        constrain_keys = [k for k in constrain_keys if current_slots[k] != const.I_DO_NOT_CARE]
+    def available_results_from_kb_for_slots(self, inform_slots):
+        """
+        Return the count statistics for each constraint in inform_slots
+        
+        # Arguments:
+        
+            - ** inform_slots **: 
+            
+        ** return **:
+        """
+        logging.info('Calling `GOKBHelper` available_results_from_kb_for_slots method')
 
-        # for the given query index set, are there any cached results
-        query_idx_keys = frozenset(current_slots.items())
-        cached_kb_ret = self.cached_kb[query_idx_keys]
+        # the ultimate request slot and the slots the user does not care about are not counted
+        constraints = self.canonical_constraints(inform_slots, [self.ultimate_request_slot])
+
+        # load cached results, the counts of the canonical constraints are cached
+        query_idx_keys = frozenset(constraints.items())
+        constraint_counts = self.cached_kb_slot.get(query_idx_keys)
+
+        if constraint_counts is None:
+            constraint_counts = self._constraint_counts(constraints)
+            self.cached_kb_slot.put(query_idx_keys, constraint_counts)
+
+        # expand the counts to all of the given slots
+        kb_results = {key: 0 for key in inform_slots.keys()}
+        kb_results.update(constraint_counts)
 
-        cached_kb_length = len(cached_kb_ret) if cached_kb_ret != None else -1
+        return kb_results
 
-        # if there are cached results, return then
-        if cached_kb_length > 0:
-            return dict(cached_kb_ret)
+    def _constraint_counts(self, constraints):
+        """
+        Protected helper method to count the entities matching every constraint and all of them, with one vectorized
+        equality mask per constraint, AND-reduced for the entities matching all of the constraints.
 
-        elif cached_kb_length == -1:
-            return dict([])
+        # Arguments:
 
-        # if the results is having length 0, continue
+            - ** constraints **: dictionary of slot and normalized code pairs
+
+        ** return **: dictionary of the number of entities matching every constraint, and all of them
+        """
 
-        # iterate ovet the knowledge base
-        for id in self.knowledge_dict.keys():
-            # get all keys for the given id
-            kb_keys = self.knowledge_dict[id].keys()
+        constraint_counts = {}
+        all_slots_match = self.kb_columns.entity_mask()
+        for slot, code in constraints.items():
+            slot_match = self.kb_columns.match_mask(slot, code)
+            constraint_counts[slot] = int(np.count_nonzero(slot_match))
+            all_slots_match &= slot_match
 
-            # some strange condition for finding a match
-            if len(set(constrain_keys).union(set(kb_keys)) ^ (set(constrain_keys) ^ set(kb_keys))) == len(
-                    constrain_keys):
+        constraint_counts[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = int(np.count_nonzero(all_slots_match))
 
-                match = True
-                for idx, k in enumerate(constrain_keys):
-                    if str(current_slots[k]).lower() == str(self.knowledge_dict[id][k]).lower():
-                        continue
-                    else:
-                        match = False
+        return constraint_counts
 
-                # if there is a match, cache the results and add the match in the results
-                if match:
-                    self.cached_kb[query_idx_keys].append((id, self.knowledge_dict[id]))
-                    result.append((id, self.knowledge_dict[id]))
+    def _constraint_counts_batch(self, constraints_list):
+        """
+        Protected helper method to count the entities matching every constraint and all of them, for several sets of
+        constraints at once. The sets are encoded in a (number of sets, number of slots) code matrix, the masks of all
+        distinct values of a slot come from one comparison of its column, and the counts of all sets come from one
+        stacked AND-reduction of their masks.
 
-        # if not a single match
-        if len(result) == 0:
-            self.cached_kb[query_idx_keys] = None
+        # Arguments:
 
-        # convert to dictionary
-        result = dict(result)
-        return result
+            - ** constraints_list **: list of dictionaries of slot and normalized code pairs
 
-    def available_results_from_kb_for_slots(self, inform_slots):
+        ** return **: list of the dictionaries of the number of entities matching every constraint, and all of them
         """
-        Return the count statistics for each constraint in inform_slots
-        
+
+        slots = sorted(set(itertools.chain.from_iterable(constraints_list)))
+        slot_indices = {slot: idx for idx, slot in enumerate(slots)}
+
+        # the slots not constrained by a set are coded as missing values, no constraint has that code
+        codes = np.empty((len(constraints_list), len(slots)), dtype=np.int64)
+        codes.fill(const.KB_MISSING_VALUE_CODE)
+        for row, constraints in enumerate(constraints_list):
+            for slot, code in constraints.items():
+                codes[row, slot_indices[slot]] = code
+
+        slot_counts = np.zeros(codes.shape, dtype=np.int64)
+        all_slots_match = np.repeat(self.kb_columns.entity_mask()[np.newaxis, :], len(constraints_list), axis=0)
+        for idx, slot in enumerate(slots):
+            rows = np.flatnonzero(codes[:, idx] != const.KB_MISSING_VALUE_CODE)
+            slot_codes, mask_indices = np.unique(codes[rows, idx], return_inverse=True)
+
+            # one mask per distinct value, the unknown slots and values match no entity
+            if slot in self.kb_columns.normalized_codes:
+                column = np.asarray(self.kb_columns.normalized_codes[slot])
+                slot_masks = column[np.newaxis, :] == slot_codes[:, np.newaxis]
+            else:
+                slot_masks = np.zeros((len(slot_codes), self.kb_columns.nb_entities()), dtype=np.bool_)
+
+            slot_counts[rows, idx] = np.count_nonzero(slot_masks, axis=1)[mask_indices]
+            all_slots_match[rows] &= slot_masks[mask_indices]
+
+        all_counts = np.count_nonzero(all_slots_match, axis=1)
+
+        constraint_counts_list = []
+        for row, constraints in enumerate(constraints_list):
+            constraint_counts = {slot: int(slot_counts[row, slot_indices[slot]]) for slot in constraints}
+            constraint_counts[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = int(all_counts[row])
+            constraint_counts_list.append(constraint_counts)
+
+        return constraint_counts_list
+
+    def cache_stats(self):
+        """
+        Return the hit, miss and eviction statistics of the query caches.
+
+        ** return **: dictionary with the statistics of the entities, count statistics and histogram caches
+        """
+
+        return {cache_name: getattr(self, cache_name).stats() for cache_name in const.KB_QUERY_CACHE_NAMES}
+
+    def compute_cache_entries(self, inform_slots_list):
+        """
+        Compute the entities and the counts matching the given constraints. The entities are queried through the
+        entity cache of this helper, so the entries already in it (or in the shared dictionary backing it, if the caches
+        are shared) are reused instead of computed again. The constraints are queried from the smallest to the largest,
+        such that the larger ones are refined from the cached smaller ones, and the counts are taken from the postings,
+        without any entity mask.
+
         # Arguments:
-        
-            - ** inform_slots **: 
-            
-        ** return **:
+
+            - ** inform_slots_list **: list of dictionaries of slot and value pairs
+
+        ** return **: list of the cache name, cache key and cached value triples
         """
-        logging.info('Calling `GOKBHelper` available_results_from_kb_for_slots method')
+        logging.info('Calling `GOKBHelper` compute_cache_entries method')
 
-        kb_results = {key: 0 for key in inform_slots.keys()}
-        kb_results[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = 0
+        entries = {}
+        for inform_slots in sorted(inform_slots_list, key=len):
+            query_key, positions = self.__constraint_positions(self.canonical_constraints(inform_slots,
+                                                                                          self.filter_slots))
+            entries[('cached_kb', query_key)] = positions
 
-        # load cached results
-        query_idx_keys = frozenset(inform_slots.items())
-        cached_kb_slot_ret = self.cached_kb_slot[query_idx_keys]
+            constraints = self.canonical_constraints(inform_slots, [self.ultimate_request_slot])
+            count_key = ('cached_kb_slot', frozenset(constraints.items()))
+            if count_key in entries:
+                continue
 
-        # if there are already cached results, return them
-        if len(cached_kb_slot_ret) > 0:
-            logging.debug("Cached results found: '{0}'".format(cached_kb_slot_ret[0]))
-            return cached_kb_slot_ret[0]
+            constraint_counts = {slot: len(self.kb_columns.posting(slot, code)) for slot, code in constraints.items()}
+            constraint_counts[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = len(self.__constraint_positions(constraints)[1])
+            entries[count_key] = constraint_counts
 
-        # iterate in the knowledge dictionary
-        for entity_id in self.knowledge_dict.keys():
-            # iterate over the inform slots
-            all_slots_match = 1
-            for slot in inform_slots.keys():
+        return [(cache_name, key, value) for (cache_name, key), value in entries.items()]
 
-                if slot == self.ultimate_request_slot or inform_slots[slot] == const.I_DO_NOT_CARE:
-                    continue
+    def precompute_caches(self, inform_slots_list, nb_workers=1):
+        """
+        Fill the entities and the count caches with the results of the given constraints, such that they are never
+        computed during the dialogues. With several workers, the constraints are split in contiguous chunks, each
+        computed in a forked process sharing the knowledge base of this one.
 
-                # if there is a match count
-                if slot in self.knowledge_dict[entity_id].keys():
+        # Arguments:
 
-                    if inform_slots[slot].lower() == self.knowledge_dict[entity_id][slot].lower():
-                        kb_results[slot] += 1
-                    else:
-                        all_slots_match = 0
-                else:
-                    all_slots_match = 0
+            - ** inform_slots_list **: list of dictionaries of slot and value pairs
+            - ** nb_workers **: the number of processes computing the results
 
-            kb_results[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] += all_slots_match
+        ** return **: the number of cached entries
+        """
+        logging.info('Calling `GOKBHelper` precompute_caches method')
 
-        self.cached_kb_slot[query_idx_keys].append(kb_results)
+        if nb_workers > 1 and len(inform_slots_list) > 1:
+            chunk_size = (len(inform_slots_list) + nb_workers - 1) // nb_workers
+            chunks = [inform_slots_list[idx:idx + chunk_size] for idx in xrange(0, len(inform_slots_list), chunk_size)]
 
-        return kb_results
+            pool = multiprocessing.Pool(len(chunks), initializer=init_precompute_worker, initargs=(self,))
+            try:
+                entries = list(itertools.chain(*pool.map(compute_cache_entries, chunks)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            entries = self.compute_cache_entries(inform_slots_list)
+
+        self.put_cache_entries(entries)
+
+        return len(entries)
+
+    def put_cache_entries(self, entries):
+        """
+        Put entries in the query caches, e.g. the ones computed by other processes, and write them to the caches shared
+        with other processes, if any.
+
+        # Arguments:
+
+            - ** entries **: list of the cache name, cache key and cached value triples
+        """
+
+        for cache_name, key, value in entries:
+            getattr(self, cache_name).put(key, value)
+        self.flush_caches()
+
+    def record_new_cache_entries(self):
+        """
+        Start recording the new entries of the query caches, e.g. in a forked worker process, such that they can be
+        sent back and merged into the query caches of the parent process by `put_cache_entries`.
+        """
+
+        for cache_name in const.KB_QUERY_CACHE_NAMES:
+            getattr(self, cache_name).record_new_entries()
+
+    def take_new_cache_entries(self):
+        """
+        ** return **: list of the cache name, cache key and cached value triples of the entries put in the query caches
+                      since the last call (see `record_new_cache_entries`)
+        """
+
+        return [(cache_name, key, value) for cache_name in const.KB_QUERY_CACHE_NAMES
+                for key, value in getattr(self, cache_name).take_new_entries()]
+
+    def flush_caches(self):
+        """
+        Write the new entries of the query caches to the caches shared with other processes, if any.
+        """
+
+        for cache_name in const.KB_QUERY_CACHE_NAMES:
+            getattr(self, cache_name).flush()
+
+    def __invalidate_caches(self, old_pairs, new_pairs, changed_slots):
+        """
+        Private helper method to remove the cache entries made stale by an update of one entity. A query matches the
+        entity if its constraints are a subset of the (slot, normalized code) pairs of the entity, so only the queries
+        whose constraints touch the changed values are removed:
+
+            - the entities and the counts of a query are stale if the query matched the entity before the update and
+              does not match it after the update, or the opposite
+            - the counts of the single constraints are stale if the constraint is one of the changed values
+            - the value histograms of a slot are also stale if the query matches the entity and its slot changed
+
+        # Arguments:
+
+            - ** old_pairs **: the pairs of the entity before the update, None for a new entity
+            - ** new_pairs **: the pairs of the entity after the update, None for a removed entity
+            - ** changed_slots **: the slots whose (raw) value changed
+        """
+
+        def matches(query_pairs, entity_pairs):
+            return entity_pairs is not None and query_pairs <= entity_pairs
+
+        def is_stale_query(query_pairs):
+            return matches(query_pairs, old_pairs) != matches(query_pairs, new_pairs)
+
+        changed_pairs = (old_pairs or frozenset()) ^ (new_pairs or frozenset())
+        self.nb_entity_updates += 1
+
+        self.cached_kb.invalidate(is_stale_query)
+        self.cached_kb_slot.invalidate(lambda key: is_stale_query(key) or not key.isdisjoint(changed_pairs))
+        self.cached_kb_histogram.invalidate(lambda key: is_stale_query(key[0]) or
+                                                        (key[1] in changed_slots and matches(key[0], new_pairs)))
+
+    def __check_updatable(self):
+        """
+        Private helper method to refuse the updates of a knowledge base whose query caches are shared with other
+        processes, since the other processes would keep answering from their stale cache entries.
+        """
+
+        if self.shared_caches is not None:
+            raise Exception("The knowledge base cannot be updated while its query caches are shared")
+
+    def add_entity(self, entity_id, entity):
+        """
+        Add a new entity to the knowledge base. The inverted index is updated incrementally, and only the cached
+        results of the queries touching the values of the entity are removed.
+
+        # Arguments:
+
+            - ** entity_id **: the id of the new entity
+            - ** entity **: dictionary of a form {slot: value}
+        """
+        logging.info('Calling `GOKBHelper` add_entity method')
+
+        self.__check_updatable()
+        position = self.kb_columns.add_entity(entity_id, entity)
+        if self.knowledge_dict is not None:
+            self.knowledge_dict[entity_id] = entity
+
+        self.__invalidate_caches(None, self.kb_columns.entity_pairs(position), set(entity.keys()))
+
+    def update_entity(self, entity_id, entity):
+        """
+        Replace the values of an entity of the knowledge base. The inverted index is updated incrementally, and only
+        the cached results of the queries touching the changed values are removed.
+
+        # Arguments:
+
+            - ** entity_id **: the id of the entity
+            - ** entity **: dictionary of a form {slot: value}, the slots not in it are removed from the entity
+        """
+        logging.info('Calling `GOKBHelper` update_entity method')
+
+        self.__check_updatable()
+        position = self.kb_columns.position(entity_id)
+        if position is None:
+            raise Exception("The entity '{0}' is not in the knowledge base".format(entity_id))
+
+        old_pairs = self.kb_columns.entity_pairs(position)
+        old_entity = self.kb_columns.entity(position)
+
+        self.kb_columns.update_entity(position, entity)
+        if self.knowledge_dict is not None:
+            self.knowledge_dict[entity_id] = entity
+
+        changed_slots = set(slot for slot in set(old_entity.keys()) | set(entity.keys())
+                            if old_entity.get(slot) != entity.get(slot))
+        self.__invalidate_caches(old_pairs, self.kb_columns.entity_pairs(position), changed_slots)
+
+    def remove_entity(self, entity_id):
+        """
+        Remove an entity from the knowledge base. The inverted index is updated incrementally, and only the cached
+        results of the queries matching the entity are removed.
+
+        # Arguments:
+
+            - ** entity_id **: the id of the entity
+        """
+        logging.info('Calling `GOKBHelper` remove_entity method')
+
+        self.__check_updatable()
+        position = self.kb_columns.position(entity_id)
+        if position is None:
+            raise Exception("The entity '{0}' is not in the knowledge base".format(entity_id))
+
+        old_pairs = self.kb_columns.entity_pairs(position)
+        old_entity = self.kb_columns.entity(position)
+
+        self.kb_columns.remove_entity(position)
+        if self.knowledge_dict is not None:
+            del self.knowledge_dict[entity_id]
+
+        self.__invalidate_caches(old_pairs, None, set(old_entity.keys()))
+
+    def kb_content_hash(self):
+        """
+        ** return **: the hash of the content of the knowledge base
+        """
+
+        return self.kb_columns.content_hash()
+
+    def __cache_hash(self):
+        """
+        Private helper method to compute the hash the cached results depend on: the content of the knowledge base and
+        the slots configuring the queries.
+
+        ** return **: the hexadecimal SHA-1 digest
+        """
+
+        sha1 = hashlib.sha1(self.kb_content_hash())
+        sha1.update(str(const.KB_CACHE_FORMAT_VERSION))
+        sha1.update(repr((self.ultimate_request_slot, sorted(self.special_slots or []),
+                          sorted(self.filter_slots or []))))
+
+        return sha1.hexdigest()
+
+    def save_cache(self, cache_path):
+        """
+        Save the entries of the query caches in a file, together with the hash of the knowledge base, such that a
+        later run on the same knowledge base can start with warm caches.
+
+        # Arguments:
+
+            - ** cache_path **: the path to the cache file
+        """
+        logging.info('Calling `GOKBHelper` save_cache method')
+
+        caches = {cache_name: getattr(self, cache_name).items() for cache_name in const.KB_QUERY_CACHE_NAMES}
+
+        # write a temporary file first, such that an interrupted save does not corrupt the previous cache file
+        pickle.dump({'kb_hash': self.__cache_hash(), 'caches': caches}, open(cache_path + '.tmp', 'wb'),
+                    pickle.HIGHEST_PROTOCOL)
+        os.rename(cache_path + '.tmp', cache_path)
+
+    def load_cache(self, cache_path):
+        """
+        Load the entries of the query caches saved by `save_cache`. The file is ignored if it does not exist, or if it
+        was saved for a different knowledge base.
+
+        # Arguments:
+
+            - ** cache_path **: the path to the cache file
+
+        ** return **: True if the entries were loaded, False otherwise
+        """
+        logging.info('Calling `GOKBHelper` load_cache method')
+
+        if not os.path.exists(cache_path):
+            return False
+
+        saved_cache = pickle.load(open(cache_path, 'rb'))
+        if saved_cache['kb_hash'] != self.__cache_hash():
+            logging.info("The cache file '{0}' is for a different knowledge base, it is ignored".format(cache_path))
+            return False
+
+        for cache_name in const.KB_QUERY_CACHE_NAMES:
+            cache = getattr(self, cache_name)
+            for key, value in saved_cache['caches'][cache_name]:
+                cache.put(key, value)
+
+        return True
 
     def database_results_for_agent(self, current_slots):
         """
@@ -262,6 +849,56 @@ class GOKBHelper(object):
 
         return database_results
 
+    def database_results_for_agent_batch(self, current_slots_batch, slot_set):
+        """
+        The number of results matching each current constraint, for a batch of dialogues. Every distinct set of
+        constraints is looked up once in the count cache, and the missing ones are counted together by one stacked
+        mask computation (see `_constraint_counts_batch`).
+
+        The counts are laid out as in the state representation: the column of a constrained slot holds the number of
+        entities matching its constraint, and all other columns (including the last one) hold the number of entities
+        matching all of the constraints.
+
+        # Arguments:
+
+            - ** current_slots_batch **: list of the records of filled slots of every dialogue
+            - ** slot_set **: dictionary mapping each slot to its column
+
+        ** return **: integer matrix of shape (batch size, number of slots + 1)
+        """
+        logging.info('Calling `GOKBHelper` database_results_for_agent_batch method')
+
+        # the ultimate request slot and the slots the user does not care about are not counted
+        query_keys = [frozenset(self.canonical_constraints(current_slots[const.INFORM_SLOTS_KEY],
+                                                           [self.ultimate_request_slot]).items())
+                      for current_slots in current_slots_batch]
+
+        batch_counts = {}
+        missing_query_keys = []
+        for query_key in set(query_keys):
+            constraint_counts = self.cached_kb_slot.get(query_key)
+            if constraint_counts is None:
+                missing_query_keys.append(query_key)
+            else:
+                batch_counts[query_key] = constraint_counts
+
+        if len(missing_query_keys) > 0:
+            for query_key, constraint_counts in zip(missing_query_keys, self._constraint_counts_batch(
+                    [dict(query_key) for query_key in missing_query_keys])):
+                self.cached_kb_slot.put(query_key, constraint_counts)
+                batch_counts[query_key] = constraint_counts
+
+        counts = np.zeros((len(current_slots_batch), len(slot_set) + 1), dtype=np.int64)
+        for row, (current_slots, query_key) in enumerate(zip(current_slots_batch, query_keys)):
+            constraint_counts = batch_counts[query_key]
+            counts[row, :] = constraint_counts[const.KB_MATCHING_ALL_CONSTRAINTS_KEY]
+
+            # the given slots which are not constraints have no match
+            for slot in current_slots[const.INFORM_SLOTS_KEY]:
+                if slot in slot_set:
+                    counts[row, slot_set[slot]] = constraint_counts.get(slot, 0)
+
+        return counts
 
     def suggest_slot_values(self, request_slots, current_slots):
         """
@@ -276,18 +913,35 @@ class GOKBHelper(object):
         """
         logging.info('Calling `GOKBHelper` suggest_slot_values method')
 
-        avail_kb_results = self.available_results_from_kb(current_slots)
+        query_key, positions = self._query(current_slots)
         return_suggest_slot_vals = {}
         for slot in request_slots.keys():
-            avail_values_dict = self.available_slot_values(slot, avail_kb_results)
-            values_counts = [(v, avail_values_dict[v]) for v in avail_values_dict.keys()]
-
-            if len(values_counts) > 0:
-                return_suggest_slot_vals[slot] = []
-                sorted_dict = sorted(values_counts, key=lambda x: -x[1])
-                for k in sorted_dict: return_suggest_slot_vals[slot].append(k[0])
-            else:
-                return_suggest_slot_vals[slot] = []
+            # all of the available values, from the most to the least frequent one
+            return_suggest_slot_vals[slot] = self._slot_values(query_key, positions, slot)
 
         return return_suggest_slot_vals
 
+
+# the knowledge base helper of a precomputing worker process, inherited from the parent process when forked
+precompute_kb_helper = None
+
+
+def init_precompute_worker(kb_helper):
+    """
+    Initialize a worker process precomputing the query caches.
+
+    # Arguments:
+
+        - ** kb_helper **: the knowledge base helper of the parent process
+    """
+
+    global precompute_kb_helper
+    precompute_kb_helper = kb_helper
+
+
+def compute_cache_entries(inform_slots_list):
+    """
+    Compute the cache entries of a chunk of constraints in a worker process, see `GOKBHelper.compute_cache_entries`.
+    """
+
+    return precompute_kb_helper.compute_cache_entries(inform_slots_list)
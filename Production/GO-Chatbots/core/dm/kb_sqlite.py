@@ -0,0 +1,514 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the Knowledge Base stored in a SQLite database
+"""
+
+from core import constants as const
+from core.dm.kb_helper import GOKBHelper
+from core.dm.kb_columns import normalize_value
+from core.dm.kb_cache import GOLRUCache
+from core.dm.kb_fuzzy import GOFuzzyValueIndex
+import cPickle as pickle
+import hashlib, itertools, logging, os, sqlite3
+
+KB_SQLITE_FORMAT_VERSION = 2
+# columns of the entities table, one raw and one normalized code column per slot (given by the index of the slot)
+KB_SQLITE_CODE_COLUMN = 'code_{0}'
+KB_SQLITE_NORMALIZED_CODE_COLUMN = 'normalized_code_{0}'
+# the number of entities inserted at once when the database is written
+KB_SQLITE_INSERT_BATCH_SIZE = 10000
+
+
+class GOSQLiteKBHelper(GOKBHelper):
+    """
+    Knowledge base helper answering the queries from a SQLite database, such that the size of the knowledge base is
+    bounded by the disk and not by the memory. It has the same interface as the `GOKBHelper`.
+
+    The database has the same layout as the `GOKBColumns`: the `kb_values` table keeps the dictionary of the distinct
+    values of every slot, and the `kb_entities` table keeps every entity (pickled) and the raw and the normalized code
+    of every slot, with an index on the normalized codes of each slot. The missing values are NULL. The constraints
+    are encoded to normalized codes, and every query is one (grouped) SQL statement on the indexed code columns. The
+    answer of a query (see `_query`) is its SQL condition, instead of the positions of the matching entities.
+
+    # Arguments:
+
+        - ** sqlite_path **: the path to the SQLite database, as created by `save_sqlite_kb_entities`
+        - ** connection **: the connection to the database, opened by the process `connection_pid`
+        - ** slots **: the list of all slots appearing in the knowledge base
+        - ** slot_columns **: dictionary mapping each slot to the index of its code columns
+        - ** content_hash **: the hash of the content of the knowledge base, written with the database
+        - ** cached_kb **: size-bounded LRU cache of the entities matching a query
+        - ** cached_kb_value_codes **: size-bounded LRU cache of the normalized codes of the constraint values
+        - ** fuzzy_indexes **: dictionary mapping each slot to the trigram index of its normalized values, built by the
+                               first approximate lookup of the slot
+    """
+
+    def __init__(self, ultimate_request_slot=None, special_slots=None, filter_slots=None, sqlite_path=None,
+                 cache_size=const.DEFAULT_KB_CACHE_SIZE, shared_caches=None, fuzzy_threshold=None):
+        """Constructor of the `GOSQLiteKBHelper` class"""
+        logging.info('Calling `GOSQLiteKBHelper` constructor')
+
+        self.sqlite_path = sqlite_path
+        self.connection = None
+        self.connection_pid = None
+
+        meta = dict(self.__connection().execute('SELECT name, value FROM kb_meta').fetchall())
+        version = pickle.loads(str(meta['version']))
+        if version != KB_SQLITE_FORMAT_VERSION:
+            raise Exception("Unsupported knowledge base format version: '{0}'".format(version))
+
+        self.slots = pickle.loads(str(meta['slots']))
+        self.slot_columns = {slot: idx for idx, slot in enumerate(self.slots)}
+        self.content_hash = pickle.loads(str(meta['content_hash']))
+
+        self.fuzzy_indexes = {}
+        self.cached_kb_value_codes = GOLRUCache(cache_size)
+
+        # the entities are only in the database, there is neither a knowledge dictionary nor columns
+        super(GOSQLiteKBHelper, self).__init__(ultimate_request_slot, special_slots, filter_slots, None, cache_size,
+                                               None, shared_caches, fuzzy_threshold)
+
+    def _create_kb_columns(self, knowledge_dict, kb_columns):
+        """
+        The queries are answered from the database, no columns are built.
+        """
+
+        return None
+
+    def __connection(self):
+        """
+        Private helper method to get the connection to the database of this process. A connection cannot be used by
+        several processes, so a forked process opens its own connection.
+
+        ** return **: the connection to the database
+        """
+
+        if self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.sqlite_path)
+            self.connection.text_factory = str
+            self.connection_pid = os.getpid()
+
+        return self.connection
+
+    def value_code(self, slot, value):
+        """
+        Find the normalized code of a value of a slot, from the value dictionary of the database. With a fuzzy
+        threshold, a value which is not in the database is resolved to the most similar value of the slot.
+
+        # Arguments:
+
+            - ** slot **: the slot
+            - ** value **: the value of the slot
+
+        ** return **: the normalized code, or `KB_NO_MATCH_CODE` if no entity has this value
+        """
+
+        if slot not in self.slot_columns:
+            return const.KB_NO_MATCH_CODE
+
+        normalized_value = normalize_value(value)
+        code = self.cached_kb_value_codes.get((slot, normalized_value))
+        if code is None:
+            row = self.__connection().execute('SELECT normalized_code FROM kb_values WHERE slot = ? AND '
+                                          'normalized_value = ? LIMIT 1',
+                                          (self.slot_columns[slot], normalized_value)).fetchone()
+            code = row[0] if row is not None else const.KB_NO_MATCH_CODE
+            if code == const.KB_NO_MATCH_CODE and self.fuzzy_threshold is not None:
+                code = self.__fuzzy_index(slot).lookup(value, self.fuzzy_threshold)
+
+            self.cached_kb_value_codes.put((slot, normalized_value), code)
+
+        return code
+
+    def __fuzzy_index(self, slot):
+        """
+        Private helper method to get the trigram index of the normalized values of a slot, built from the value
+        dictionary of the database on the first approximate lookup of the slot.
+
+        # Arguments:
+
+            - ** slot **: the slot
+
+        ** return **: the trigram index of the slot
+        """
+
+        if slot not in self.fuzzy_indexes:
+            rows = self.__connection().execute('SELECT normalized_code, MIN(normalized_value) FROM kb_values '
+                                               'WHERE slot = ? GROUP BY normalized_code ORDER BY normalized_code',
+                                               (self.slot_columns[slot],)).fetchall()
+            self.fuzzy_indexes[slot] = GOFuzzyValueIndex([normalized_value for _, normalized_value in rows])
+
+        return self.fuzzy_indexes[slot]
+
+    def __where_clause(self, constraints):
+        """
+        Private helper method to build the SQL condition of the entities matching all of the constraints.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs
+
+        ** return **: the SQL condition and its parameters, None if no entity can match the constraints
+        """
+
+        if const.KB_NO_MATCH_CODE in constraints.values():
+            return None
+
+        if len(constraints) == 0:
+            return '1', ()
+
+        slots = sorted(constraints.keys())
+        condition = ' AND '.join(KB_SQLITE_NORMALIZED_CODE_COLUMN.format(self.slot_columns[slot]) + ' = ?'
+                                 for slot in slots)
+
+        return condition, tuple(constraints[slot] for slot in slots)
+
+    def _query(self, current_slots):
+        """
+        Protected helper method to encode the current constraints.
+
+        # Arguments:
+
+            - ** current_slots **: record of filled slots in the dialogue so far
+
+        ** return **: the cache key of the query and the SQL condition of the matching entities (None for no match)
+        """
+
+        constraints = self.canonical_constraints(current_slots[const.INFORM_SLOTS_KEY], self.filter_slots)
+
+        return self.canonical_query_key(constraints), self.__where_clause(constraints)
+
+    def _has_results(self, query_key, where):
+        """
+        Protected helper method to check whether any entity matches a query, without reading the entities.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** where **: the SQL condition of the matching entities
+
+        ** return **: True if there is at least one matching entity
+        """
+
+        return where is not None and bool(self.__connection().execute(
+            'SELECT EXISTS (SELECT 1 FROM kb_entities WHERE ' + where[0] + ')', where[1]).fetchone()[0])
+
+    def _results(self, query_key, where):
+        """
+        Protected helper method to find the entities matching the current constraints, either from the cache or by
+        querying the database.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** where **: the SQL condition of the matching entities
+
+        ** return **: dictionary of the entities of a form {entity_id: entity}
+        """
+
+        results = self.cached_kb.get(query_key)
+
+        if results is None:
+            results = {}
+            if where is not None:
+                condition, params = where
+                sql = 'SELECT entity_id, entity FROM kb_entities WHERE ' + condition
+                for entity_id, entity in self.__connection().execute(sql, params):
+                    results[pickle.loads(str(entity_id))] = pickle.loads(str(entity))
+
+            self.query_stats['queries'] += 1
+            self.cached_kb.put(query_key, results)
+
+        return results
+
+    def _slot_values(self, query_key, where, slot, nb_values=None):
+        """
+        Protected helper method to find the values of a slot among the entities matching a query, from the most to the
+        least frequent one. The values are counted by a grouped query.
+
+        # Arguments:
+
+            - ** query_key **: the cache key of the query
+            - ** where **: the SQL condition of the matching entities
+            - ** slot **: the slot
+            - ** nb_values **: the number of values, None for all of them
+
+        ** return **: list of the values
+        """
+
+        histogram_key = (query_key, slot)
+        slot_values = self.cached_kb_histogram.get(histogram_key)
+
+        if slot_values is None:
+            slot_values = []
+            if where is not None and slot in self.slot_columns:
+                condition, params = where
+                code_column = KB_SQLITE_CODE_COLUMN.format(self.slot_columns[slot])
+
+                # the ties are broken by the code, as in the `GOKBColumns`
+                sql = 'SELECT v.value FROM (SELECT {0} AS code, COUNT(*) AS count FROM kb_entities WHERE {1} AND {0} ' \
+                      'IS NOT NULL GROUP BY {0}) AS h JOIN kb_values AS v ON v.slot = ? AND v.code = h.code ' \
+                      'ORDER BY h.count DESC, h.code'.format(code_column, condition)
+                slot_values = [pickle.loads(str(value)) for value, in
+                               self.__connection().execute(sql, params + (self.slot_columns[slot],))]
+
+            self.cached_kb_histogram.put(histogram_key, slot_values)
+
+        return slot_values[:nb_values]
+
+    def kb_content_hash(self):
+        """
+        ** return **: the hash of the content of the knowledge base, computed when the database was written
+        """
+
+        return self.content_hash
+
+    def _constraint_counts(self, constraints):
+        """
+        Protected helper method to count the entities matching every constraint and all of them. All counts are
+        computed by one SQL statement, every count is answered from the index of its slot.
+
+        # Arguments:
+
+            - ** constraints **: dictionary of slot and normalized code pairs
+
+        ** return **: dictionary of the number of entities matching every constraint, and all of them
+        """
+
+        constraint_counts = {slot: 0 for slot in constraints.keys()}
+        constraint_counts[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = 0
+
+        # one scalar sub-query per count, the constraints not matching any entity are not queried
+        keys = []
+        counts = []
+        params = ()
+        for key, where in [(slot, self.__where_clause({slot: code})) for slot, code in constraints.items()] + \
+                          [(const.KB_MATCHING_ALL_CONSTRAINTS_KEY, self.__where_clause(constraints))]:
+            if where is not None:
+                keys.append(key)
+                counts.append('(SELECT COUNT(*) FROM kb_entities WHERE {0})'.format(where[0]))
+                params += where[1]
+
+        if len(keys) > 0:
+            constraint_counts.update(zip(keys, self.__connection().execute('SELECT ' + ', '.join(counts),
+                                                                           params).fetchone()))
+
+        return constraint_counts
+
+    def _constraint_counts_batch(self, constraints_list):
+        """
+        Protected helper method to count the entities matching several sets of constraints, one SQL statement per set,
+        since the counts come from the indexes and not from entity masks.
+
+        # Arguments:
+
+            - ** constraints_list **: list of dictionaries of slot and normalized code pairs
+
+        ** return **: list of the dictionaries of the number of entities matching every constraint, and all of them
+        """
+
+        return [self._constraint_counts(constraints) for constraints in constraints_list]
+
+    def compute_cache_entries(self, inform_slots_list):
+        """
+        Compute the entities and the counts matching the given constraints. The entities are read through the entity
+        cache of this helper, so the entries already in it (or in the shared dictionary backing it, if the caches are
+        shared) are reused, while the counts are always computed by the database.
+
+        # Arguments:
+
+            - ** inform_slots_list **: list of dictionaries of slot and value pairs
+
+        ** return **: list of the cache name, cache key and cached value triples
+        """
+        logging.info('Calling `GOSQLiteKBHelper` compute_cache_entries method')
+
+        entries = {}
+        for inform_slots in inform_slots_list:
+            query_key, where = self._query({const.INFORM_SLOTS_KEY: inform_slots})
+            if ('cached_kb', query_key) not in entries:
+                entries[('cached_kb', query_key)] = self._results(query_key, where)
+
+            constraints = self.canonical_constraints(inform_slots, [self.ultimate_request_slot])
+            count_key = ('cached_kb_slot', frozenset(constraints.items()))
+            if count_key not in entries:
+                entries[count_key] = self._constraint_counts(constraints)
+
+        return [(cache_name, key, value) for (cache_name, key), value in entries.items()]
+
+    def add_entity(self, entity_id, entity):
+        """
+        The SQLite knowledge base is read-only, it is updated by converting the knowledge base again.
+        """
+
+        raise Exception("The SQLite knowledge base does not support updates")
+
+    def update_entity(self, entity_id, entity):
+        """
+        The SQLite knowledge base is read-only, it is updated by converting the knowledge base again.
+        """
+
+        raise Exception("The SQLite knowledge base does not support updates")
+
+    def remove_entity(self, entity_id):
+        """
+        The SQLite knowledge base is read-only, it is updated by converting the knowledge base again.
+        """
+
+        raise Exception("The SQLite knowledge base does not support updates")
+
+
+def save_sqlite_kb_entities(entities, sqlite_path):
+    """
+    Save a stream of entities in a SQLite database, which can be queried by the `GOSQLiteKBHelper`. The entities are
+    written in batches, in a single pass, and only the dictionaries of the distinct values of every slot are kept in
+    memory, so the knowledge base never has to fit in the memory. The code columns of a slot are added when it first
+    appears, the entities written before have no value for it.
+
+    The codes are given in the order of appearance of the values, as in `GOKBColumns.from_knowledge_dict` for the
+    entities sorted by their id.
+
+    # Arguments:
+
+        - ** entities **: iterable of the entity id and entity pairs, every entity is a dictionary of a form
+                          {slot: value}
+        - ** sqlite_path **: the path to the database, an existing database is replaced
+
+    ** return **: the number of entities and the list of all slots
+    """
+    logging.info('Calling save_sqlite_kb_entities method')
+
+    if os.path.exists(sqlite_path):
+        os.remove(sqlite_path)
+
+    connection = sqlite3.connect(sqlite_path)
+    connection.text_factory = str
+
+    connection.execute('CREATE TABLE kb_meta (name TEXT PRIMARY KEY, value BLOB)')
+    connection.execute('CREATE TABLE kb_values (slot INTEGER, code INTEGER, value BLOB, normalized_code INTEGER, '
+                       'normalized_value TEXT, PRIMARY KEY (slot, code))')
+    connection.execute('CREATE TABLE kb_entities (position INTEGER PRIMARY KEY, entity_id BLOB, entity BLOB)')
+
+    slots = []
+    slot_columns = {}
+    # for every slot, the raw values by code, the raw and normalized codes of every raw value, and the normalized
+    # code of every normalized value
+    values = []
+    value_codes = []
+    normalized_value_codes = []
+
+    # the content hash identifies the codes as well, since they follow the order of the entities
+    sha1 = hashlib.sha1()
+    rows = []
+    nb_entities = 0
+
+    def insert_rows():
+        # the missing values are stored as NULL, such that they never match a constraint
+        columns = ['position', 'entity_id', 'entity']
+        for idx in xrange(len(slots)):
+            columns += [KB_SQLITE_CODE_COLUMN.format(idx), KB_SQLITE_NORMALIZED_CODE_COLUMN.format(idx)]
+
+        connection.executemany('INSERT INTO kb_entities (' + ', '.join(columns) + ') VALUES (' +
+                               ', '.join(['?'] * len(columns)) + ')',
+                               (row + [None] * (len(columns) - len(row)) for row in rows))
+        del rows[:]
+
+    for entity_id, entity in entities:
+        entity_items = sorted(entity.items())
+        sha1.update(repr((entity_id, entity_items)))
+
+        row = [nb_entities, sqlite3.Binary(pickle.dumps(entity_id, pickle.HIGHEST_PROTOCOL)),
+               sqlite3.Binary(pickle.dumps(entity, pickle.HIGHEST_PROTOCOL))] + [None] * (2 * len(slots))
+        for slot, value in entity_items:
+            idx = slot_columns.get(slot)
+            if idx is None:
+                idx = len(slots)
+                slot_columns[slot] = idx
+                slots.append(slot)
+                values.append([])
+                value_codes.append({})
+                normalized_value_codes.append({})
+                row += [None, None]
+
+                for column in [KB_SQLITE_CODE_COLUMN.format(idx), KB_SQLITE_NORMALIZED_CODE_COLUMN.format(idx)]:
+                    connection.execute('ALTER TABLE kb_entities ADD COLUMN {0} INTEGER'.format(column))
+
+            codes = value_codes[idx].get(value)
+            if codes is None:
+                normalized_value = normalize_value(value)
+                normalized_code = normalized_value_codes[idx].setdefault(normalized_value,
+                                                                         len(normalized_value_codes[idx]))
+                codes = (len(values[idx]), normalized_code)
+                value_codes[idx][value] = codes
+                values[idx].append(value)
+
+            row[3 + 2 * idx], row[4 + 2 * idx] = codes
+
+        rows.append(row)
+        nb_entities += 1
+        if len(rows) >= KB_SQLITE_INSERT_BATCH_SIZE:
+            insert_rows()
+
+    insert_rows()
+
+    for idx in xrange(len(slots)):
+        connection.executemany('INSERT INTO kb_values VALUES (?, ?, ?, ?, ?)',
+                               [(idx, code, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+                                 value_codes[idx][value][1], normalize_value(value))
+                                for code, value in enumerate(values[idx])])
+    connection.execute('CREATE INDEX kb_values_normalized_value ON kb_values (slot, normalized_value)')
+
+    # one index per slot, for the constraints on that slot
+    for idx in xrange(len(slots)):
+        column = KB_SQLITE_NORMALIZED_CODE_COLUMN.format(idx)
+        connection.execute('CREATE INDEX kb_entities_{0} ON kb_entities ({0})'.format(column))
+
+    connection.executemany('INSERT INTO kb_meta VALUES (?, ?)',
+                           [(name, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+                            for name, value in [('version', KB_SQLITE_FORMAT_VERSION), ('slots', slots),
+                                                ('content_hash', sha1.hexdigest())]])
+
+    connection.commit()
+    connection.close()
+
+    return nb_entities, slots
+
+
+def save_sqlite_kb(kb_columns, sqlite_path):
+    """
+    Save the knowledge base in a SQLite database, which can be queried by the `GOSQLiteKBHelper`.
+
+    # Arguments:
+
+        - ** kb_columns **: the columnar knowledge base
+        - ** sqlite_path **: the path to the database, an existing database is replaced
+
+    ** return **: the number of entities and the list of all slots
+    """
+    logging.info('Calling save_sqlite_kb method')
+
+    positions = kb_columns.all_positions()
+
+    return save_sqlite_kb_entities(itertools.izip(kb_columns.entity_ids_at(positions),
+                                                  itertools.imap(kb_columns.entity, positions)), sqlite_path)
+
+
+def convert_pickle_kb_to_sqlite(knowledge_dict_path, sqlite_path):
+    """
+    Convert a pickled knowledge dictionary of a form {entity_id: {slot: value}} to a SQLite database. The entities are
+    streamed from the dictionary to the database, no columns are built.
+
+    # Arguments:
+
+        - ** knowledge_dict_path **: the path to the pickled knowledge dictionary
+        - ** sqlite_path **: the path to the database
+
+    ** return **: the number of entities and the list of all slots
+    """
+    logging.info('Calling convert_pickle_kb_to_sqlite method')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+
+    return save_sqlite_kb_entities(((entity_id, knowledge_dict[entity_id]) for entity_id in sorted(knowledge_dict)),
+                                   sqlite_path)
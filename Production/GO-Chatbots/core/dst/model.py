@@ -0,0 +1,210 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the recurrent model of the model-based state trackers. The inference runs in NumPy on a batch of
+dialogues, one step per dialogue turn, and the weights are kept in a compact `.npz` file.
+"""
+
+import numpy as np
+import logging
+
+# the names of the weight arrays in the `.npz` file
+GRU_WEIGHT_NAMES = ['input_weights', 'recurrent_weights', 'bias']
+
+
+def sigmoid(x):
+    """
+    The logistic function.
+
+    # Arguments:
+
+        - ** x **: array of any shape
+
+    ** return **: array of the same shape
+    """
+
+    return 1. / (1. + np.exp(-x))
+
+
+class GOGRUModel(object):
+    """
+    Gated recurrent unit updating the hidden state of every dialogue with the input of its last turn. The inputs are
+    bag encodings, so the input projection of a turn is the sum of the rows of the input weights of its non-zero
+    elements, and it can be computed once for every distinct input.
+
+    The gates are ordered as update, reset and candidate, in the columns of the weights:
+
+        - z = sigmoid(x W_z + h U_z + b_z)
+        - r = sigmoid(x W_r + h U_r + b_r)
+        - n = tanh(x W_n + (r * h) U_n + b_n)
+        - h' = (1 - z) * n + z * h
+
+    # Class members:
+
+        - ** input_weights **: array of shape (input_dim, 3 * hidden_size)
+        - ** recurrent_weights **: array of shape (hidden_size, 3 * hidden_size)
+        - ** bias **: array of shape (3 * hidden_size,)
+        - ** input_dim **: the dimension of the inputs
+        - ** hidden_size **: the dimension of the hidden state
+    """
+
+    def __init__(self, input_weights, recurrent_weights, bias):
+        """
+        Constructor of the `GOGRUModel` class.
+        """
+        logging.info('Calling `GOGRUModel` constructor')
+
+        self.input_weights = np.asarray(input_weights, dtype=np.float32)
+        self.recurrent_weights = np.asarray(recurrent_weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+
+        self.input_dim, gates_size = self.input_weights.shape
+        self.hidden_size = gates_size // 3
+
+        if gates_size != 3 * self.hidden_size or self.recurrent_weights.shape != (self.hidden_size, gates_size) or \
+                self.bias.shape != (gates_size,):
+            raise Exception("Inconsistent shapes of the GRU weights: '{0}', '{1}', '{2}'".format(
+                self.input_weights.shape, self.recurrent_weights.shape, self.bias.shape))
+
+    @classmethod
+    def load(cls, model_path):
+        """
+        Load the model from a `.npz` file, as saved by `save`.
+
+        # Arguments:
+
+            - ** model_path **: the path to the `.npz` file
+
+        ** return **: the model
+        """
+        logging.info('Calling `GOGRUModel` load method')
+
+        with np.load(model_path) as weights:
+            missing_names = [name for name in GRU_WEIGHT_NAMES if name not in weights.files]
+            if missing_names:
+                raise Exception("Missing GRU weights in '{0}': '{1}'".format(model_path, missing_names))
+
+            return cls(*[weights[name] for name in GRU_WEIGHT_NAMES])
+
+    @classmethod
+    def from_keras_weights(cls, weights):
+        """
+        Create the model from the weights of a trained Keras `GRU` layer, as returned by its `get_weights` method. The
+        gates of the Keras kernels are ordered as update, reset and candidate, as the ones of this model, and the
+        candidate of a layer with `reset_after=False` is the one of this model, so the weights are copied as they are.
+        The layers with `reset_after=True` apply the reset gate after the recurrent projection, with a second bias,
+        which this model does not compute.
+
+        # Arguments:
+
+            - ** weights **: list of the weight arrays of the layer, either the kernel, the recurrent kernel and the
+                             bias (Keras 2, the bias is left out by `use_bias=False`), or the input weights, the
+                             recurrent weights and the bias of the update, the reset and the candidate gate (Keras 1)
+
+        ** return **: the model
+        """
+        logging.info('Calling `GOGRUModel` from_keras_weights method')
+
+        weights = [np.asarray(weight) for weight in weights]
+
+        if len(weights) == 9:
+            return cls(np.concatenate(weights[0::3], axis=1), np.concatenate(weights[1::3], axis=1),
+                       np.concatenate(weights[2::3]))
+
+        if len(weights) == 2:
+            weights.append(np.zeros(weights[0].shape[1]))
+
+        if len(weights) != 3:
+            raise Exception("Unsupported Keras GRU weights: '{0}'".format([weight.shape for weight in weights]))
+
+        if weights[2].ndim != 1:
+            raise Exception("Unsupported Keras GRU with `reset_after=True`, the bias has the shape '{0}'".format(
+                weights[2].shape))
+
+        return cls(*weights)
+
+    @classmethod
+    def create(cls, input_dim, hidden_size, random_state=None):
+        """
+        Create a model with randomly initialized weights.
+
+        # Arguments:
+
+            - ** input_dim **: the dimension of the inputs
+            - ** hidden_size **: the dimension of the hidden state
+            - ** random_state **: optional `np.random.RandomState`
+
+        ** return **: the model
+        """
+
+        if random_state is None:
+            random_state = np.random.RandomState()
+
+        input_scale = np.sqrt(6. / (input_dim + hidden_size))
+        recurrent_scale = np.sqrt(3. / hidden_size)
+
+        return cls(random_state.uniform(-input_scale, input_scale, (input_dim, 3 * hidden_size)),
+                   random_state.uniform(-recurrent_scale, recurrent_scale, (hidden_size, 3 * hidden_size)),
+                   np.zeros(3 * hidden_size))
+
+    def save(self, model_path):
+        """
+        Save the weights of the model in a compressed `.npz` file.
+
+        # Arguments:
+
+            - ** model_path **: the path to the `.npz` file
+        """
+        logging.info('Calling `GOGRUModel` save method')
+
+        np.savez_compressed(model_path, input_weights=self.input_weights, recurrent_weights=self.recurrent_weights,
+                            bias=self.bias)
+
+    def initial_hidden(self, batch_size):
+        """
+        # Arguments:
+
+            - ** batch_size **: the number of dialogues
+
+        ** return **: the zero hidden state of every dialogue, array of shape (batch_size, hidden_size)
+        """
+
+        return np.zeros((batch_size, self.hidden_size), dtype=np.float32)
+
+    def input_projection(self, input_indices):
+        """
+        The projection of a bag encoded input by the input weights, including the bias.
+
+        # Arguments:
+
+            - ** input_indices **: list of the indices of the non-zero elements of the input
+
+        ** return **: array of shape (3 * hidden_size,)
+        """
+
+        return self.input_weights[input_indices].sum(axis=0) + self.bias
+
+    def step(self, input_projections, hidden):
+        """
+        Update the hidden states of a batch of dialogues with their inputs.
+
+        # Arguments:
+
+            - ** input_projections **: array of shape (batch_size, 3 * hidden_size) of the projections of the inputs
+                                       (see `input_projection`)
+            - ** hidden **: array of shape (batch_size, hidden_size) of the hidden states
+
+        ** return **: array of shape (batch_size, hidden_size) of the new hidden states
+        """
+
+        gates_size = 2 * self.hidden_size
+
+        update_reset = sigmoid(input_projections[:, :gates_size] +
+                               np.dot(hidden, self.recurrent_weights[:, :gates_size]))
+        update_gate = update_reset[:, :self.hidden_size]
+        reset_gate = update_reset[:, self.hidden_size:]
+
+        candidate = np.tanh(input_projections[:, gates_size:] +
+                            np.dot(reset_gate * hidden, self.recurrent_weights[:, gates_size:]))
+
+        return candidate + update_gate * (hidden - candidate)
@@ -0,0 +1,135 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for the sparse representation of the dialogue states. A sparse state is a pair of arrays, the sorted
+indices of the non-zero elements of the state and their values. A batch of sparse states is in the CSR form, a triple
+of the values, the indices and the row pointers of all states, where the elements of the i-th state are the ones
+between `indptr[i]` and `indptr[i + 1]`.
+
+The `GOSparseMemory` of the agent keeps the experiences with sparse states, and densifies the sampled batches with
+`csr_to_dense`.
+"""
+
+import numpy as np
+
+
+def dense_to_sparse(state):
+    """
+    Convert a dense state to a sparse state.
+
+    # Arguments:
+
+        - ** state **: array of shape (1, state_dim) or (state_dim,)
+
+    ** return **: the indices and the values of the non-zero elements of the state
+    """
+
+    state = np.ravel(state)
+    indices = np.flatnonzero(state).astype(np.int32)
+
+    return indices, state[indices]
+
+
+def sparse_to_dense(sparse_state, state_dim, out=None):
+    """
+    Convert a sparse state to a dense state.
+
+    # Arguments:
+
+        - ** sparse_state **: the indices and the values of the non-zero elements of the state
+        - ** state_dim **: the dimension of the state
+        - ** out **: optional array of shape (1, state_dim) or (state_dim,), where the state is written
+
+    ** return **: array of shape (1, state_dim), or `out`
+    """
+
+    if out is None:
+        out = np.zeros((1, state_dim))
+    else:
+        out.fill(0.)
+
+    indices, values = sparse_state
+    state = out[0] if out.ndim == 2 else out
+    state[indices] = values
+
+    return out
+
+
+def sparse_states_to_csr(sparse_states):
+    """
+    Stack sparse states to a batch in the CSR form.
+
+    # Arguments:
+
+        - ** sparse_states **: list of sparse states, every one a pair of the indices and the values
+
+    ** return **: the values, the indices and the row pointers of the batch
+    """
+
+    indptr = np.zeros(len(sparse_states) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(indices) for indices, _ in sparse_states])
+
+    if len(sparse_states) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int32), indptr
+
+    values = np.concatenate([values for _, values in sparse_states])
+    indices = np.concatenate([indices for indices, _ in sparse_states]).astype(np.int32)
+
+    return values, indices, indptr
+
+
+def csr_to_dense(csr, state_dim, out=None):
+    """
+    Convert a batch of sparse states in the CSR form to a dense batch, as consumed by the models of the agents.
+
+    # Arguments:
+
+        - ** csr **: the values, the indices and the row pointers of the batch
+        - ** state_dim **: the dimension of the states
+        - ** out **: optional array of shape (batch_size, state_dim), where the batch is written
+
+    ** return **: array of shape (batch_size, state_dim), or `out`
+    """
+
+    values, indices, indptr = csr
+    batch_size = len(indptr) - 1
+
+    if out is None:
+        out = np.zeros((batch_size, state_dim))
+    else:
+        out.fill(0.)
+
+    rows = np.repeat(np.arange(batch_size), np.diff(indptr))
+    out[rows, indices] = values
+
+    return out
+
+
+def csr_dot(csr, weights):
+    """
+    Multiply a batch of sparse states in the CSR form with a weight matrix, as the first dense layer of a model. The
+    rows of the weights of the non-zero elements are gathered and summed per state, so the cost is proportional to
+    the number of non-zero elements and not to the dimension of the states.
+
+    # Arguments:
+
+        - ** csr **: the values, the indices and the row pointers of the batch
+        - ** weights **: array of shape (state_dim, output_dim)
+
+    ** return **: array of shape (batch_size, output_dim), equal to the dense batch multiplied by the weights
+    """
+
+    values, indices, indptr = csr
+    batch_size = len(indptr) - 1
+
+    result = np.zeros((batch_size, weights.shape[1]), dtype=np.result_type(values, weights))
+    if len(indices) == 0:
+        return result
+
+    products = weights[indices] * values[:, np.newaxis]
+
+    # the empty states are skipped, every other state sums its products up to the start of the next non-empty state
+    non_empty = np.diff(indptr) > 0
+    result[non_empty] = np.add.reduceat(products, indptr[:-1][non_empty], axis=0)
+
+    return result
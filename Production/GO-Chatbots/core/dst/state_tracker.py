@@ -8,8 +8,174 @@ A Python file for the Goal-Oriented Dialogue State Tracker classes.
 from core import constants as const
 
 import numpy as np
-import copy, logging, pprint
+import collections, logging, pprint
 from core.dm.kb_helper import GOKBHelper
+from core.dm.kb_cache import GOLRUCache
+from core.dst.model import GOGRUModel
+
+
+class GOFrozenSlots(dict):
+    """
+    Read-only dictionary of the slots of a dialogue turn and their values. It is a shallow copy of the slots of the
+    action, so the history records share the (immutable) slot values and never need a deep copy.
+    """
+
+    __slots__ = ()
+
+    def __read_only(self, *args, **kwargs):
+        raise TypeError("The slots of a dialogue turn record are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return GOFrozenSlots, (dict(self),)
+
+
+class GOTurnRecord(object):
+    """
+    Immutable record of one dialogue turn in the history of the state tracker. The fields are read as attributes, or
+    with the keys of the action dictionaries, as `record[const.DIA_ACT_KEY]`.
+
+    # Class members:
+
+        - ** turn_nb **: the number of the dialogue turn
+        - ** speaker **: who took the action, the user or the agent
+        - ** dia_act **: the intent of the action
+        - ** inform_slots **: read-only dictionary of the inform slots of the action
+        - ** request_slots **: read-only dictionary of the request slots of the action
+    """
+
+    __slots__ = ('turn_nb', 'speaker', 'dia_act', 'inform_slots', 'request_slots')
+
+    # the keys of the action dictionaries and the matching fields
+    FIELDS = {const.TURN_NB_KEY: 'turn_nb', const.SPEAKER_TYPE_KEY: 'speaker', const.DIA_ACT_KEY: 'dia_act',
+              const.INFORM_SLOTS_KEY: 'inform_slots', const.REQUEST_SLOTS_KEY: 'request_slots'}
+
+    def __init__(self, turn_nb, speaker, dia_act, inform_slots, request_slots):
+        """
+        Constructor of the `GOTurnRecord` class.
+        """
+
+        object.__setattr__(self, 'turn_nb', turn_nb)
+        object.__setattr__(self, 'speaker', speaker)
+        object.__setattr__(self, 'dia_act', dia_act)
+        object.__setattr__(self, 'inform_slots', inform_slots if isinstance(inform_slots, GOFrozenSlots)
+                                                 else GOFrozenSlots(inform_slots))
+        object.__setattr__(self, 'request_slots', request_slots if isinstance(request_slots, GOFrozenSlots)
+                                                  else GOFrozenSlots(request_slots))
+
+    def __setattr__(self, name, value):
+        raise TypeError("A dialogue turn record is read-only")
+
+    def __getitem__(self, key):
+        return getattr(self, GOTurnRecord.FIELDS[key])
+
+    def __contains__(self, key):
+        return key in GOTurnRecord.FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in GOTurnRecord.FIELDS else default
+
+    def keys(self):
+        return GOTurnRecord.FIELDS.keys()
+
+    def to_dict(self):
+        """
+        :return: the record as a (mutable) action dictionary
+        """
+
+        return {const.TURN_NB_KEY: self.turn_nb, const.SPEAKER_TYPE_KEY: self.speaker,
+                const.DIA_ACT_KEY: self.dia_act, const.INFORM_SLOTS_KEY: dict(self.inform_slots),
+                const.REQUEST_SLOTS_KEY: dict(self.request_slots)}
+
+    def __eq__(self, other):
+        if isinstance(other, GOTurnRecord):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return GOTurnRecord, (self.turn_nb, self.speaker, self.dia_act, self.inform_slots, self.request_slots)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def create_state_segments(act_set_cardinality, slot_set_cardinality, max_nb_turns):
+    """
+    Compute the slices of the segments of the state vector of the rule-based state trackers. The segments are (in
+    this order):
+
+        - ** usr_act **: one-hot encoding of the last user action intent
+        - ** usr_inform_slots **: bag encoding of the last user action inform slots
+        - ** usr_request_slots **: bag encoding of the last user action request slots
+        - ** agt_act **: one-hot encoding of the last agent action intent
+        - ** agt_inform_slots **: bag encoding of the last agent action inform slots
+        - ** agt_request_slots **: bag encoding of the last agent action request slots
+        - ** all_inform_slots **: bag encoding of all inform slots in the dialogue so far
+        - ** turn_scaled **: the dialogue turn number scaled by 10
+        - ** turn **: one-hot encoding of the dialogue turn number
+        - ** kb_binary **: the kb querying results in a binary form, the last element for all constraints
+        - ** kb_scaled **: the kb querying results scaled by 100, the last element for all constraints
+
+    # Arguments:
+
+        - ** act_set_cardinality **: the cardinality of the act set
+        - ** slot_set_cardinality **: the cardinality of the slot set
+        - ** max_nb_turns **: the number of encoded dialogue turns
+
+    ** return **: ordered dictionary of the segment names and their slices
+    """
+
+    segment_sizes = [('usr_act', act_set_cardinality), ('usr_inform_slots', slot_set_cardinality),
+                     ('usr_request_slots', slot_set_cardinality), ('agt_act', act_set_cardinality),
+                     ('agt_inform_slots', slot_set_cardinality), ('agt_request_slots', slot_set_cardinality),
+                     ('all_inform_slots', slot_set_cardinality), ('turn_scaled', 1), ('turn', max_nb_turns),
+                     ('kb_binary', slot_set_cardinality + 1), ('kb_scaled', slot_set_cardinality + 1)]
+
+    state_segments = collections.OrderedDict()
+    offset = 0
+    for segment_name, segment_size in segment_sizes:
+        state_segments[segment_name] = slice(offset, offset + segment_size)
+        offset += segment_size
+
+    return state_segments
+
+
+def action_signature(action):
+    """
+    The signature of an action, all its encoding depends on: the intent, and the inform and the request slots without
+    their values.
+
+    # Arguments:
+
+        - ** action **: the action, a dictionary or a `GOTurnRecord`
+
+    ** return **: tuple of the intent and the frozen sets of the inform and the request slots
+    """
+
+    return (action[const.DIA_ACT_KEY], frozenset(action[const.INFORM_SLOTS_KEY]),
+            frozenset(action[const.REQUEST_SLOTS_KEY]))
 
 
 class GOStateTracker(object):
@@ -18,7 +184,8 @@ class GOStateTracker(object):
     
     # Class members:
     
-        - ** history **: list of both user and agent actions, such that they are in alternating order
+        - ** history **: list of both user and agent actions, such that they are in alternating order, as read-only
+                         `GOTurnRecord` records
         - ** act_set **: the set of all intents used in the dialogue.
         - ** slot_set **: the set of all slots used in the dialogue.
         - ** act_set_cardinality **: the cardinality of the act set.
@@ -144,9 +311,22 @@ class GORuleBasedStateTracker(GOStateTracker):
     # Class members:
         
         - ** state_dim **: the dimension of the state
+        - ** state_segments **: ordered dictionary mapping the name of every segment of the state to its slice in the
+                                state vector (see `create_state_segments`)
+        - ** state **: the last produced state vector, None before the first state of the dialogue. The next state is
+                       produced by patching only the segments changed since then.
+        - ** state_nb_actions **: the number of actions in the history when the last state was produced
+        - ** state_turn_nb **: the turn number of the last produced state
+        - ** state_nb_entity_updates **: the number of updates of the knowledge base when the last state was produced
+        - ** changed_inform_slots **: the inform slots filled or changed since the last produced state
+        - ** check_incremental_state **: debug flag, when set every patched state is checked against a full encoding
+        - ** feasible_action_encodings **: dictionary mapping the signature (see `action_signature`) of each feasible
+                                           agent action to its precomputed encoding
+        - ** cached_action_encodings **: size-bounded LRU cache of the encodings of the other (user) actions
     """
 
-    def __init__(self, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None):
+    def __init__(self, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None, check_incremental_state=False,
+                 feasible_actions=None, action_cache_size=const.DEFAULT_ACTION_ENCODING_CACHE_SIZE):
         """
         Constructor of the `GO Rule Based State Tracker` class.
         """
@@ -157,153 +337,150 @@ class GORuleBasedStateTracker(GOStateTracker):
         self.act_cardinality = len(act_set)
         self.slot_cardinality = len(slot_set)
         self.state_dim = 2 * self.act_cardinality + 7 * self.slot_cardinality + 3 + self.max_nb_turns
-
-
-    def __encode_action_intent(self, action_intent):
+        self.state_segments = create_state_segments(self.act_set_cardinality, self.slot_set_cardinality,
+                                                    self.max_nb_turns)
+
+        self.check_incremental_state = check_incremental_state
+        self.state = None
+        self.state_nb_actions = 0
+        self.state_turn_nb = 0
+        self.state_nb_entity_updates = 0
+        self.changed_inform_slots = set()
+
+        # the agent actions are the finitely many feasible actions, so all of their encodings are precomputed
+        self.feasible_action_encodings = {}
+        for feasible_action in feasible_actions or []:
+            self.feasible_action_encodings[action_signature(feasible_action)] = self.__create_action_encoding(
+                feasible_action)
+        self.cached_action_encodings = GOLRUCache(action_cache_size)
+
+    def __create_action_encoding(self, action):
         """
-        Private helper method to create one-hot encoding for the intent of the current user or agent action.
+        Private helper method to create the encoding of an action, the one-hot encoding of its intent followed by the
+        bag encodings of its inform and its request slots, as in the last user and agent action segments of the state.
 
-        :param action_intent: string, describing the intent of the user or agent action
-        :return: list in one-hot format
+        :param action: the action
+        :return: read-only array of the encoding
         """
-        logging.info('Calling `GORuleBasedStateTracker` __encode_action_intent method')
 
-        action_intent_encoding = np.zeros((1, self.act_set_cardinality))
-        action_intent_encoding[0, self.act_set[action_intent]] = 1.0
+        encoding = np.zeros(self.act_set_cardinality + 2 * self.slot_set_cardinality)
+        self.__encode_action_intent(action[const.DIA_ACT_KEY], encoding[:self.act_set_cardinality])
+        self.__encode_slots(action[const.INFORM_SLOTS_KEY],
+                            encoding[self.act_set_cardinality:self.act_set_cardinality + self.slot_set_cardinality])
+        self.__encode_slots(action[const.REQUEST_SLOTS_KEY],
+                            encoding[self.act_set_cardinality + self.slot_set_cardinality:])
 
-        logging.debug("Action intent: '{0}'".format(self.pp.pformat(action_intent)))
-        logging.debug("Encoding: '{0}'".format(self.pp.pformat(action_intent_encoding)))
-        return action_intent_encoding
+        encoding.flags.writeable = False
+        return encoding
 
-    def __encode_action_inform_slots(self, action_inform_slots):
+    def action_encoding(self, action):
         """
-        Private helper method to create bag encoding for the inform slots in the current user or agent action.
+        Method to get the encoding of an action, precomputed for the feasible agent actions, and memoized for the
+        other actions.
 
-        :param action_inform_slots: a dictionary of inform slots present in the current user or agent action
-        :return: list in bag format
+        :param action: the action
+        :return: read-only array of the encoding of the intent, the inform slots and the request slots of the action
         """
-        logging.info('Calling `GORuleBasedStateTracker` __encode_action_inform_slots method')
 
-        action_inform_slots_encoding = np.zeros((1, self.slot_set_cardinality))
-        for slot in action_inform_slots.keys():
-            action_inform_slots_encoding[0, self.slot_set[slot]] = 1.0
+        signature = action_signature(action)
 
-        logging.debug("Action inform slots: '{0}'".format(self.pp.pformat(action_inform_slots)))
-        logging.debug("Action inform slots encoding: '{0}'".format(self.pp.pformat(action_inform_slots_encoding)))
+        encoding = self.feasible_action_encodings.get(signature)
+        if encoding is None:
+            encoding = self.cached_action_encodings.get(signature)
+            if encoding is None:
+                encoding = self.__create_action_encoding(action)
+                self.cached_action_encodings.put(signature, encoding)
 
-        return action_inform_slots_encoding
+        return encoding
 
-    def __encode_action_request_slots(self, action_request_slots):
+    def __encode_action_intent(self, action_intent, encoding):
         """
-        Private helper method to create bag encoding for the request slots in the current user or agent action.
+        Private helper method to create one-hot encoding for the intent of the current user or agent action.
 
-        :param action_request_slots: a dictionary of request slots in the current user or agent action
-        :return: list in bag format
+        :param action_intent: string, describing the intent of the user or agent action
+        :param encoding: the (zeroed) segment of the state, where the one-hot encoding is written
         """
-        logging.info('Calling `GORuleBasedStateTracker` __encode_action_request_slot method')
-
-        action_request_slots_encoding = np.zeros((1, self.slot_set_cardinality))
-        for slot in action_request_slots.keys():
-            action_request_slots_encoding[0, self.slot_set[slot]] = 1.0
-
-        logging.debug("Action request slots: '{0}'".format(self.pp.pformat(action_request_slots)))
-        logging.debug("Action request slots encoding: '{0}'".format(self.pp.pformat(action_request_slots_encoding)))
+        logging.info('Calling `GORuleBasedStateTracker` __encode_action_intent method')
 
-        return action_request_slots_encoding
+        encoding[self.act_set[action_intent]] = 1.0
 
-    def __encode_all_inform_slots(self, all_inform_slots):
+    def __encode_slots(self, slots, encoding):
         """
-        Private helper method to create bag encoding for all inform slots during the dialogue.
+        Private helper method to create bag encoding for the inform or the request slots in the current user or agent
+        action, or for all inform slots during the dialogue.
 
-        :param all_inform_slots: a dictionary of all inform slots
-        :return: list in bag format
+        :param slots: a dictionary of slots
+        :param encoding: the (zeroed) segment of the state, where the bag encoding is written
         """
-        logging.info('Calling `GORuleBasedStateTracker` __encode_all_inform_slots method')
-
-        all_inform_slots_encoding = np.zeros((1, self.slot_set_cardinality))
-        for slot in all_inform_slots:
-            all_inform_slots_encoding[0, self.slot_set[slot]] = 1.0
+        logging.info('Calling `GORuleBasedStateTracker` __encode_slots method')
 
-        logging.debug("All inform slots: '{0}'".format(self.pp.pformat(all_inform_slots)))
-        logging.debug("All inform slots encoding: '{0}'".format(self.pp.pformat(all_inform_slots_encoding)))
+        for slot in slots:
+            encoding[self.slot_set[slot]] = 1.0
 
-        return all_inform_slots_encoding
-
-    def __encode_dialogue_turn_scaled(self, curr_turn_nb):
+    def __encode_dialogue_turn_scaled(self, curr_turn_nb, encoding):
         """
         Private helper method for encoding the dialogue turn number scaled by 10
 
         :param curr_turn_nb: current dialogue turn number
-        :return: one element list
+        :param encoding: the one element segment of the state, where the scaled turn number is written
         """
         logging.info('Calling `GORuleBasedStateTracker` __encode_dialogue_turn_scaled method')
 
-        scaled_turn_encoding = np.zeros((1, 1)) + curr_turn_nb / 10.
-
-        logging.debug("Current turn number: '{0}'".format(self.pp.pformat(curr_turn_nb)))
-        logging.debug("Current scaled turn number encoding: '{0}'".format(self.pp.pformat(scaled_turn_encoding)))
+        encoding[0] = curr_turn_nb / 10.
 
-        return scaled_turn_encoding
-
-    def __encode_dialogue_turn(self, curr_turn_nb):
+    def __encode_dialogue_turn(self, curr_turn_nb, encoding):
         """
         Private helper method to create one-hot encoding for the current dialogue turn
 
         :param curr_turn_nb: current dialogue turn number
-        :return: list in one-hot format
+        :param encoding: the (zeroed) segment of the state, where the one-hot encoding is written
         """
         logging.info('Calling `GORuleBasedStateTracker` __encode_dialogue_turn method')
 
-        dialogue_turn_encoding = np.zeros((1, self.max_nb_turns))
-        dialogue_turn_encoding[0, curr_turn_nb] = 1.0
-
-        logging.debug("Current turn number: '{0}'".format(self.pp.pformat(curr_turn_nb)))
-        logging.debug("Current one-hot turn number encoding: '{0}'".format(self.pp.pformat(dialogue_turn_encoding)))
-
-        return dialogue_turn_encoding
+        encoding[curr_turn_nb] = 1.0
 
-    def __encode_kb_results_scaled(self, kb_results_dict):
+    def __encode_kb_results_scaled(self, kb_results_dict, encoding):
         """
         Private helper method to create scaled counts encoding of the kb querying results
 
         :param kb_results_dict: dictionary of kb querying results
-        :return: list of scaled kb querying results
+        :param encoding: the segment of the state, where the scaled kb querying results are written
         """
         logging.info('Calling `GORuleBasedStateTracker` __encode_kb_results_scaled method')
 
-        kb_scaled_count_encoding = np.zeros((1, self.slot_set_cardinality + 1)) + kb_results_dict[
-                                                                                      'matching_all_constraints'] / 100.
+        encoding[:] = kb_results_dict[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] / 100.
         for slot in kb_results_dict:
             if slot in self.slot_set:
-                kb_scaled_count_encoding[0, self.slot_set[slot]] = kb_results_dict[slot] / 100.
+                encoding[self.slot_set[slot]] = kb_results_dict[slot] / 100.
 
-
-        logging.debug("Knowledge-Base results: '{0}'".format(self.pp.pformat(kb_results_dict)))
-        logging.debug("Scaled knowledge-Base results encoding: '{0}'".format(self.pp.pformat(kb_scaled_count_encoding)))
-
-        return kb_scaled_count_encoding
-
-    def __encode_kb_results_binary(self, kb_results_dict):
+    def __encode_kb_results_binary(self, kb_results_dict, encoding):
         """
         Private helper method to create binary encoding of the kb querying results.
 
         :param kb_results_dict: dictionary of kb querying results
-        :return: 
+        :param encoding: the segment of the state, where the binary kb querying results are written
         """
-
         logging.info('Calling `GORuleBasedStateTracker` __encode_kb_results_binary method')
-        kb_binary_count_encoding = np.zeros((1, self.slot_set_cardinality + 1)) + np.sum(
-            kb_results_dict[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] > 0.)
 
+        encoding[:] = kb_results_dict[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] > 0
         for slot in kb_results_dict:
             if slot in self.slot_set:
-                kb_binary_count_encoding[0, self.slot_set[slot]] = np.sum(kb_results_dict[slot] > 0.)
+                encoding[self.slot_set[slot]] = kb_results_dict[slot] > 0
+
+    def __fill_inform_slot(self, slot, value):
+        """
+        Private helper method to fill an inform slot in the running record, and remember the changed inform slots for
+        patching the next state.
 
+        :param slot: the inform slot
+        :param value: the value of the slot
+        """
 
-        logging.debug("Knowledge-Base results: '{0}'".format(self.pp.pformat(kb_results_dict)))
-        logging.debug("Binary knowledge-Base results encoding: '{0}'".format(self.pp.pformat(kb_binary_count_encoding)))
+        inform_slots = self.current_slots[const.INFORM_SLOTS_KEY]
+        if slot not in inform_slots or inform_slots[slot] != value:
+            self.changed_inform_slots.add(slot)
 
-        return kb_binary_count_encoding
+        inform_slots[slot] = value
 
     def __update_usr_action(self, usr_action):
         """
@@ -313,7 +490,7 @@ class GORuleBasedStateTracker(GOStateTracker):
         logging.info('Calling `GORuleBasedStateTracker` __update_usr_action method')
         # Iterate over the inform slots from the last user action and update the state tracker running record
         for slot in usr_action[const.INFORM_SLOTS_KEY].keys():
-            self.current_slots[const.INFORM_SLOTS_KEY][slot] = usr_action[const.INFORM_SLOTS_KEY][slot]
+            self.__fill_inform_slot(slot, usr_action[const.INFORM_SLOTS_KEY][slot])
             # if the current inform slot was in the requested slots in the past, delete it
             if slot in self.current_slots[const.REQUEST_SLOTS_KEY].keys():
                 del self.current_slots[const.REQUEST_SLOTS_KEY][slot]
@@ -323,15 +500,9 @@ class GORuleBasedStateTracker(GOStateTracker):
             if slot not in self.current_slots[const.REQUEST_SLOTS_KEY].keys():
                 self.current_slots[const.REQUEST_SLOTS_KEY][slot] = const.UNKNOWN_SLOT_VALUE
 
-        # Produce a record for the history and add the last user action in the history
-        new_history_record = {}
-        new_history_record[const.TURN_NB_KEY] = self.current_turn_nb
-        new_history_record[const.SPEAKER_TYPE_KEY] = const.USR_SPEAKER_VAL
-        new_history_record[const.DIA_ACT_KEY] = usr_action[const.DIA_ACT_KEY]
-        new_history_record[const.INFORM_SLOTS_KEY] = usr_action[const.INFORM_SLOTS_KEY]
-        new_history_record[const.REQUEST_SLOTS_KEY] = usr_action[const.REQUEST_SLOTS_KEY]
-
-        self.history.append(copy.deepcopy(new_history_record))
+        # Produce a (read-only) record for the history and add the last user action in the history
+        self.history.append(GOTurnRecord(self.current_turn_nb, const.USR_SPEAKER_VAL, usr_action[const.DIA_ACT_KEY],
+                                         usr_action[const.INFORM_SLOTS_KEY], usr_action[const.REQUEST_SLOTS_KEY]))
 
         # increase the turn number for one
         self.current_turn_nb += 1
@@ -344,34 +515,26 @@ class GORuleBasedStateTracker(GOStateTracker):
         """
 
         logging.info('Calling `GORuleBasedStateTracker` __update_agt_action method')
-        # Make a copy and call KB helper methods to fill in the values for the inform slots
-
-        agt_action_copy = copy.deepcopy(agt_action)
-        inform_slots_from_kb = self.kb_helper.fill_inform_slots(agt_action_copy[const.INFORM_SLOTS_KEY],
+        # Call KB helper methods to fill in the values for the inform slots, the agent action is not changed
+        inform_slots_from_kb = self.kb_helper.fill_inform_slots(agt_action[const.INFORM_SLOTS_KEY],
                                                                 self.current_slots)
 
         # Iterate over the inform slots from the KB and update the state tracker running record
         for slot in inform_slots_from_kb.keys():
             self.current_slots[const.PROPOSED_SLOT_KEY][slot] = inform_slots_from_kb[slot]
-            self.current_slots[const.INFORM_SLOTS_KEY][slot] = inform_slots_from_kb[slot]
+            self.__fill_inform_slot(slot, inform_slots_from_kb[slot])
             # if the current inform slot was in the requested slots in the past, delete it
             if slot in self.current_slots[const.REQUEST_SLOTS_KEY].keys():
                 del self.current_slots[const.REQUEST_SLOTS_KEY][slot]
 
         # Iterate over the request slots from the last agent action and update the state tracker running record
-        for slot in agt_action_copy[const.REQUEST_SLOTS_KEY].keys():
+        for slot in agt_action[const.REQUEST_SLOTS_KEY].keys():
             if slot not in self.current_slots[const.AGENT_REQUESTED_SLOT_KEY].keys():
                 self.current_slots[const.AGENT_REQUESTED_SLOT_KEY][slot] = const.UNKNOWN_SLOT_VALUE
 
-        # Produce a record for the history and add the last agent action in the history
-        new_history_record = {}
-        new_history_record[const.TURN_NB_KEY] = self.current_turn_nb
-        new_history_record[const.SPEAKER_TYPE_KEY] = const.AGT_SPEAKER_VAL
-        new_history_record[const.DIA_ACT_KEY] = agt_action_copy[const.DIA_ACT_KEY]
-        new_history_record[const.INFORM_SLOTS_KEY] = agt_action_copy[const.INFORM_SLOTS_KEY]
-        new_history_record[const.REQUEST_SLOTS_KEY] = agt_action_copy[const.REQUEST_SLOTS_KEY]
-
-        self.history.append(copy.deepcopy(new_history_record))
+        # Produce a (read-only) record for the history and add the last agent action in the history
+        self.history.append(GOTurnRecord(self.current_turn_nb, const.AGT_SPEAKER_VAL, agt_action[const.DIA_ACT_KEY],
+                                         agt_action[const.INFORM_SLOTS_KEY], agt_action[const.REQUEST_SLOTS_KEY]))
 
         # increase the turn number for one
         self.current_turn_nb += 1
@@ -407,100 +570,218 @@ class GORuleBasedStateTracker(GOStateTracker):
         # set turn number to 0
         self.current_turn_nb = 0
 
+        # the first state of the dialogue is encoded in full
+        self.state = None
+        self.changed_inform_slots = set()
+
         return True
 
-    def produce_state(self):
+    def produce_state(self, out=None):
         """
         Abstract method implementation.
         Method to produce a representation for the current dialogue state. In this rule-based state tracker it includes:
         
             - one-hot encoding of the last user and the agent action intent
             - bag encoding of the last user and the agent action inform slots
-            - bag encodi=ng of the last user and the agent action request slots
+            - bag encoding of the last user and the agent action request slots
             - bag encoding of all inform slots in the dialogue so far
             - dialogue turn number scaled by 10
             - one-hot encoding of the dialogue turn number
-            - kb querying results scaled by 100
             - kb querying results in a binary form, like present not present
-        
-        :return: list of numbers representing the current state
+            - kb querying results scaled by 100
+
+        Every encoding is written directly in its segment (see `state_segments`) of one state vector. The state is
+        kept, and the next state of the dialogue is produced by patching only the segments changed by the updates.
+
+        :param out: optional array of shape (1, state_dim) or (state_dim,), as a row of a batch, where the state is
+                    written. By default, a new array is created, such that the returned states can be kept.
+        :return: array of shape (1, state_dim) representing the current state, or `out`
         """
 
         logging.info('Calling `GORuleBasedStateTracker` produce_state method')
 
+        if self.state is None:
+            self.state = np.zeros(self.state_dim)
+            self.__encode_state(self.state)
+        else:
+            self.__patch_state(self.state)
+
+        if self.check_incremental_state:
+            full_state = np.zeros(self.state_dim)
+            self.__encode_state(full_state)
+            assert np.array_equal(self.state, full_state), \
+                "Patched state differs from the full state in: '{0}'".format(np.flatnonzero(self.state != full_state))
+
+        self.state_nb_actions = len(self.history)
+        self.state_turn_nb = self.current_turn_nb
+        self.state_nb_entity_updates = self.kb_helper.nb_entity_updates
+        self.changed_inform_slots = set()
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("State: '{0}'".format(self.pp.pformat(self.state)))
+
+        # the kept state is patched later, so a copy is returned
+        if out is None:
+            return self.state[np.newaxis, :].copy()
+
+        state = out[0] if out.ndim == 2 else out
+        state[:] = self.state
+
+        return out
+
+    def __encode_actions(self, state):
+        """
+        Private helper method to encode the last user and agent action in their (zeroed) segments of the state.
+
+        :param state: the state vector
+        """
+
+        segments = self.state_segments
+
         # get the last user and agent action
         last_usr_action = self.get_last_usr_action()
         last_agt_action = self.get_last_agt_action()
 
+        # the encodings of a missing user or agent action stay zero, the intent and the slots segments of an action
+        # are next to each other, so its encoding is copied at once
         if last_usr_action:
-            # user action intent encoding
-            usr_action_intent_encoding = self.__encode_action_intent(last_usr_action[const.DIA_ACT_KEY])
+            state[segments['usr_act'].start:segments['usr_request_slots'].stop] = self.action_encoding(last_usr_action)
 
-            # user inform slots encoding
-            usr_action_inform_slots_encoding = self.__encode_action_inform_slots(
-                last_usr_action[const.INFORM_SLOTS_KEY])
+        if last_agt_action:
+            state[segments['agt_act'].start:segments['agt_request_slots'].stop] = self.action_encoding(last_agt_action)
 
-            # user request slots encoding
-            usr_action_request_slots_encoding = self.__encode_action_request_slots(
-                last_usr_action[const.REQUEST_SLOTS_KEY])
-        else:
-            # user action intent encoding
-            usr_action_intent_encoding = np.zeros((1, self.act_set_cardinality))
+    def __encode_kb_results(self, state):
+        """
+        Private helper method to encode the kb querying results of the current inform slots in the kb segments of the
+        state.
 
-            # user inform slots encoding
-            usr_action_inform_slots_encoding = np.zeros((1, self.slot_set_cardinality))
+        :param state: the state vector
+        """
 
-            # user request slots encoding
-            usr_action_request_slots_encoding = np.zeros((1, self.slot_set_cardinality))
+        kb_results_dict = self.kb_helper.database_results_for_agent(self.current_slots)
 
-        if last_agt_action:
-            # agent action intent encoding
-            agt_action_intent_encoding = self.__encode_action_intent(last_agt_action[const.DIA_ACT_KEY])
+        # kb binary and scaled encoding
+        self.__encode_kb_results_binary(kb_results_dict, state[self.state_segments['kb_binary']])
+        self.__encode_kb_results_scaled(kb_results_dict, state[self.state_segments['kb_scaled']])
 
-            # agent inform slots encoding
-            agt_action_inform_slots_encoding = self.__encode_action_inform_slots(
-                last_agt_action[const.INFORM_SLOTS_KEY])
+    def __encode_state(self, state):
+        """
+        Private helper method to encode the whole current state.
 
-            # agent request slots encoding
-            agt_action_request_slots_encoding = self.__encode_action_request_slots(
-                last_agt_action[const.REQUEST_SLOTS_KEY])
-        else:
-            # agent action intent encoding
-            agt_action_intent_encoding = np.zeros((1, self.act_set_cardinality))
+        :param state: the (zeroed) state vector
+        """
 
-            # agent inform slots encoding
-            agt_action_inform_slots_encoding = np.zeros((1, self.slot_set_cardinality))
+        segments = self.state_segments
 
-            # agent request slots encoding
-            agt_action_request_slots_encoding = np.zeros((1, self.slot_set_cardinality))
+        self.__encode_actions(state)
 
         # all inform slots in the dialogue so far
-        all_inform_slots_encoding = self.__encode_all_inform_slots(self.current_slots[const.INFORM_SLOTS_KEY])
+        self.__encode_slots(self.current_slots[const.INFORM_SLOTS_KEY], state[segments['all_inform_slots']])
 
-        # scaled dialogue turn number encoding
-        scaled_turn_encoding = self.__encode_dialogue_turn_scaled(self.current_turn_nb)
+        # scaled and one-hot dialogue turn number encoding
+        self.__encode_dialogue_turn_scaled(self.current_turn_nb, state[segments['turn_scaled']])
+        self.__encode_dialogue_turn(self.current_turn_nb, state[segments['turn']])
 
-        # one-hot dialogue turn number encoding
-        dialogue_turn_encoding = self.__encode_dialogue_turn(self.current_turn_nb)
+        self.__encode_kb_results(state)
 
-        # TODO: create the KB helper class to query the KB
-        kb_results_dict = self.kb_helper.database_results_for_agent(self.current_slots)
+    def __patch_state(self, state):
+        """
+        Private helper method to turn the last produced state into the current state, by encoding again only the
+        segments changed since then:
+
+            - the last user and agent action segments, if there was an update
+            - the new or changed inform slots in the bag of all inform slots, which only grows during a dialogue
+            - the turn number segments, if the turn changed
+            - the kb segments, if the inform slots or the knowledge base changed
+
+        :param state: the last produced state vector
+        """
+
+        segments = self.state_segments
+
+        if self.current_turn_nb != self.state_turn_nb:
+            # the new turn is encoded first, such that a turn past the last one fails as in the full encoding, before
+            # the state is changed
+            turn_encoding = state[segments['turn']]
+            self.__encode_dialogue_turn(self.current_turn_nb, turn_encoding)
+            turn_encoding[self.state_turn_nb] = 0.
+            self.__encode_dialogue_turn_scaled(self.current_turn_nb, state[segments['turn_scaled']])
+
+        if len(self.history) != self.state_nb_actions:
+            state[segments['usr_act'].start:segments['agt_request_slots'].stop] = 0.
+            self.__encode_actions(state)
+
+        self.__encode_slots(self.changed_inform_slots, state[segments['all_inform_slots']])
+
+        if self.changed_inform_slots or self.kb_helper.nb_entity_updates != self.state_nb_entity_updates:
+            self.__encode_kb_results(state)
+
+    def __slot_indices(self, slots, segment):
+        """
+        Private helper method to find the indices of the non-zero elements of the bag encoding of slots.
+
+        :param slots: a dictionary of slots
+        :param segment: the slice of the bag encoding in the state
+        :return: sorted list of indices in the state
+        """
+
+        return sorted(segment.start + self.slot_set[slot] for slot in slots)
+
+    def produce_sparse_state(self):
+        """
+        Method to produce a sparse representation of the current dialogue state, the indices and the values of the
+        non-zero elements of the state returned by `produce_state`. Only the kb querying results are dense, all other
+        segments are one-hot or bag encodings, so the state is built without the dense vector.
+
+        :return: sorted array of the indices of the non-zero elements of the state and array of their values
+        """
+
+        logging.info('Calling `GORuleBasedStateTracker` produce_sparse_state method')
+
+        segments = self.state_segments
+
+        # get the last user and agent action
+        last_usr_action = self.get_last_usr_action()
+        last_agt_action = self.get_last_agt_action()
+
+        indices = []
+        if last_usr_action:
+            indices.append(segments['usr_act'].start + self.act_set[last_usr_action[const.DIA_ACT_KEY]])
+            indices += self.__slot_indices(last_usr_action[const.INFORM_SLOTS_KEY], segments['usr_inform_slots'])
+            indices += self.__slot_indices(last_usr_action[const.REQUEST_SLOTS_KEY], segments['usr_request_slots'])
+
+        if last_agt_action:
+            indices.append(segments['agt_act'].start + self.act_set[last_agt_action[const.DIA_ACT_KEY]])
+            indices += self.__slot_indices(last_agt_action[const.INFORM_SLOTS_KEY], segments['agt_inform_slots'])
+            indices += self.__slot_indices(last_agt_action[const.REQUEST_SLOTS_KEY], segments['agt_request_slots'])
+
+        indices += self.__slot_indices(self.current_slots[const.INFORM_SLOTS_KEY], segments['all_inform_slots'])
+        values = [1.0] * len(indices)
+
+        if self.current_turn_nb >= self.max_nb_turns:
+            raise IndexError("The turn number {0} exceeds the {1} encoded turns".format(self.current_turn_nb,
+                                                                                        self.max_nb_turns))
 
-        # kb scaled encoding
-        kb_scaled_count_encoding = self.__encode_kb_results_scaled(kb_results_dict)
+        if self.current_turn_nb != 0:
+            indices.append(segments['turn_scaled'].start)
+            values.append(self.current_turn_nb / 10.)
 
-        # kb binary encoding
-        kb_binary_count_encoding = self.__encode_kb_results_binary(kb_results_dict)
+        indices.append(segments['turn'].start + self.current_turn_nb)
+        values.append(1.0)
 
-        # stack everything in one vector
-        final_representation = np.hstack(
-            [usr_action_intent_encoding, usr_action_inform_slots_encoding, usr_action_request_slots_encoding,
-             agt_action_intent_encoding, agt_action_inform_slots_encoding, agt_action_request_slots_encoding,
-             all_inform_slots_encoding, scaled_turn_encoding, dialogue_turn_encoding, kb_binary_count_encoding,
-             kb_scaled_count_encoding])[0]
+        # the binary and the scaled kb segments are adjacent, they are encoded together and only their non-zero
+        # elements are kept
+        kb_results_dict = self.kb_helper.database_results_for_agent(self.current_slots)
+        kb_encoding = np.empty(segments['kb_scaled'].stop - segments['kb_binary'].start)
+        self.__encode_kb_results_binary(kb_results_dict, kb_encoding[:self.slot_set_cardinality + 1])
+        self.__encode_kb_results_scaled(kb_results_dict, kb_encoding[self.slot_set_cardinality + 1:])
+        kb_indices = np.flatnonzero(kb_encoding)
+
+        indices = np.concatenate([np.array(indices, dtype=np.int32),
+                                  (segments['kb_binary'].start + kb_indices).astype(np.int32)])
+        values = np.concatenate([values, kb_encoding[kb_indices]])
 
-        logging.debug("State: '{0}'".format(self.pp.pformat(final_representation)))
-        return np.array(final_representation)[np.newaxis]
+        return indices, values
 
     def update(self, action=None, speaker=None):
         """
@@ -519,31 +800,607 @@ class GORuleBasedStateTracker(GOStateTracker):
             return self.__update_agt_action(action)
 
 
+class GOBatchRuleBasedStateTracker(object):
+    """
+    Class for the Rule-Based state tracker of a batch of concurrent dialogues in the Goal-Oriented Dialogue Systems.
+    It produces the same states as one `GORuleBasedStateTracker` per dialogue, but the running records of the slots
+    are kept as arrays over all dialogues (one row per dialogue), such that the states of all dialogues are produced
+    as one matrix by a few vectorized operations.
+
+    As the state only encodes the last two actions of a dialogue, they are kept instead of the whole history.
+
+    # Class members:
+
+        - ** nb_dialogues **: the number of dialogues in the batch
+        - ** act_set **: the set of all intents used in the dialogue
+        - ** slot_set **: the set of all slots used in the dialogue
+        - ** act_set_cardinality **: the cardinality of the act set
+        - ** slot_set_cardinality **: the cardinality of the slot set
+        - ** max_nb_turns **: the maximal number of dialogue turns
+        - ** kb_helper **: the knowledge base helper class
+        - ** state_dim **: the dimension of the state
+        - ** state_segments **: ordered dictionary mapping the name of every segment of the state to its slice in the
+                                state vector (see `create_state_segments`)
+        - ** inform_mask **: boolean array of shape (nb_dialogues, slot_set_cardinality) of the filled inform slots
+        - ** request_mask **: boolean array of the same shape of the (still) requested slots
+        - ** proposed_mask **: boolean array of the same shape of the slots proposed by the agent
+        - ** agent_requested_mask **: boolean array of the same shape of the slots requested by the agent
+        - ** inform_slots **: list of the values of the filled inform slots of every dialogue, of a form {slot: value}
+        - ** proposed_slots **: list of the values of the proposed slots of every dialogue, of a form {slot: value}
+        - ** current_turn_nb **: array of the current turn number of every dialogue
+        - ** last_acts **: array of shape (2, nb_dialogues) of the intents of the last and the previous action of every
+                           dialogue, -1 for a missing action
+        - ** last_inform_masks **: boolean array of shape (2, nb_dialogues, slot_set_cardinality) of the inform slots
+                                   of the last and the previous action of every dialogue
+        - ** last_request_masks **: boolean array of the same shape of the request slots of the last and the previous
+                                    action of every dialogue
+        - ** slots **: list of the slots, ordered by their index in the slot set
+        - ** kb_counts **: array of shape (nb_dialogues, slot_set_cardinality + 1) of the kb querying results of every
+                           dialogue (see `GOKBHelper.database_results_for_agent_batch`)
+        - ** kb_stale **: boolean array of the dialogues whose inform slots changed since their kb querying results
+        - ** kb_nb_entity_updates **: the number of updates of the knowledge base when the kb querying results were
+                                      computed
+    """
+
+    def __init__(self, nb_dialogues=1, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None):
+        """
+        Constructor of the `GO Batch Rule Based State Tracker` class.
+        """
+        logging.info('Calling `GOBatchRuleBasedStateTracker` constructor')
+
+        self.nb_dialogues = nb_dialogues
+
+        # The act and slot sets
+        self.act_set = act_set
+        self.slot_set = slot_set
+
+        # The cardinality of the act and slot sets
+        self.act_set_cardinality = len(self.act_set.keys())
+        self.slot_set_cardinality = len(self.slot_set.keys())
+
+        self.max_nb_turns = max_nb_turns + 4
+
+        # the knowledge base helper class
+        self.kb_helper = kb_helper
+
+        self.state_dim = 2 * self.act_set_cardinality + 7 * self.slot_set_cardinality + 3 + self.max_nb_turns
+        self.state_segments = create_state_segments(self.act_set_cardinality, self.slot_set_cardinality,
+                                                    self.max_nb_turns)
+
+        # the running records of the slots
+        slot_masks_shape = (self.nb_dialogues, self.slot_set_cardinality)
+        self.inform_mask = np.zeros(slot_masks_shape, dtype=bool)
+        self.request_mask = np.zeros(slot_masks_shape, dtype=bool)
+        self.proposed_mask = np.zeros(slot_masks_shape, dtype=bool)
+        self.agent_requested_mask = np.zeros(slot_masks_shape, dtype=bool)
+        self.inform_slots = [{} for _ in xrange(self.nb_dialogues)]
+        self.proposed_slots = [{} for _ in xrange(self.nb_dialogues)]
+
+        self.current_turn_nb = np.zeros(self.nb_dialogues, dtype=np.int64)
+
+        # the last (row 0) and the previous (row 1) action of every dialogue
+        self.last_acts = np.full((2, self.nb_dialogues), -1, dtype=np.int64)
+        self.last_inform_masks = np.zeros((2,) + slot_masks_shape, dtype=bool)
+        self.last_request_masks = np.zeros((2,) + slot_masks_shape, dtype=bool)
+
+        self.slots = sorted(self.slot_set, key=self.slot_set.get)
+
+        # the kb querying results are computed again only for the dialogues whose inform slots changed
+        self.kb_counts = np.zeros((self.nb_dialogues, self.slot_set_cardinality + 1), dtype=np.int64)
+        self.kb_stale = np.ones(self.nb_dialogues, dtype=bool)
+        self.kb_nb_entity_updates = self.kb_helper.nb_entity_updates
+
+    def __slot_indices(self, slots):
+        """
+        Private helper method to find the indices of slots in the slot set.
+
+        :param slots: a dictionary of slots
+        :return: list of the indices of the slots
+        """
+
+        return [self.slot_set[slot] for slot in slots]
+
+    def __update_last_action(self, dialogue_idx, action):
+        """
+        Private helper method to make the last action of a dialogue the previous one, and record a new last action.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :param action: the new last action
+        """
+
+        self.last_acts[1, dialogue_idx] = self.last_acts[0, dialogue_idx]
+        self.last_inform_masks[1, dialogue_idx] = self.last_inform_masks[0, dialogue_idx]
+        self.last_request_masks[1, dialogue_idx] = self.last_request_masks[0, dialogue_idx]
+
+        self.last_acts[0, dialogue_idx] = self.act_set[action[const.DIA_ACT_KEY]]
+        self.last_inform_masks[0, dialogue_idx] = False
+        self.last_inform_masks[0, dialogue_idx, self.__slot_indices(action[const.INFORM_SLOTS_KEY])] = True
+        self.last_request_masks[0, dialogue_idx] = False
+        self.last_request_masks[0, dialogue_idx, self.__slot_indices(action[const.REQUEST_SLOTS_KEY])] = True
+
+    def __fill_inform_slots(self, dialogue_idx, inform_slots):
+        """
+        Private helper method to fill inform slots of a dialogue, the kb querying results of the dialogue are stale
+        if any of the values changed.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :param inform_slots: the inform slots of a form {slot: value}
+        """
+
+        current_inform_slots = self.inform_slots[dialogue_idx]
+        for slot, value in inform_slots.iteritems():
+            if slot not in current_inform_slots or current_inform_slots[slot] != value:
+                current_inform_slots[slot] = value
+                self.kb_stale[dialogue_idx] = True
+
+    def __update_usr_action(self, dialogue_idx, usr_action):
+        """
+        Private helper method to update a dialogue with the last user action, as `GORuleBasedStateTracker` does.
+        """
+
+        logging.info('Calling `GOBatchRuleBasedStateTracker` __update_usr_action method')
+
+        # the filled inform slots are no longer requested
+        self.__fill_inform_slots(dialogue_idx, usr_action[const.INFORM_SLOTS_KEY])
+        inform_indices = self.__slot_indices(usr_action[const.INFORM_SLOTS_KEY])
+        self.inform_mask[dialogue_idx, inform_indices] = True
+        self.request_mask[dialogue_idx, inform_indices] = False
+
+        self.request_mask[dialogue_idx, self.__slot_indices(usr_action[const.REQUEST_SLOTS_KEY])] = True
+
+        self.__update_last_action(dialogue_idx, usr_action)
+        self.current_turn_nb[dialogue_idx] += 1
+
+        return True
+
+    def __update_agt_action(self, dialogue_idx, agt_action):
+        """
+        Private helper method to update a dialogue with the last agent action, as `GORuleBasedStateTracker` does.
+        """
+
+        logging.info('Calling `GOBatchRuleBasedStateTracker` __update_agt_action method')
+
+        # Call KB helper methods to fill in the values for the inform slots, the agent action is not changed
+        inform_slots_from_kb = self.kb_helper.fill_inform_slots(agt_action[const.INFORM_SLOTS_KEY],
+                                                                self.get_current_slots(dialogue_idx))
+
+        # the proposed slots are filled inform slots, which are no longer requested
+        self.proposed_slots[dialogue_idx].update(inform_slots_from_kb)
+        self.__fill_inform_slots(dialogue_idx, inform_slots_from_kb)
+        inform_indices = self.__slot_indices(inform_slots_from_kb)
+        self.proposed_mask[dialogue_idx, inform_indices] = True
+        self.inform_mask[dialogue_idx, inform_indices] = True
+        self.request_mask[dialogue_idx, inform_indices] = False
+
+        self.agent_requested_mask[dialogue_idx, self.__slot_indices(agt_action[const.REQUEST_SLOTS_KEY])] = True
+
+        self.__update_last_action(dialogue_idx, agt_action)
+        self.current_turn_nb[dialogue_idx] += 1
+
+        return True
+
+    def get_state_dimension(self):
+        """
+
+        :return: the dimension of the state
+        """
+
+        return self.state_dim
+
+    def get_current_slots(self, dialogue_idx):
+        """
+        Method to get the running record of the slots of one dialogue, in the form kept by `GORuleBasedStateTracker`.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :return: dictionary of the inform, request, proposed and agent requested slots of the dialogue
+        """
+
+        return {const.INFORM_SLOTS_KEY: dict(self.inform_slots[dialogue_idx]),
+                const.REQUEST_SLOTS_KEY: {self.slots[idx]: const.UNKNOWN_SLOT_VALUE
+                                          for idx in np.flatnonzero(self.request_mask[dialogue_idx])},
+                const.PROPOSED_SLOT_KEY: dict(self.proposed_slots[dialogue_idx]),
+                const.AGENT_REQUESTED_SLOT_KEY: {self.slots[idx]: const.UNKNOWN_SLOT_VALUE
+                                                 for idx in np.flatnonzero(self.agent_requested_mask[dialogue_idx])}}
+
+    def reset(self, dialogue_indices=None):
+        """
+        Method to reset dialogues of the batch tracker.
+
+        :param dialogue_indices: list of the indices of the dialogues to reset, all dialogues by default
+        :return: true if the resetting was successful, false otherwise
+        """
+
+        logging.info('Calling `GOBatchRuleBasedStateTracker` reset method')
+
+        if dialogue_indices is None:
+            dialogue_indices = range(self.nb_dialogues)
+
+        for dialogue_idx in dialogue_indices:
+            self.inform_slots[dialogue_idx] = {}
+            self.proposed_slots[dialogue_idx] = {}
+
+        for slot_mask in [self.inform_mask, self.request_mask, self.proposed_mask, self.agent_requested_mask]:
+            slot_mask[dialogue_indices] = False
+
+        self.current_turn_nb[dialogue_indices] = 0
+
+        self.last_acts[:, dialogue_indices] = -1
+        self.last_inform_masks[:, dialogue_indices] = False
+        self.last_request_masks[:, dialogue_indices] = False
+
+        self.kb_stale[dialogue_indices] = True
+
+        return True
+
+    def produce_state(self, out=None):
+        """
+        Method to produce the representation of the current states of all dialogues, the same representation as
+        produced by `GORuleBasedStateTracker.produce_state`. Every segment is written for all dialogues at once, and
+        the kb querying results of the dialogues whose inform slots changed come from one batch query.
+
+        :param out: optional array of shape (nb_dialogues, state_dim), where the states are written
+        :return: float32 array of shape (nb_dialogues, state_dim) with the state of every dialogue in a row, or `out`
+        """
+
+        logging.info('Calling `GOBatchRuleBasedStateTracker` produce_state method')
+
+        if out is None:
+            out = np.zeros((self.nb_dialogues, self.state_dim), dtype=np.float32)
+        else:
+            out.fill(0.)
+
+        segments = self.state_segments
+        dialogues = np.arange(self.nb_dialogues)
+
+        # the last action is encoded in the user segments and the previous one in the agent segments, the encodings
+        # of a missing action stay zero
+        for order, speaker in enumerate([const.USR_SPEAKER_VAL, const.AGT_SPEAKER_VAL]):
+            has_act = self.last_acts[order] >= 0
+            out[dialogues[has_act], segments[speaker + '_act'].start + self.last_acts[order, has_act]] = 1.0
+            out[:, segments[speaker + '_inform_slots']] = self.last_inform_masks[order]
+            out[:, segments[speaker + '_request_slots']] = self.last_request_masks[order]
+
+        # all inform slots in the dialogue so far
+        out[:, segments['all_inform_slots']] = self.inform_mask
+
+        # scaled and one-hot dialogue turn number encoding
+        out[:, segments['turn_scaled'].start] = self.current_turn_nb / 10.
+        out[dialogues, segments['turn'].start + self.current_turn_nb] = 1.0
+
+        # all of the results are stale after an update of the knowledge base
+        if self.kb_helper.nb_entity_updates != self.kb_nb_entity_updates:
+            self.kb_stale[:] = True
+            self.kb_nb_entity_updates = self.kb_helper.nb_entity_updates
+
+        stale_dialogues = np.flatnonzero(self.kb_stale)
+        if len(stale_dialogues) > 0:
+            self.kb_counts[stale_dialogues] = self.kb_helper.database_results_for_agent_batch(
+                [{const.INFORM_SLOTS_KEY: self.inform_slots[dialogue_idx]} for dialogue_idx in stale_dialogues],
+                self.slot_set)
+            self.kb_stale[:] = False
+
+        # kb binary and scaled encoding
+        out[:, segments['kb_binary']] = self.kb_counts > 0
+        out[:, segments['kb_scaled']] = self.kb_counts / 100.
+
+        return out
+
+    def update(self, dialogue_idx, action=None, speaker=None):
+        """
+        Method to update a dialogue of the batch with the last user or agent action.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :param action: the last action
+        :param speaker: the speaker of the action, `USR_SPEAKER_VAL` or `AGT_SPEAKER_VAL`
+        :return: true if the update was successful, false otherwise
+        """
+
+        logging.info('Calling `GOBatchRuleBasedStateTracker` update method')
+        # the function should be called properly
+        assert (action and speaker)
+
+        if speaker == const.USR_SPEAKER_VAL:
+            return self.__update_usr_action(dialogue_idx, action)
+        else:
+            return self.__update_agt_action(dialogue_idx, action)
+
+    def update_batch(self, dialogue_indices, actions, speakers):
+        """
+        Method to update dialogues of the batch with their last actions.
+
+        :param dialogue_indices: list of the indices of the updated dialogues
+        :param actions: list of the last action of every updated dialogue
+        :param speakers: list of the speaker of every action
+        :return: true if the update was successful, false otherwise
+        """
+
+        for dialogue_idx, action, speaker in zip(dialogue_indices, actions, speakers):
+            self.update(dialogue_idx, action, speaker)
+
+        return True
+
+
+class GOBatchModelBasedStateTracker(object):
+    """
+    Class for the Model-Based state tracker of a batch of concurrent dialogues in the Goal-Oriented Dialogue Systems.
+    A recurrent model (`GOGRUModel`) updates the hidden state of a dialogue with every user and agent action, and the
+    state of a dialogue is its hidden state followed by the kb querying results of its inform slots, encoded as in the
+    rule-based state.
+
+    The input of an action is the one-hot encoding of its intent, the bag encodings of its inform and its request
+    slots, and one element set for the agent actions. The input projections are memoized per action signature and
+    speaker, so one update of the batch costs one matrix product per gate, without any encoding.
+
+    # Class members:
+
+        - ** nb_dialogues **: the number of dialogues in the batch
+        - ** act_set **: the set of all intents used in the dialogue
+        - ** slot_set **: the set of all slots used in the dialogue
+        - ** act_set_cardinality **: the cardinality of the act set
+        - ** slot_set_cardinality **: the cardinality of the slot set
+        - ** max_nb_turns **: the maximal number of dialogue turns
+        - ** kb_helper **: the knowledge base helper class
+        - ** model **: the recurrent model
+        - ** state_dim **: the dimension of the state
+        - ** state_segments **: ordered dictionary mapping the name of every segment of the state (`hidden`,
+                                `kb_binary` and `kb_scaled`) to its slice in the state vector
+        - ** hidden **: array of shape (nb_dialogues, hidden_size) of the hidden state of every dialogue
+        - ** current_slots **: list of the running records of the slots of every dialogue, as in the rule-based tracker
+        - ** current_turn_nb **: array of the current turn number of every dialogue
+        - ** cached_input_projections **: size-bounded LRU cache of the input projections of the actions
+    """
+
+    def __init__(self, nb_dialogues=1, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None, model=None,
+                 projection_cache_size=const.DEFAULT_ACTION_ENCODING_CACHE_SIZE):
+        """
+        Constructor of the `GO Batch Model Based State Tracker` class.
+        """
+        logging.info('Calling `GOBatchModelBasedStateTracker` constructor')
+
+        self.nb_dialogues = nb_dialogues
+
+        # The act and slot sets
+        self.act_set = act_set
+        self.slot_set = slot_set
+
+        # The cardinality of the act and slot sets
+        self.act_set_cardinality = len(self.act_set.keys())
+        self.slot_set_cardinality = len(self.slot_set.keys())
+
+        self.max_nb_turns = max_nb_turns + 4
+
+        # the knowledge base helper class
+        self.kb_helper = kb_helper
+
+        self.model = model
+        input_dim = self.act_set_cardinality + 2 * self.slot_set_cardinality + 1
+        if self.model.input_dim != input_dim:
+            raise Exception("The model input dimension '{0}' is not the action encoding dimension '{1}'".format(
+                self.model.input_dim, input_dim))
+
+        self.state_segments = collections.OrderedDict()
+        self.state_segments['hidden'] = slice(0, self.model.hidden_size)
+        self.state_segments['kb_binary'] = slice(self.model.hidden_size,
+                                                 self.model.hidden_size + self.slot_set_cardinality + 1)
+        self.state_segments['kb_scaled'] = slice(self.state_segments['kb_binary'].stop,
+                                                 self.state_segments['kb_binary'].stop + self.slot_set_cardinality + 1)
+        self.state_dim = self.state_segments['kb_scaled'].stop
+
+        self.hidden = self.model.initial_hidden(self.nb_dialogues)
+        self.current_slots = [None] * self.nb_dialogues
+        self.current_turn_nb = np.zeros(self.nb_dialogues, dtype=np.int64)
+
+        self.cached_input_projections = GOLRUCache(projection_cache_size)
+
+        self.reset()
+
+    def __input_projection(self, action, speaker):
+        """
+        Private helper method to get the (memoized) projection of the input of an action.
+
+        :param action: the action
+        :param speaker: the speaker of the action
+        :return: array of shape (3 * hidden_size,)
+        """
+
+        signature = (speaker, action_signature(action))
+
+        input_projection = self.cached_input_projections.get(signature)
+        if input_projection is None:
+            inform_offset = self.act_set_cardinality
+            request_offset = self.act_set_cardinality + self.slot_set_cardinality
+
+            input_indices = [self.act_set[action[const.DIA_ACT_KEY]]]
+            input_indices.extend(inform_offset + self.slot_set[slot] for slot in action[const.INFORM_SLOTS_KEY])
+            input_indices.extend(request_offset + self.slot_set[slot] for slot in action[const.REQUEST_SLOTS_KEY])
+            if speaker == const.AGT_SPEAKER_VAL:
+                input_indices.append(self.model.input_dim - 1)
+
+            input_projection = self.model.input_projection(input_indices)
+            self.cached_input_projections.put(signature, input_projection)
+
+        return input_projection
+
+    def __update_slots(self, dialogue_idx, action, speaker):
+        """
+        Private helper method to update the running record of the slots of a dialogue, as the rule-based tracker does.
+        The values of the inform slots of the agent are filled from the knowledge base.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :param action: the last action
+        :param speaker: the speaker of the action
+        """
+
+        current_slots = self.current_slots[dialogue_idx]
+
+        if speaker == const.USR_SPEAKER_VAL:
+            inform_slots = action[const.INFORM_SLOTS_KEY]
+            requested_slots = current_slots[const.REQUEST_SLOTS_KEY]
+        else:
+            inform_slots = self.kb_helper.fill_inform_slots(action[const.INFORM_SLOTS_KEY], current_slots)
+            current_slots[const.PROPOSED_SLOT_KEY].update(inform_slots)
+            requested_slots = current_slots[const.AGENT_REQUESTED_SLOT_KEY]
+
+        # the filled inform slots are no longer requested
+        current_slots[const.INFORM_SLOTS_KEY].update(inform_slots)
+        for slot in inform_slots:
+            current_slots[const.REQUEST_SLOTS_KEY].pop(slot, None)
+
+        for slot in action[const.REQUEST_SLOTS_KEY]:
+            requested_slots.setdefault(slot, const.UNKNOWN_SLOT_VALUE)
+
+    def get_state_dimension(self):
+        """
+
+        :return: the dimension of the state
+        """
+
+        return self.state_dim
+
+    def get_current_slots(self, dialogue_idx):
+        """
+        :param dialogue_idx: the index of the dialogue in the batch
+        :return: the running record of the slots of the dialogue
+        """
+
+        return self.current_slots[dialogue_idx]
+
+    def reset(self, dialogue_indices=None):
+        """
+        Method to reset dialogues of the batch tracker.
+
+        :param dialogue_indices: list of the indices of the dialogues to reset, all dialogues by default
+        :return: true if the resetting was successful, false otherwise
+        """
+
+        logging.info('Calling `GOBatchModelBasedStateTracker` reset method')
+
+        if dialogue_indices is None:
+            dialogue_indices = range(self.nb_dialogues)
+
+        for dialogue_idx in dialogue_indices:
+            self.current_slots[dialogue_idx] = {const.INFORM_SLOTS_KEY: {}, const.REQUEST_SLOTS_KEY: {},
+                                                const.PROPOSED_SLOT_KEY: {}, const.AGENT_REQUESTED_SLOT_KEY: {}}
+
+        self.hidden[dialogue_indices] = 0.
+        self.current_turn_nb[dialogue_indices] = 0
+
+        return True
+
+    def update_batch(self, dialogue_indices, actions, speakers):
+        """
+        Method to update dialogues of the batch with their last actions, with one step of the model for all of them.
+
+        :param dialogue_indices: list of the (distinct) indices of the updated dialogues
+        :param actions: list of the last action of every updated dialogue
+        :param speakers: list of the speaker of every action
+        :return: true if the update was successful, false otherwise
+        """
+
+        logging.info('Calling `GOBatchModelBasedStateTracker` update_batch method')
+
+        if len(dialogue_indices) == 0:
+            return True
+
+        for dialogue_idx, action, speaker in zip(dialogue_indices, actions, speakers):
+            self.__update_slots(dialogue_idx, action, speaker)
+
+        input_projections = np.array([self.__input_projection(action, speaker)
+                                      for action, speaker in zip(actions, speakers)])
+        self.hidden[dialogue_indices] = self.model.step(input_projections, self.hidden[dialogue_indices])
+        self.current_turn_nb[dialogue_indices] += 1
+
+        return True
+
+    def update(self, dialogue_idx, action=None, speaker=None):
+        """
+        Method to update a dialogue of the batch with the last user or agent action.
+
+        :param dialogue_idx: the index of the dialogue in the batch
+        :param action: the last action
+        :param speaker: the speaker of the action, `USR_SPEAKER_VAL` or `AGT_SPEAKER_VAL`
+        :return: true if the update was successful, false otherwise
+        """
+
+        # the function should be called properly
+        assert (action and speaker)
+
+        return self.update_batch([dialogue_idx], [action], [speaker])
+
+    def produce_state(self, out=None):
+        """
+        Method to produce the representation of the current states of all dialogues: the hidden state of the model,
+        the kb querying results in a binary form and the kb querying results scaled by 100.
+
+        :param out: optional array of shape (nb_dialogues, state_dim), where the states are written
+        :return: float32 array of shape (nb_dialogues, state_dim) with the state of every dialogue in a row, or `out`
+        """
+
+        logging.info('Calling `GOBatchModelBasedStateTracker` produce_state method')
+
+        if out is None:
+            out = np.empty((self.nb_dialogues, self.state_dim), dtype=np.float32)
+
+        kb_counts = self.kb_helper.database_results_for_agent_batch(self.current_slots, self.slot_set)
+
+        out[:, self.state_segments['hidden']] = self.hidden
+        out[:, self.state_segments['kb_binary']] = kb_counts > 0
+        out[:, self.state_segments['kb_scaled']] = kb_counts / 100.
+
+        return out
+
+
 class GOModelBasedStateTracker(GOStateTracker):
     """
     Class for Model-Based state tracker in the Goal-Oriented Dialogue Systems.
-    Extends the `GOStateTracker` class.
+    Extends the `GOStateTracker` class. It tracks one dialogue with a `GOBatchModelBasedStateTracker` of one dialogue.
     
     # Class members:
     
-        - ** model_path **: the path to save or load the model
+        - ** model_path **: the path to the `.npz` file of the weights of the model
+        - ** batch_state_tracker **: the tracker of the dialogue
     """
 
-    def __init__(self, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None, model_path=None):
+    def __init__(self, act_set=None, slot_set=None, max_nb_turns=None, kb_helper=None, model_path=None, model=None):
         super(GOModelBasedStateTracker, self).__init__(act_set, slot_set, max_nb_turns, kb_helper)
 
         logging.info('Calling `GOModelBasedStateTracker` constructor')
 
-        self.state_dim = 0 # TODO: calculate when implemented
         self.model_path = model_path
+        if model is None:
+            model = GOGRUModel.load(model_path)
 
-    def __update_usr_action(self, usr_action):
-        # TODO
-        raise NotImplementedError()
+        self.batch_state_tracker = GOBatchModelBasedStateTracker(1, act_set, slot_set, max_nb_turns, kb_helper, model)
+        self.state_dim = self.batch_state_tracker.get_state_dimension()
+        self.current_slots = self.batch_state_tracker.get_current_slots(0)
 
-    def __update_agt_action(self, agt_action):
-        # TODO
-        raise NotImplementedError()
+    def __update_action(self, action, speaker):
+        """
+        Private helper method to update the state tracker with the last user or agent action.
+
+        :param action: the last action
+        :param speaker: the speaker of the action
+        :return: true if the update was successful, false otherwise
+        """
+
+        self.batch_state_tracker.update(0, action, speaker)
+
+        # Produce a (read-only) record for the history and add the last action in the history
+        self.history.append(GOTurnRecord(self.current_turn_nb, speaker, action[const.DIA_ACT_KEY],
+                                         action[const.INFORM_SLOTS_KEY], action[const.REQUEST_SLOTS_KEY]))
+
+        # increase the turn number for one
+        self.current_turn_nb += 1
+
+        return True
+
+    def get_state_dimension(self):
+        """
+
+        :return: the dimension of the state
+        """
+
+        return self.state_dim
 
     def reset(self):
         """
@@ -552,13 +1409,37 @@ class GOModelBasedStateTracker(GOStateTracker):
         :return: true if the resetting was successful, false otherwise
         """
 
-        # TODO
-        raise NotImplementedError()
+        logging.info('Calling `GOModelBasedStateTracker` reset method')
 
-    def produce_state(self):
-        # TODO
-        raise NotImplementedError()
+        self.history = []
+        self.current_turn_nb = 0
+
+        self.batch_state_tracker.reset()
+        self.current_slots = self.batch_state_tracker.get_current_slots(0)
+
+        return True
+
+    def produce_state(self, out=None):
+        """
+        Abstract method implementation.
+        Method to produce a representation for the current dialogue state: the hidden state of the model and the kb
+        querying results (see `GOBatchModelBasedStateTracker.produce_state`).
+
+        :param out: optional array of shape (1, state_dim), where the state is written
+        :return: float32 array of shape (1, state_dim) representing the current state, or `out`
+        """
+
+        logging.info('Calling `GOModelBasedStateTracker` produce_state method')
+
+        return self.batch_state_tracker.produce_state(out)
 
     def update(self, action=None, speaker=""):
-        # TODO
-        raise NotImplementedError()
+        """
+        Abstract method implementation
+        """
+
+        logging.info('Calling `GOModelBasedStateTracker` update method')
+        # the function should be called properly
+        assert (action and speaker)
+
+        return self.__update_action(action, speaker)
@@ -7,13 +7,162 @@ A Python file
 from core import constants as const
 
 import core.dst.state_tracker as state_trackers
+from core.dst.model import GOGRUModel
 import core.user.users as users
 
 from nlp.nlu.nlu import nlu
 from nlp.nlg.nlg import nlg
 
 from rl.core import Env
-import logging
+import numpy as np
+import copy, logging
+
+
+def create_user(params, simulation_mode=None, goal_set=None, max_nb_turns=None, slot_set=None, act_set=None,
+                init_inform_slots=None, ultimate_request_slot=None):
+    """
+    Create a user of the type given in the parameters.
+
+    # Arguments:
+
+        - ** params **: the parameters, having the type of the user
+        - ** simulation_mode **: the mode of the simulation, semantic frame or natural language sentences
+        - ** goal_set **: the set of the user goals
+        - ** max_nb_turns **: the maximal number of allowed dialogue turns
+        - ** slot_set **: the set of all dialogue slots
+        - ** act_set **: the set of all dialogue acts
+        - ** init_inform_slots **: list of initial inform slots
+        - ** ultimate_request_slot **: the slot that is the actual goal of the user
+
+    ** return **: the newly created user
+    """
+
+    user = None
+
+    user_type_str = params[const.USER_TYPE_KEY]
+
+    if user_type_str == const.RULE_BASED_USER:
+        user = users.GORuleBasedUser(simulation_mode=simulation_mode, goal_set=goal_set,
+                                     max_nb_turns=max_nb_turns, slot_set=slot_set,
+                                     act_set=act_set, init_inform_slots=init_inform_slots,
+                                     ultimate_request_slot=ultimate_request_slot)
+    elif user_type_str == const.MODEL_BASED_USER:
+        user_path = params[const.MODEL_BASED_USER_PATH_KEY]
+        user = users.GOModelBasedUser(simulation_mode, goal_set, slot_set, act_set, user_path)
+    elif user_type_str == const.REAL_USER:
+        user = users.GORealUser(goal_set)
+    else:
+        raise Exception()
+
+    return user
+
+
+def create_nlu_unit(nlu_path):
+    """
+    Create an NLU unit.
+
+    # Arguments:
+
+        - ** nlu_path **: the path to the nlu model
+
+    ** return **: the newly created NLU unit
+    """
+
+    nlu_unit = nlu()
+    nlu_unit.load_nlu_model(nlu_path)
+
+    return nlu_unit
+
+
+def create_nlg_unit(nlg_path, diaact_nl_pairs_path):
+    """
+    Create an NLG unit.
+
+    # Arguments:
+
+        - ** nlg_path **: the path to the nlg model
+        - ** diaact_nl_pairs_path **: the path to the predefined dialogue act and sentence pairs
+
+    ** return **: the newly created NLG unit
+    """
+
+    nlg_unit = nlg()
+    nlg_unit.load_nlg_model(nlg_path)
+    nlg_unit.load_predefine_act_nl_pairs(diaact_nl_pairs_path)
+
+    return nlg_unit
+
+
+def process_usr_action(usr_action, simulation_mode, nlu_unit, nlg_unit):
+    """
+    Process a user action: add its natural language representation, and in the natural language simulation mode
+    replace it by the dialogue act understood from the sentence.
+
+    # Arguments:
+
+        - ** usr_action **: the user action to be processed
+        - ** simulation_mode **: the mode of the simulation, semantic frame or natural language sentences
+        - ** nlu_unit **: the NLU unit
+        - ** nlg_unit **: the NLG unit
+
+    ** return **: processed user action
+    """
+
+    # by default add NL representation to the user action
+    user_nlg_sentence = nlg_unit.convert_diaact_to_nl(usr_action, const.USR_SPEAKER_VAL)
+    usr_action[const.NL_KEY] = user_nlg_sentence
+
+    # if the simulation mode is on Natural Language level, generate new user action
+    if simulation_mode == const.NL_SIMULATION_MODE:
+        user_nlu_res = nlu_unit.generate_dia_act(usr_action[const.NL_KEY])
+        usr_action.update(user_nlu_res)
+
+    return usr_action
+
+
+def process_agt_action(agt_action, nlg_unit):
+    """
+    Process an agent action: add its natural language representation.
+
+    # Arguments:
+
+        - ** agt_action **: the agent action to be processed
+        - ** nlg_unit **: the NLG unit
+
+    ** return **: processed agent action
+    """
+
+    # add NL representation to the agent action
+    agent_nlg_sentence = nlg_unit.convert_diaact_to_nl(agt_action, const.AGT_SPEAKER_VAL)
+    agt_action[const.NL_KEY] = agent_nlg_sentence
+
+    return agt_action
+
+
+def user_turn(user, agt_action, simulation_mode, nlu_unit, nlg_unit):
+    """
+    Present the processed agent action to the user, and process the response of the user if the dialogue goes on. It
+    is the turn of one dialogue, shared by the `GOEnv` and the `GOVecEnv`, which register the actions with their state
+    trackers.
+
+    # Arguments:
+
+        - ** user **: the user of the dialogue
+        - ** agt_action **: the processed agent action
+        - ** simulation_mode **: the mode of the simulation, semantic frame or natural language sentences
+        - ** nlu_unit **: the NLU unit
+        - ** nlg_unit **: the NLG unit
+
+    ** return **: the processed user action (None if the user terminated the dialogue), the done flag and the status
+                  of the dialogue
+    """
+
+    # the user signals if she reached the goal
+    new_user_action, done, dialogue_status = user.step(agt_action)
+    if done:
+        return None, done, dialogue_status
+
+    return process_usr_action(new_user_action, simulation_mode, nlu_unit, nlg_unit), done, dialogue_status
 
 
 class GOEnv(Env):
@@ -115,25 +264,8 @@ class GOEnv(Env):
         """
         logging.info('Calling `GOEnv` __create_user method')
 
-        user = None
-
-        user_type_str = params[const.USER_TYPE_KEY]
-
-        if user_type_str == const.RULE_BASED_USER:
-            user = users.GORuleBasedUser(simulation_mode=self.simulation_mode, goal_set=self.goal_set,
-                                         max_nb_turns=self.max_nb_turns, slot_set=self.slot_set,
-                                         act_set=self.act_set, init_inform_slots=self.init_inform_slots,
-                                         ultimate_request_slot=self.ultimate_request_slot)
-        elif user_type_str == const.MODEL_BASED_USER:
-            user_path = params[const.MODEL_BASED_USER_PATH_KEY]
-            user = users.GOModelBasedUser(self.simulation_mode, self.goal_set, self.slot_set,
-                                          self.act_set, user_path)
-        elif user_type_str == const.REAL_USER:
-            user = users.GORealUser(self.goal_set)
-        else:
-            raise Exception()
-
-        return user
+        return create_user(params, self.simulation_mode, self.goal_set, self.max_nb_turns, self.slot_set, self.act_set,
+                           self.init_inform_slots, self.ultimate_request_slot)
 
     def __create_state_tracker(self, params):
         """
@@ -151,7 +283,8 @@ class GOEnv(Env):
         dst_type_str = params[const.STATE_TRACKER_TYPE_KEY]
         if dst_type_str == const.RULE_BASED_STATE_TRACKER:
             state_tracker = state_trackers.GORuleBasedStateTracker(self.act_set, self.slot_set, self.max_nb_turns,
-                                                                   self.kb_helper)
+                                                                   self.kb_helper,
+                                                                   feasible_actions=self.feasible_actions)
         elif dst_type_str == const.MODEL_BASED_STATE_TRACKER:
             dst_path = params[const.MODEL_BASED_STATE_TRACKER_PATH_KEY]
             state_tracker = state_trackers.GOModelBasedStateTracker(self.act_set, self.slot_set, self.max_nb_turns,
@@ -169,10 +302,7 @@ class GOEnv(Env):
         """
         logging.info('Calling `GOEnv` __create_nlu_unit method')
 
-        nlu_unit = nlu()
-        nlu_unit.load_nlu_model(self.nlu_path)
-
-        return nlu_unit
+        return create_nlu_unit(self.nlu_path)
 
     def __create_nlg_unit(self):
         """
@@ -182,11 +312,7 @@ class GOEnv(Env):
         """
         logging.info('Calling `GOEnv` __create_nlg_unit method')
 
-        nlg_unit = nlg()
-        nlg_unit.load_nlg_model(self.nlg_path)
-        nlg_unit.load_predefine_act_nl_pairs(self.diaact_nl_pairs_path)
-
-        return nlg_unit
+        return create_nlg_unit(self.nlg_path, self.diaact_nl_pairs_path)
 
     def __process_usr_action(self, usr_action):
         """
@@ -197,16 +323,7 @@ class GOEnv(Env):
         """
         logging.info('Calling `GOEnv`  __process_usr_action method')
 
-        # by default add NL representation to the user action
-        user_nlg_sentence = self.nlg_unit.convert_diaact_to_nl(usr_action, const.USR_SPEAKER_VAL)
-        usr_action[const.NL_KEY] = user_nlg_sentence
-
-        # if the simulation mode is on Natural Language level, generate new user action
-        if self.simulation_mode == const.NL_SIMULATION_MODE:
-            user_nlu_res = self.nlu_unit.generate_dia_act(usr_action[const.NL_KEY])
-            usr_action.update(user_nlu_res)
-
-        return usr_action
+        return process_usr_action(usr_action, self.simulation_mode, self.nlu_unit, self.nlg_unit)
 
     def __process_agt_action(self, agt_action):
         """
@@ -217,11 +334,7 @@ class GOEnv(Env):
         """
         logging.info('Calling `GOEnv`  __process_agt_action method')
 
-        # add NL representation to the agent action
-        agent_nlg_sentence = self.nlg_unit.convert_diaact_to_nl(agt_action, const.AGT_SPEAKER_VAL)
-        agt_action[const.NL_KEY] = agent_nlg_sentence
-
-        return agt_action
+        return process_agt_action(agt_action, self.nlg_unit)
 
     def get_state_dimension(self):
         """
@@ -289,26 +402,22 @@ class GOEnv(Env):
         #   CALL USER TO TAKE HER TURN
         ########################################################################
 
-        # get the new user action and the dialogue status
-        # The user signals if she reached the goal
-        new_user_action, done, dialogue_status = self.user.step(proc_agt_action)
+        # get the new (processed) user action and the dialogue status
+        proc_new_user_action, done, dialogue_status = user_turn(self.user, proc_agt_action, self.simulation_mode,
+                                                                self.nlu_unit, self.nlg_unit)
         reward = self.reward_function(dialogue_status)
 
-        # if the user terminated the conversation
-        if done:
-            new_state = self.state_tracker.produce_state()
-        else:
+        # if the user did not terminate the conversation
+        if not done:
             # increase the dialogue turn number
             self.current_turn_nb += 1
-            # process the new user action
-            proc_new_user_action = self.__process_usr_action(new_user_action)
             # update the state tracker with the new user action
             self.state_tracker.update(proc_new_user_action, const.USR_SPEAKER_VAL)
-            # produce new state for the
-            new_state = self.state_tracker.produce_state()
 
+        # produce new state for the agent
+        new_state = self.state_tracker.produce_state()
 
-        info = {}
+        info = {const.DIALOGUE_STATUS_KEY: dialogue_status}
         return new_state, reward, done, info
 
     def reset(self):
@@ -353,3 +462,214 @@ class GOEnv(Env):
     def configure(self, *args, **kwargs):
         # TODO
         raise NotImplementedError()
+
+
+class GOVecEnv(object):
+    """
+    The Environment stepping a batch of dialogues in lockstep, each one with its own user. The dialogues are tracked by
+    one batch state tracker, so the states of all dialogues are produced at once, with one batch kb query, and the
+    agent picks the actions of all dialogues with one forward pass. A finished dialogue is reset at once with a new
+    user goal, such that every step returns a state of every dialogue.
+
+    # Class members:
+
+        - ** nb_envs **: the number of dialogues stepped in lockstep
+        - ** simulation_mode **: the mode of the simulation, semantic frame or natural language sentences
+        - ** is_training **: flag indicating the training/testing mode
+        - ** max_nb_turns **: the maximal number of allowed dialogue turns
+        - ** users **: the simulated user of every dialogue
+        - ** state_tracker **: the batch state tracker of all dialogues
+        - ** nlu_unit **: the NLU unit, shared by all dialogues
+        - ** nlg_unit **: the NLG unit, shared by all dialogues
+        - ** feasible_actions **: list of templates described as dictionaries, corresponding to each action the agent
+                                  might take
+        - ** current_turn_nb **: array of the current turn number of every dialogue
+        - ** reward_success **: the signaled reward for successful dialogue
+        - ** reward_failure **: the signaled reward for failed dialogue
+        - ** reward_neutral **: the signaled reward for ongoing dialogue
+    """
+
+    def __init__(self, nb_envs=1, act_set=None, slot_set=None, goal_set=None, init_inform_slots=None,
+                 ultimate_request_slot=None, feasible_actions=None, kb_helper=None, params=None):
+        """
+        Constructor for the `GOVecEnv` class.
+        """
+        logging.info('Calling `GOVecEnv` constructor')
+
+        self.nb_envs = nb_envs
+
+        self.simulation_mode = params[const.SIMULATION_MODE_KEY]
+        self.is_training = params[const.IS_TRAINING_KEY]
+
+        self.act_set = act_set
+        self.slot_set = slot_set
+        self.goal_set = goal_set
+        self.init_inform_slots = init_inform_slots
+        self.ultimate_request_slot = ultimate_request_slot
+        self.feasible_actions = feasible_actions
+
+        self.current_turn_nb = np.zeros(self.nb_envs, dtype=np.int64)
+        self.max_nb_turns = params[const.MAX_NB_TURNS]
+
+        self.reward_success = params[const.SUCCESS_REWARD_KEY]
+        self.reward_failure = params[const.FAILURE_REWARD_KEY]
+        self.reward_neutral = params[const.PER_TURN_REWARD_KEY]
+
+        self.kb_helper = kb_helper
+
+        # create one user per dialogue
+        self.users = [create_user(params, self.simulation_mode, self.goal_set, self.max_nb_turns, self.slot_set,
+                                  self.act_set, self.init_inform_slots, self.ultimate_request_slot)
+                      for _ in xrange(self.nb_envs)]
+
+        # create the batch state tracker
+        self.state_tracker = self.__create_state_tracker(params)
+
+        # create the nlu and the nlg unit
+        self.nlu_unit = create_nlu_unit(params[const.NLU_PATH_KEY])
+        self.nlg_unit = create_nlg_unit(params[const.NLG_PATH_KEY], params[const.DIAACT_NL_PAIRS_PATH_KEY])
+
+    def __create_state_tracker(self, params):
+        """
+        Private helper method for creating a batch state tracker.
+
+        # Arguments:
+
+            - ** params **: the parameters, having the type of the state tracker
+
+        ** return **: the newly created batch state tracker
+        """
+        logging.info('Calling `GOVecEnv` __create_state_tracker method')
+
+        state_tracker = None
+        dst_type_str = params[const.STATE_TRACKER_TYPE_KEY]
+        if dst_type_str == const.RULE_BASED_STATE_TRACKER:
+            state_tracker = state_trackers.GOBatchRuleBasedStateTracker(self.nb_envs, self.act_set, self.slot_set,
+                                                                        self.max_nb_turns, self.kb_helper)
+        elif dst_type_str == const.MODEL_BASED_STATE_TRACKER:
+            model = GOGRUModel.load(params[const.MODEL_BASED_STATE_TRACKER_PATH_KEY])
+            state_tracker = state_trackers.GOBatchModelBasedStateTracker(self.nb_envs, self.act_set, self.slot_set,
+                                                                         self.max_nb_turns, self.kb_helper, model)
+        else:
+            raise Exception()
+
+        return state_tracker
+
+    def get_state_dimension(self):
+        """
+
+        ** return **: the dimension of the dialogue state
+        """
+
+        return self.state_tracker.get_state_dimension()
+
+    def reward_function(self, dialogue_statuses):
+        """
+        # Arguments:
+
+            - ** dialogue_statuses **: array of the status of every dialogue (see `GOEnv.reward_function`)
+
+        ** return **: array of the reward associated with each status
+        """
+
+        rewards = np.full(len(dialogue_statuses), self.reward_neutral, dtype=np.float64)
+        rewards[dialogue_statuses == const.FAILED_DIALOG] = self.reward_failure
+        rewards[dialogue_statuses == const.SUCCESS_DIALOG] = self.reward_success
+
+        return rewards
+
+    def __reset_dialogues(self, env_indices):
+        """
+        Private helper method to start new dialogues: the users are reset and their initial actions are registered
+        with the state tracker.
+
+        # Arguments:
+
+            - ** env_indices **: list of the indices of the dialogues
+        """
+
+        self.state_tracker.reset(env_indices)
+
+        init_usr_actions = [process_usr_action(self.users[env_idx].reset(), self.simulation_mode, self.nlu_unit,
+                                               self.nlg_unit) for env_idx in env_indices]
+        self.current_turn_nb[env_indices] = 1
+
+        self.state_tracker.update_batch(env_indices, init_usr_actions, [const.USR_SPEAKER_VAL] * len(env_indices))
+
+    def reset(self):
+        """
+        Method for resetting all dialogues, called at the beginning of the training.
+
+        ** return **: array of shape (nb_envs, state_dim) of the initial observation of every dialogue
+        """
+        logging.info('Calling `GOVecEnv` reset method')
+
+        self.__reset_dialogues(range(self.nb_envs))
+
+        return self.state_tracker.produce_state()
+
+    def step(self, actions):
+        """
+        Method for taking all dialogues one step further: the agent action of every dialogue is presented to its user,
+        and the finished dialogues are reset.
+
+        # Arguments:
+
+            - ** actions **: the index of the feasible action the agent takes in every dialogue
+
+        ** return **: the observations of shape (nb_envs, state_dim), the rewards and the done flags of every dialogue,
+                      and a list of the infos of every dialogue, each one with the status of the dialogue as
+                      `DIALOGUE_STATUS_KEY`. The observation of a finished dialogue is the initial observation of its
+                      next dialogue, the last observation of the finished one is in its info, as `terminal_observation`.
+        """
+        logging.info('Calling `GOVecEnv` step method')
+
+        env_indices = range(self.nb_envs)
+
+        ########################################################################
+        #   Register AGENT actions with the state_tracker
+        ########################################################################
+
+        self.current_turn_nb += 1
+        agt_actions = [process_agt_action(copy.deepcopy(self.feasible_actions[action]), self.nlg_unit)
+                       for action in actions]
+        self.state_tracker.update_batch(env_indices, agt_actions, [const.AGT_SPEAKER_VAL] * self.nb_envs)
+
+        ########################################################################
+        #   CALL USERS TO TAKE THEIR TURN
+        ########################################################################
+
+        dones = np.zeros(self.nb_envs, dtype=bool)
+        dialogue_statuses = np.zeros(self.nb_envs, dtype=np.int64)
+        usr_env_indices = []
+        usr_actions = []
+        for env_idx, agt_action in enumerate(agt_actions):
+            usr_action, dones[env_idx], dialogue_statuses[env_idx] = user_turn(
+                self.users[env_idx], agt_action, self.simulation_mode, self.nlu_unit, self.nlg_unit)
+
+            if not dones[env_idx]:
+                usr_env_indices.append(env_idx)
+                usr_actions.append(usr_action)
+
+        self.current_turn_nb[usr_env_indices] += 1
+        self.state_tracker.update_batch(usr_env_indices, usr_actions, [const.USR_SPEAKER_VAL] * len(usr_actions))
+
+        rewards = self.reward_function(dialogue_statuses)
+        new_states = self.state_tracker.produce_state()
+
+        # the info of every dialogue has its status, as the one of the `GOEnv`
+        infos = [{const.DIALOGUE_STATUS_KEY: dialogue_status} for dialogue_status in dialogue_statuses.tolist()]
+
+        # start new dialogues in place of the finished ones
+        done_env_indices = list(np.flatnonzero(dones))
+        if done_env_indices:
+            for env_idx in done_env_indices:
+                infos[env_idx]['terminal_observation'] = new_states[env_idx].copy()
+
+            self.__reset_dialogues(done_env_indices)
+            new_states[done_env_indices] = self.state_tracker.produce_state()[done_env_indices]
+
+        return new_states, rewards, dones, infos
+
+    def close(self):
+        return True
@@ -0,0 +1,187 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python file for simulating the dialogues in parallel worker processes
+"""
+
+from core import constants as const
+import numpy as np
+import copy, logging, multiprocessing, random
+
+# the environment of a rollout worker process, a copy of the environment of the parent process when forked
+rollout_env = None
+
+
+def init_rollout_worker(env):
+    """
+    Initialize a worker process simulating the dialogues.
+
+    # Arguments:
+
+        - ** env **: the environment of the parent process, every forked worker has its own copy of it
+    """
+
+    global rollout_env
+    rollout_env = env
+
+    # the new query results of the worker are sent back with every dialogue
+    rollout_env.kb_helper.record_new_cache_entries()
+
+
+def simulate_episode(env, policy):
+    """
+    Simulate one dialogue with a policy.
+
+    # Arguments:
+
+        - ** env **: the environment of the dialogue
+        - ** policy **: the policy, having the `reset` and `select_action` methods
+
+    ** return **: tuple of the transitions and the statistics of the dialogue
+    """
+
+    policy.reset()
+    state = env.reset()
+
+    transitions = []
+    episode_reward = 0.
+    done = False
+    info = {}
+    while not done:
+        action = policy.select_action(state=state)
+        next_state, reward, done, info = env.step(copy.deepcopy(env.feasible_actions[action]))
+
+        transitions.append((state, action, reward, next_state, done))
+        episode_reward += reward
+        state = next_state
+
+    episode_stats = {'reward': episode_reward, 'nb_turns': env.get_current_turn_nb(),
+                     const.DIALOGUE_STATUS_KEY: info.get(const.DIALOGUE_STATUS_KEY, const.NO_OUTCOME_YET)}
+
+    return transitions, episode_stats
+
+
+def run_rollout_episode(task):
+    """
+    Simulate one dialogue with a policy in a worker process.
+
+    # Arguments:
+
+        - ** task **: tuple of the policy and the seed of the random generators of the worker
+
+    ** return **: tuple of the transitions and the statistics of the dialogue, and the new entries of the knowledge
+                  base query caches of the worker
+    """
+
+    policy, seed = task
+
+    # the forked workers start with the random state of the parent process, so each task is seeded
+    random.seed(seed)
+    np.random.seed(seed)
+
+    transitions, episode_stats = simulate_episode(rollout_env, policy)
+
+    return transitions, episode_stats, rollout_env.kb_helper.take_new_cache_entries()
+
+
+def summarize_episodes(episode_stats_list):
+    """
+    Summarize the statistics of simulated dialogues.
+
+    # Arguments:
+
+        - ** episode_stats_list **: list of the statistics of every dialogue
+
+    ** return **: dictionary of the success rate, the average reward and the average number of turns
+    """
+
+    nb_episodes = max(len(episode_stats_list), 1)
+    nb_successes = sum(episode_stats[const.DIALOGUE_STATUS_KEY] == const.SUCCESS_DIALOG
+                       for episode_stats in episode_stats_list)
+
+    return {'success_rate': float(nb_successes) / nb_episodes,
+            'ave_reward': float(sum(episode_stats['reward'] for episode_stats in episode_stats_list)) / nb_episodes,
+            'ave_turns': float(sum(episode_stats['nb_turns'] for episode_stats in episode_stats_list)) / nb_episodes}
+
+
+class GORolloutWorkers(object):
+    """
+    Pool of worker processes simulating dialogues, each one with its own copy of the environment. Every dialogue is a
+    task carrying a snapshot of the policy (e.g. a `GOPolicySnapshot` of the Q-network, or the warm-up policy), so the
+    workers never run the deep learning framework, and the transitions and the statistics of every dialogue are
+    streamed back as soon as it ends. The workers are forked once and serve all the simulations until `close`. With a
+    single worker, the dialogues are simulated in this process, with its environment.
+
+    The new entries of the knowledge base query caches of the workers are sent back with every dialogue and merged
+    into the caches of this process, so they are saved with its caches. The workers keep answering from the knowledge
+    base as it was when they were forked, so the simulations are refused after an update of the knowledge base of
+    this process (see `is_stale`), and new workers have to be forked.
+
+    # Class members:
+
+        - ** env **: the environment of this process
+        - ** nb_workers **: the number of worker processes
+        - ** pool **: the pool of the worker processes, None for the simulation in this process
+        - ** nb_entity_updates **: the number of updates of the knowledge base when the workers were forked
+        - ** seed **: the seed of the next task
+    """
+
+    def __init__(self, env=None, nb_workers=None, seed=0):
+        """
+        Constructor of the `GORolloutWorkers` class. The workers are forked, so they share the knowledge base and the
+        loaded models of the environment with this process.
+        """
+        logging.info('Calling `GORolloutWorkers` constructor')
+
+        self.env = env
+        self.nb_workers = nb_workers or multiprocessing.cpu_count()
+        self.pool = None
+        if self.nb_workers > 1:
+            self.pool = multiprocessing.Pool(self.nb_workers, initializer=init_rollout_worker, initargs=(env,))
+        self.nb_entity_updates = env.kb_helper.nb_entity_updates
+        self.seed = seed
+
+    def is_stale(self):
+        """
+        ** return **: True if the knowledge base of this process was updated after the workers were forked
+        """
+
+        return self.pool is not None and self.env.kb_helper.nb_entity_updates != self.nb_entity_updates
+
+    def run_episodes(self, policy, nb_episodes):
+        """
+        Simulate dialogues with a policy in the worker processes.
+
+        # Arguments:
+
+            - ** policy **: the policy (picklable), having the `reset` and `select_action` methods
+            - ** nb_episodes **: the number of dialogues
+
+        ** return **: iterator of the transitions and the statistics of every dialogue, in the order they finish
+        """
+        logging.info('Calling `GORolloutWorkers` run_episodes method')
+
+        if self.pool is None:
+            for _ in xrange(nb_episodes):
+                yield simulate_episode(self.env, policy)
+            return
+
+        if self.is_stale():
+            raise Exception("The knowledge base was updated after the rollout workers were forked")
+
+        tasks = [(policy, self.seed + episode) for episode in xrange(nb_episodes)]
+        self.seed += nb_episodes
+
+        for transitions, episode_stats, cache_entries in self.pool.imap_unordered(run_rollout_episode, tasks):
+            self.env.kb_helper.put_cache_entries(cache_entries)
+            yield transitions, episode_stats
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        logging.info('Calling `GORolloutWorkers` close method')
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
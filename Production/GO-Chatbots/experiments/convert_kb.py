@@ -0,0 +1,35 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python script for converting a pickled knowledge base to the compact columnar format, which can be memory-mapped
+by the dialogue system when the `MMAP_KB_BACKEND` backend is used, or to a SQLite database, which is queried by the
+dialogue system when the `SQLITE_KB_BACKEND` backend is used.
+"""
+
+import os, sys, logging
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from core import constants as const
+from core.dm.kb_columns import convert_pickle_kb
+from core.dm.kb_sqlite import convert_pickle_kb_to_sqlite
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4]:
+        print('Usage: python convert_kb.py <pickled kb path> <output kb path> [{0}|{1}]'.format(
+            const.MMAP_KB_BACKEND, const.SQLITE_KB_BACKEND))
+        sys.exit(1)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
+
+    kb_backend = sys.argv[3] if len(sys.argv) == 4 else const.MMAP_KB_BACKEND
+    if kb_backend == const.MMAP_KB_BACKEND:
+        kb_columns = convert_pickle_kb(sys.argv[1], sys.argv[2])
+        nb_entities, slots = kb_columns.nb_entities(), kb_columns.slots
+    elif kb_backend == const.SQLITE_KB_BACKEND:
+        nb_entities, slots = convert_pickle_kb_to_sqlite(sys.argv[1], sys.argv[2])
+    else:
+        raise Exception("Unknown knowledge base backend: '{0}'".format(kb_backend))
+
+    logging.info("Converted {0} entities with {1} slots".format(nb_entities, len(slots)))
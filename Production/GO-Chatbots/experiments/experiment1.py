@@ -2,7 +2,7 @@
 Author: Vladimir Ilievski <ilievski.vladimir@live.com>
 """
 
-import os, sys, logging
+import os, sys, logging, multiprocessing
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -96,6 +96,9 @@ def prepare_dialogue_system():
     params[const.MAX_NB_TURNS] = 40
     params[
         const.KB_PATH_KEY] = '/Users/vladimirilievski/Desktop/Vladimir/Master_Thesis_Swisscom/GitHub Repo/GO-Chatbots/resources/data/movie_kb.1k.p'
+    params[const.KB_CACHE_SIZE_KEY] = 10000
+    params[const.KB_CACHE_PATH_KEY] = os.path.join(util.project_path, 'resources', 'data', 'exp1_kb_cache.p')
+    params[const.KB_PRECOMPUTE_KEY] = False
 
     # Environment params
     params[const.SIMULATION_MODE_KEY] = const.SEMANTIC_FRAME_SIMULATION_MODE
@@ -129,6 +132,9 @@ def prepare_dialogue_system():
     params[const.HIDDEN_SIZE_KEY] = 80
     params[const.ACTIVATION_FUNCTION_KEY] = const.RELU
 
+    # simulate the warm-up and the epoch dialogues on all cores
+    params[const.NB_ROLLOUT_WORKERS_KEY] = multiprocessing.cpu_count()
+
     # create the dialogue system
     dialogue_sys = GODialogSys(act_set=act_set, slot_set=slot_set, goal_set=goal_set,
                                init_inform_slots=init_inform_slots, ultimate_request_slot=ultimate_request_slot,
@@ -155,6 +161,7 @@ logging.info('Started')
 dialogue_system.train(nb_epochs=nb_epochs, nb_warmup_episodes=nb_warmup_episodes,
                       nb_episodes_per_epoch=nb_episodes_per_epoch,
                       res_path=res_path, weights_file_name=weights_file_name)
+dialogue_system.close()
 
 logging.info('Finished')
 
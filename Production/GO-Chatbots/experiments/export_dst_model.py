@@ -0,0 +1,44 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python script for exporting the `GRU` layer of a trained Keras model to the `.npz` file of the weights of the
+`GOGRUModel`, which is loaded by the model-based state trackers. The layer must be trained on the inputs of the
+`GOBatchModelBasedStateTracker`, the encoding of an action followed by the speaker element, with `reset_after=False`
+and `recurrent_activation='sigmoid'`.
+"""
+
+import os, sys, logging
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from core.dst.model import GOGRUModel
+from keras.models import load_model
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4]:
+        print('Usage: python export_dst_model.py <keras model path> <output npz path> [<gru layer name>]')
+        sys.exit(1)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
+
+    keras_model = load_model(sys.argv[1])
+    if len(sys.argv) == 4:
+        layer = keras_model.get_layer(sys.argv[3])
+    else:
+        gru_layers = [layer for layer in keras_model.layers if layer.__class__.__name__ == 'GRU']
+        if len(gru_layers) != 1:
+            raise Exception("Expected one GRU layer, found {0}, give the name of the layer".format(len(gru_layers)))
+        layer = gru_layers[0]
+
+    # the model computes the gates with the logistic function, and not with the default `hard_sigmoid` of Keras 2
+    activations = [getattr(layer, 'activation', None),
+                   getattr(layer, 'recurrent_activation', getattr(layer, 'inner_activation', None))]
+    if [getattr(activation, '__name__', None) for activation in activations] != ['tanh', 'sigmoid']:
+        raise Exception("Unsupported activations of the GRU layer '{0}', expected tanh and sigmoid".format(layer.name))
+
+    model = GOGRUModel.from_keras_weights(layer.get_weights())
+    model.save(sys.argv[2])
+
+    logging.info("Exported the GRU layer '{0}' with {1} inputs and {2} hidden units".format(
+        layer.name, model.input_dim, model.hidden_size))
@@ -0,0 +1,341 @@
+"""
+Author: Vladimir Ilievski <ilievski.vladimir@live.com>
+
+A Python script for benchmarking the knowledge base queries of the `GOKBHelper`. Synthetic knowledge bases of the
+`slot_set.txt` schema are generated for every size, and the constraint sequences of the user goals are replayed
+against them, as in the dialogues. The queries per second, the p50/p99 latency and the peak memory are reported for
+every knowledge base method. With an update interval, the knowledge base is also updated between the queries, and
+the latencies of the updates are reported as well. The query caches can be local to the process, or shared between
+processes (see `GOSharedKBCache`), to measure the cost of the inter-process communication.
+"""
+
+import os, sys, logging
+import argparse, json, multiprocessing, resource, shutil, tempfile, timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from core import constants as const
+from core import util
+from core.dm.kb_helper import GOKBHelper
+from core.dm.kb_columns import GOKBColumns
+from core.dm.kb_sqlite import GOSQLiteKBHelper, save_sqlite_kb
+from core.dm.kb_cache import create_shared_kb_caches
+import numpy as np
+
+# the slots of the dialogue, which are not attributes of the entities
+NON_ENTITY_SLOTS = ['ticket', 'numberofpeople', 'taskcomplete', 'closing', 'greeting', 'result', 'mc_list',
+                    'implicit_value']
+
+ULTIMATE_REQUEST_SLOT = 'ticket'
+KB_SPECIAL_SLOTS = ['numberofpeople']
+KB_FILTER_SLOTS = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+INIT_INFORM_SLOTS = ['moviename']
+
+KB_METHODS = ['available_results_from_kb', 'database_results_for_agent', 'suggest_slot_values', 'fill_inform_slots']
+KB_UPDATE_METHODS = ['add_entity', 'update_entity', 'remove_entity']
+
+LOCAL_KB_CACHES = 'local'
+SHARED_KB_CACHES = 'shared'
+
+
+def generate_synthetic_kb(slot_set, goal_set, nb_entities, seed=0):
+    """
+    Generate a synthetic knowledge base with the entity slots of the slot set. The values of every slot follow a
+    Zipf-like distribution, and the most frequent ones are the values of the user goals, such that the replayed
+    constraints match the entities. The number of distinct values grows with the square root of the size.
+
+    # Arguments:
+
+        - ** slot_set **: the slot set, as read by `util.text_to_dict`
+        - ** goal_set **: the user goals
+        - ** nb_entities **: the number of entities
+        - ** seed **: the seed of the random generator
+
+    ** return **: the columnar knowledge base
+    """
+    logging.info('Calling generate_synthetic_kb method')
+
+    rng = np.random.RandomState(seed)
+    slots = sorted(slot for slot in slot_set.keys() if slot and slot not in NON_ENTITY_SLOTS)
+
+    values = {}
+    codes = {}
+    for slot in slots:
+        goal_values = sorted(set(goal[const.INFORM_SLOTS_KEY][slot] for goal in goal_set
+                                 if slot in goal[const.INFORM_SLOTS_KEY]))
+        nb_values = max(len(goal_values), int(4 * np.sqrt(nb_entities)))
+        values[slot] = goal_values + ['{0} {1}'.format(slot, idx) for idx in xrange(nb_values - len(goal_values))]
+
+        probabilities = 1. / np.arange(1, nb_values + 1)
+        codes[slot] = rng.choice(nb_values, nb_entities, p=probabilities / probabilities.sum()).astype(np.int32)
+
+        # the slots of the user goals are present in most entities
+        presence = 0.9 if len(goal_values) > 0 else 0.3
+        codes[slot][rng.random_sample(nb_entities) >= presence] = const.KB_MISSING_VALUE_CODE
+
+    return GOKBColumns(np.arange(nb_entities), values, codes)
+
+
+def constraint_sequences(goal_set, seed=0):
+    """
+    Create the sequences of constraints of the user goals, as they are accumulated during the dialogues. The initial
+    inform slots come first, and the other constraints follow in a random order.
+
+    # Arguments:
+
+        - ** goal_set **: the user goals
+        - ** seed **: the seed of the random generator
+
+    ** return **: list of sequences, every sequence is a list of the current slots and the request slots of a turn
+    """
+
+    rng = np.random.RandomState(seed)
+
+    sequences = []
+    for goal in goal_set:
+        inform_slots = goal[const.INFORM_SLOTS_KEY]
+        request_slots = dict(goal[const.REQUEST_SLOTS_KEY])
+        request_slots[ULTIMATE_REQUEST_SLOT] = const.UNKNOWN_SLOT_VALUE
+
+        init_slots = [slot for slot in INIT_INFORM_SLOTS if slot in inform_slots]
+        other_slots = [slot for slot in sorted(inform_slots.keys()) if slot not in init_slots]
+        rng.shuffle(other_slots)
+
+        sequence = []
+        current_inform_slots = {}
+        for slot in init_slots + other_slots:
+            current_inform_slots[slot] = inform_slots[slot]
+            sequence.append(({const.INFORM_SLOTS_KEY: dict(current_inform_slots)}, request_slots))
+
+        sequences.append(sequence)
+
+    return sequences
+
+
+def create_kb_helper(kb_columns, kb_backend, kb_dir, cache_size, shared_caches=None):
+    """
+    Create the knowledge base helper of the given backend.
+
+    # Arguments:
+
+        - ** kb_columns **: the columnar knowledge base
+        - ** kb_backend **: the backend of the knowledge base
+        - ** kb_dir **: a temporary directory for the knowledge base files
+        - ** cache_size **: the capacity of the query caches
+        - ** shared_caches **: the dictionaries shared between processes backing the query caches, None for local caches
+
+    ** return **: the newly created knowledge base helper
+    """
+
+    if kb_backend == const.PICKLE_KB_BACKEND:
+        positions = kb_columns.all_positions()
+        knowledge_dict = dict(zip(kb_columns.entity_ids_at(positions), kb_columns.entities_at(positions)))
+        return GOKBHelper(ULTIMATE_REQUEST_SLOT, KB_SPECIAL_SLOTS, KB_FILTER_SLOTS, knowledge_dict, cache_size,
+                          kb_columns, shared_caches)
+    elif kb_backend == const.MMAP_KB_BACKEND:
+        if not os.path.exists(os.path.join(kb_dir, 'columns')):
+            kb_columns.save(os.path.join(kb_dir, 'columns'))
+        return GOKBHelper(ULTIMATE_REQUEST_SLOT, KB_SPECIAL_SLOTS, KB_FILTER_SLOTS, None, cache_size,
+                          GOKBColumns.load(os.path.join(kb_dir, 'columns')), shared_caches)
+    elif kb_backend == const.SQLITE_KB_BACKEND:
+        sqlite_path = os.path.join(kb_dir, 'kb.sqlite')
+        if not os.path.exists(sqlite_path):
+            save_sqlite_kb(kb_columns, sqlite_path)
+        return GOSQLiteKBHelper(ULTIMATE_REQUEST_SLOT, KB_SPECIAL_SLOTS, KB_FILTER_SLOTS, sqlite_path, cache_size,
+                                shared_caches)
+
+    raise Exception("Unknown knowledge base backend: '{0}'".format(kb_backend))
+
+
+def call_kb_method(kb_helper, kb_method, current_slots, request_slots):
+    """
+    Call one knowledge base method, with the arguments it takes.
+    """
+
+    if kb_method in ['suggest_slot_values', 'fill_inform_slots']:
+        return getattr(kb_helper, kb_method)(request_slots, current_slots)
+
+    return getattr(kb_helper, kb_method)(current_slots)
+
+
+def call_kb_update_method(kb_helper, kb_update_method, entity_id, entity):
+    """
+    Call one knowledge base update method, with the arguments it takes.
+    """
+
+    if kb_update_method == 'remove_entity':
+        return kb_helper.remove_entity(entity_id)
+
+    return getattr(kb_helper, kb_update_method)(entity_id, entity)
+
+
+def benchmark_kb(params):
+    """
+    Benchmark all knowledge base methods on one synthetic knowledge base. It is run in its own process, such that
+    the peak memory is the one of this knowledge base only.
+
+    # Arguments:
+
+        - ** params **: the benchmark params, with the size and the backend of the knowledge base, and the shared
+                        caches, if any
+
+    ** return **: list of the results of every method
+    """
+
+    slot_set = util.text_to_dict(params['slot_set_path'])
+    goal_set = util.load_goal_set(params['goal_set_path'])
+    sequences = constraint_sequences(goal_set, params['seed'])
+
+    kb_columns = generate_synthetic_kb(slot_set, goal_set, params['nb_entities'], params['seed'])
+    kb_dir = tempfile.mkdtemp(prefix='go_kb_benchmark_')
+
+    rng = np.random.RandomState(params['seed'])
+    # the SQLite knowledge base is read-only, and the knowledge base is not updated while its caches are shared
+    update_interval = params['update_interval'] \
+        if params['kb_backend'] != const.SQLITE_KB_BACKEND and params['shared_caches'] is None else 0
+    update_latencies = dict((kb_update_method, []) for kb_update_method in KB_UPDATE_METHODS)
+    nb_updates = 0
+
+    results = []
+    try:
+        for kb_method in params['kb_methods']:
+            # every method starts with cold caches
+            if params['shared_caches'] is not None:
+                for shared_entries in params['shared_caches'].values():
+                    shared_entries.clear()
+            kb_helper = create_kb_helper(kb_columns, params['kb_backend'], kb_dir, params['cache_size'],
+                                         params['shared_caches'])
+
+            latencies = []
+            nb_method_updates = 0
+            for _ in xrange(params['nb_passes']):
+                for sequence in sequences:
+                    for current_slots, request_slots in sequence:
+                        start = timeit.default_timer()
+                        call_kb_method(kb_helper, kb_method, current_slots, request_slots)
+                        latencies.append(timeit.default_timer() - start)
+
+                        if update_interval > 0 and len(latencies) % update_interval == 0:
+                            # a copy of a random entity is added, its values are replaced by the ones of another
+                            # random entity and it is removed, such that the cached queries are invalidated as in a
+                            # live knowledge base, while the queried entities stay the same
+                            kb_update_method = KB_UPDATE_METHODS[nb_method_updates % len(KB_UPDATE_METHODS)]
+                            if kb_update_method == 'add_entity':
+                                # the added entities get new ids, following the ids of the synthetic entities
+                                added_entity_id = params['nb_entities'] + nb_updates
+
+                            positions = kb_helper.kb_columns.all_positions()
+                            entity = kb_helper.kb_columns.entity(positions[rng.randint(len(positions))])
+
+                            start = timeit.default_timer()
+                            call_kb_update_method(kb_helper, kb_update_method, added_entity_id, entity)
+                            update_latencies[kb_update_method].append(timeit.default_timer() - start)
+
+                            nb_updates += 1
+                            nb_method_updates += 1
+
+            # the next method starts with the same entities
+            if KB_UPDATE_METHODS[nb_method_updates % len(KB_UPDATE_METHODS)] != 'add_entity':
+                kb_helper.remove_entity(added_entity_id)
+
+            latencies = np.array(latencies)
+            cache_stats = kb_helper.cache_stats()
+            results.append({'nb_entities': params['nb_entities'], 'kb_backend': params['kb_backend'],
+                            'kb_caches': params['kb_caches'], 'kb_method': kb_method, 'nb_queries': len(latencies),
+                            'qps': len(latencies) / latencies.sum(),
+                            'p50_ms': 1000 * np.percentile(latencies, 50),
+                            'p99_ms': 1000 * np.percentile(latencies, 99),
+                            # the maximal resident set size is given in kilobytes on Linux
+                            'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+                            'cache_stats': cache_stats})
+
+        for kb_update_method in KB_UPDATE_METHODS:
+            if len(update_latencies[kb_update_method]) > 0:
+                latencies = np.array(update_latencies[kb_update_method])
+                results.append({'nb_entities': params['nb_entities'], 'kb_backend': params['kb_backend'],
+                                'kb_caches': params['kb_caches'], 'kb_method': kb_update_method, 'nb_queries': len(latencies),
+                                'qps': len(latencies) / latencies.sum(),
+                                'p50_ms': 1000 * np.percentile(latencies, 50),
+                                'p99_ms': 1000 * np.percentile(latencies, 99),
+                                'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+                                'cache_stats': None})
+    finally:
+        shutil.rmtree(kb_dir)
+
+    return results
+
+
+def main(params):
+    all_results = []
+
+    print('{0:>10} {1:>18} {2:>7} {3:>28} {4:>8} {5:>12} {6:>10} {7:>10} {8:>10}'.format(
+        'entities', 'backend', 'caches', 'method', 'queries', 'qps', 'p50 ms', 'p99 ms', 'peak MB'))
+
+    # the shared caches are served by a manager process, as when several simulation workers share them
+    manager = multiprocessing.Manager() if SHARED_KB_CACHES in params['kb_caches'] else None
+
+    try:
+        for nb_entities in params['kb_sizes']:
+            for kb_backend in params['kb_backends']:
+                for kb_caches in params['kb_caches']:
+                    shared_caches = create_shared_kb_caches(manager) if kb_caches == SHARED_KB_CACHES else None
+                    kb_params = dict(params, nb_entities=nb_entities, kb_backend=kb_backend, kb_caches=kb_caches,
+                                     shared_caches=shared_caches)
+
+                    # a fresh process per knowledge base, for the peak memory
+                    pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+                    results = pool.apply(benchmark_kb, (kb_params,))
+                    pool.close()
+                    pool.join()
+
+                    for result in results:
+                        print('{nb_entities:>10} {kb_backend:>18} {kb_caches:>7} {kb_method:>28} {nb_queries:>8} '
+                              '{qps:>12.1f} {p50_ms:>10.3f} {p99_ms:>10.3f} {peak_memory_mb:>10.1f}'.format(**result))
+
+                    all_results += results
+    finally:
+        if manager is not None:
+            manager.shutdown()
+
+    if params['output_file']:
+        json.dump(all_results, open(params['output_file'], 'w'), indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--kb_sizes', dest='kb_sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='the numbers of entities of the synthetic knowledge bases')
+    parser.add_argument('--kb_backends', dest='kb_backends', type=str, nargs='+',
+                        default=[const.PICKLE_KB_BACKEND, const.MMAP_KB_BACKEND, const.SQLITE_KB_BACKEND],
+                        help='the knowledge base backends to benchmark')
+    parser.add_argument('--kb_caches', dest='kb_caches', type=str, nargs='+', default=[LOCAL_KB_CACHES],
+                        choices=[LOCAL_KB_CACHES, SHARED_KB_CACHES],
+                        help='the query caches to benchmark, local to the process or shared between processes')
+    parser.add_argument('--kb_methods', dest='kb_methods', type=str, nargs='+', default=KB_METHODS,
+                        help='the knowledge base methods to benchmark')
+    parser.add_argument('--nb_passes', dest='nb_passes', type=int, default=2,
+                        help='the number of times the constraint sequences are replayed, the first pass is cold')
+    parser.add_argument('--cache_size', dest='cache_size', type=int, default=const.DEFAULT_KB_CACHE_SIZE,
+                        help='the capacity of the query caches')
+    parser.add_argument('--update_interval', dest='update_interval', type=int, default=0,
+                        help='the number of queries between two updates of the knowledge base, 0 for no updates '
+                             '(the {0} backend and the shared caches are not updated)'.format(
+                            const.SQLITE_KB_BACKEND))
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='the seed of the random generators')
+    parser.add_argument('--slot_set_path', dest='slot_set_path', type=str,
+                        default=os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'),
+                        help='path to the slot set')
+    parser.add_argument('--goal_set_path', dest='goal_set_path', type=str,
+                        default=os.path.join(util.project_path, 'resources', 'data',
+                                             'user_goals_first_turn_template.part.movie.v1.p'),
+                        help='path to the user goals')
+    parser.add_argument('--output_file', dest='output_file', type=str, default=None,
+                        help='path to the json file with the results')
+
+    args = parser.parse_args()
+    params = vars(args)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.WARNING)
+
+    main(params)
@@ -10,11 +10,17 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from core import constants as const
 from core.agent.agents import GODQNAgent
 from core.agent.processor import GOProcessor
+from core.agent.memory import GOSparseMemory
+from core.agent.policy import GOPolicySnapshot
+from core.dst.sparse import dense_to_sparse, sparse_states_to_csr
 from rl.memory import SequentialMemory
 from rl.policy import LinearAnnealedPolicy, EpsGreedyQPolicy
 from keras.optimizers import Adam
 from core import util
-from keras.models import Sequential
+from keras.models import Sequential, Model
+from keras.layers import Dense, Activation, Dropout, Lambda
+from keras import backend as K
+import numpy as np
 
 
 def test1_feasible_actions():
@@ -92,7 +98,98 @@ def test1_dqn_agent():
     agent.compile(Adam(lr=.00025), metrics=['mae'])
 
 
+def test2_sparse_memory():
+    """
+    Method for testing that the sparse memory samples the same experiences as the dense states it was given
+    """
+
+    state_dim = 256
+    rng = np.random.RandomState(0)
+    states = rng.random_sample((11, state_dim)) * (rng.random_sample((11, state_dim)) < 0.05)
+
+    # the action is the index of the current state, the states are given both dense and sparse
+    memory = GOSparseMemory(warmup_size=100, state_dim=state_dim)
+    for idx in xrange(10):
+        s_curr = states[idx:idx + 1] if idx % 2 == 0 else dense_to_sparse(states[idx])
+        memory.append(s_curr, idx, float(idx), states[idx + 1:idx + 2], idx == 9)
+
+    assert memory.memory_size() == 10
+    assert all(isinstance(experience[0], tuple) and isinstance(experience[3], tuple)
+               for experience in memory.experience_pool)
+
+    s_curr, actions, rewards, s_next, done = memory.sample_batch(32)
+    assert s_curr.shape == (32, state_dim) and s_next.shape == (32, state_dim)
+    assert np.array_equal(s_curr, states[actions])
+    assert np.array_equal(s_next, states[actions + 1])
+    assert np.array_equal(rewards, actions.astype(np.float64))
+    assert np.array_equal(done, actions == 9)
+
+
+def test3_policy_snapshot():
+    """
+    Method for testing that the snapshot of the Q-network computes the same Q-values as the keras model
+    """
+
+    state_dim = 64
+    nb_actions = 10
+    rng = np.random.RandomState(0)
+    states = (rng.random_sample((8, state_dim)) * (rng.random_sample((8, state_dim)) < 0.2)).astype(np.float32)
+    sparse_states = sparse_states_to_csr([dense_to_sparse(state) for state in states])
+
+    # the Q-network of the `GODQNAgent`
+    model = Sequential()
+    model.add(Dense(16, input_shape=(state_dim,)))
+    model.add(Activation(const.TANH))
+    model.add(Dense(nb_actions))
+    model.add(Activation(const.LINEAR))
+
+    snapshot = GOPolicySnapshot.from_model(model)
+    assert np.allclose(snapshot.q_values(states), model.predict(states), atol=1e-5)
+    assert np.allclose(snapshot.q_values(sparse_states), model.predict(states), atol=1e-5)
+    assert snapshot.nb_actions == nb_actions
+
+    # the dueling heads added on top of it by the keras-rl `DQNAgent`
+    dueling_heads = {
+        'avg': lambda a: K.expand_dims(a[:, 0], -1) + a[:, 1:] - K.mean(a[:, 1:], axis=1, keepdims=True),
+        'max': lambda a: K.expand_dims(a[:, 0], -1) + a[:, 1:] - K.max(a[:, 1:], axis=1, keepdims=True),
+        'naive': lambda a: K.expand_dims(a[:, 0], -1) + a[:, 1:]}
+
+    for dueling_type, dueling_head in dueling_heads.items():
+        y = Dense(nb_actions + 1, activation=const.LINEAR)(model.layers[-2].output)
+        dueling_model = Model(inputs=model.input, outputs=Lambda(dueling_head, output_shape=(nb_actions,))(y))
+
+        snapshot = GOPolicySnapshot.from_model(dueling_model, dueling_type=dueling_type)
+        assert np.allclose(snapshot.q_values(states), dueling_model.predict(states), atol=1e-5)
+        assert snapshot.nb_actions == nb_actions
+
+    # the models the snapshot cannot compute
+    try:
+        GOPolicySnapshot.from_model(dueling_model)
+        assert False
+    except Exception as e:
+        assert 'cannot be taken in a policy snapshot' in str(e)
+
+    try:
+        GOPolicySnapshot.from_model(model, dueling_type='avg')
+        assert False
+    except Exception as e:
+        assert 'no dueling head' in str(e)
+
+    dropout_model = Sequential()
+    dropout_model.add(Dense(16, input_shape=(state_dim,), activation=const.RELU))
+    dropout_model.add(Dropout(.5))
+    dropout_model.add(Dense(nb_actions))
+
+    try:
+        GOPolicySnapshot.from_model(dropout_model)
+        assert False
+    except Exception as e:
+        assert 'Dropout' in str(e)
+
+
 logging.basicConfig(filename='agent_test.log', format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
 logging.info('Started')
 test1_dqn_agent()
+test2_sparse_memory()
+test3_policy_snapshot()
 logging.info('Finished')
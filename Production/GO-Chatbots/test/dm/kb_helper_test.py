@@ -11,7 +11,11 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from core import constants as const
 from core import util
 from core.dm.kb_helper import GOKBHelper
+from core.dm.kb_columns import GOKBColumns
+from core.dm.kb_sqlite import GOSQLiteKBHelper, save_sqlite_kb, convert_pickle_kb_to_sqlite
+from core.dm.kb_cache import create_shared_kb_caches
 import cPickle as pickle
+import multiprocessing, tempfile, shutil
 
 def test1_kb_helper():
     """
@@ -37,9 +41,603 @@ def test1_kb_helper():
     database_results = kb_helper.database_results_for_agent(current_slots)
 
 
+def test2_inverted_index():
+    """
+    Method for testing that the inverted index returns the same entities as a full scan of the knowledge base
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    constraints = {'moviename': 'Deadpool', 'city': 'seattle', 'numberofpeople': '2'}
+    current_slots = {const.INFORM_SLOTS_KEY: constraints}
+
+    # the entities matching all of the constraints, found by a full scan
+    expected = {}
+    for entity_id, entity in knowledge_dict.items():
+        if all(slot in filter_slots or (slot in entity and str(entity[slot]).lower() == value.lower())
+               for slot, value in constraints.items()):
+            expected[entity_id] = entity
+
+    assert len(expected) > 0
+    assert kb_helper.available_results_from_kb(current_slots) == expected
+
+
+def test3_slot_counts():
+    """
+    Method for testing that the columnar counts per constraint are the same as the counts of a full scan
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    inform_slots = {'moviename': 'deadpool', 'date': 'Tomorrow', 'city': const.I_DO_NOT_CARE, 'ticket': 'UKN'}
+
+    # count the matches with a full scan
+    expected = {slot: 0 for slot in inform_slots}
+    expected[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] = 0
+    for entity in knowledge_dict.values():
+        all_match = 1
+        for slot in ['moviename', 'date']:
+            if slot in entity and entity[slot].lower() == inform_slots[slot].lower():
+                expected[slot] += 1
+            else:
+                all_match = 0
+        expected[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] += all_match
+
+    assert expected[const.KB_MATCHING_ALL_CONSTRAINTS_KEY] > 0
+    assert kb_helper.available_results_from_kb_for_slots(inform_slots) == expected
+
+
+def test4_bounded_cache():
+    """
+    Method for testing that the query caches are bounded and keep hit, miss and eviction statistics
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict, cache_size=2)
+
+    for movie_name in ['deadpool', 'zootopia', 'deadpool', 'risen']:
+        kb_helper.available_results_from_kb({const.INFORM_SLOTS_KEY: {'moviename': movie_name}})
+
+    stats = kb_helper.cache_stats()['cached_kb']
+    assert stats['size'] == 2
+    assert stats['hits'] == 1 and stats['misses'] == 3 and stats['evictions'] == 1
+
+
+def test5_memory_mapped_kb():
+    """
+    Method for testing that the KB Helper running on top of the memory-mapped columns gives the same results
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    kb_dir = tempfile.mkdtemp()
+    try:
+        kb_helper.kb_columns.save(kb_dir)
+        mmap_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots,
+                                    kb_columns=GOKBColumns.load(kb_dir))
+
+        current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'Deadpool', 'date': 'tomorrow'}}
+        assert mmap_kb_helper.available_results_from_kb(current_slots) == \
+               kb_helper.available_results_from_kb(current_slots)
+        assert mmap_kb_helper.database_results_for_agent(current_slots) == \
+               kb_helper.database_results_for_agent(current_slots)
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test6_incremental_refinement():
+    """
+    Method for testing that a query extending an already seen query only examines the entities of the cached result
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+    full_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    inform_slots = {}
+    for slot, value in [('moviename', 'zootopia'), ('date', 'tomorrow'), ('city', 'seattle'), ('genre', 'comedy')]:
+        inform_slots[slot] = value
+        current_slots = {const.INFORM_SLOTS_KEY: dict(inform_slots)}
+
+        nb_results = len(kb_helper.available_results_from_kb(current_slots))
+        assert kb_helper.available_results_from_kb(current_slots) == \
+               full_kb_helper.available_results_from_kb(current_slots)
+
+        # the refined query examines only the entities matching the previous constraints
+        if len(inform_slots) > 1:
+            assert kb_helper.query_stats['last_entities_examined'] == nb_previous_results
+
+        nb_previous_results = nb_results
+
+    assert kb_helper.query_stats['refined_queries'] == 3
+
+
+def test7_sqlite_kb():
+    """
+    Method for testing that the KB Helper running on top of the SQLite database gives the same results
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    kb_dir = tempfile.mkdtemp()
+    try:
+        sqlite_path = os.path.join(kb_dir, 'movie_kb.sqlite')
+        save_sqlite_kb(kb_helper.kb_columns, sqlite_path)
+        sqlite_kb_helper = GOSQLiteKBHelper(ultimate_request_slot, special_slots, filter_slots, sqlite_path)
+
+        for inform_slots in [{}, {'moviename': 'Deadpool', 'date': 'tomorrow'}, {'city': 'seattle', 'zip': 'none'},
+                             {'moviename': 'zootopia', 'genre': const.I_DO_NOT_CARE, 'ticket': 'UNK'}]:
+            current_slots = {const.INFORM_SLOTS_KEY: inform_slots}
+            request_slots = {'theater': 'UNK', 'starttime': 'UNK', 'ticket': 'UNK'}
+
+            assert sqlite_kb_helper.available_results_from_kb(current_slots) == \
+                   kb_helper.available_results_from_kb(current_slots)
+            assert sqlite_kb_helper.database_results_for_agent(current_slots) == \
+                   kb_helper.database_results_for_agent(current_slots)
+            assert sqlite_kb_helper.suggest_slot_values(request_slots, current_slots) == \
+                   kb_helper.suggest_slot_values(request_slots, current_slots)
+            assert sqlite_kb_helper.fill_inform_slots(request_slots, current_slots) == \
+                   kb_helper.fill_inform_slots(request_slots, current_slots)
+
+        # the entities streamed from the pickled knowledge base give the same database, and the same content hash
+        converted_sqlite_path = os.path.join(kb_dir, 'converted_movie_kb.sqlite')
+        nb_entities, slots = convert_pickle_kb_to_sqlite(knowledge_dict_path, converted_sqlite_path)
+        assert nb_entities == len(knowledge_dict) and sorted(slots) == kb_helper.kb_columns.slots
+
+        converted_kb_helper = GOSQLiteKBHelper(ultimate_request_slot, special_slots, filter_slots,
+                                               converted_sqlite_path)
+        assert converted_kb_helper.kb_content_hash() == sqlite_kb_helper.kb_content_hash()
+        current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'Deadpool', 'date': 'tomorrow'}}
+        assert converted_kb_helper.database_results_for_agent(current_slots) == \
+               kb_helper.database_results_for_agent(current_slots)
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test8_batch_counts():
+    """
+    Method for testing that the batch count matrix matches the counts of the single dialogues
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, dict(knowledge_dict))
+    batch_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, dict(knowledge_dict))
+
+    current_slots_batch = [{const.INFORM_SLOTS_KEY: {}},
+                           {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'date': 'tomorrow'}},
+                           {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'city': 'seattle'}},
+                           {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'date': 'tomorrow'}},
+                           {const.INFORM_SLOTS_KEY: {'moviename': 'deadpool', 'genre': const.I_DO_NOT_CARE}},
+                           {const.INFORM_SLOTS_KEY: {'moviename': 'unknown movie', 'city': 'seattle'}},
+                           {const.INFORM_SLOTS_KEY: {'city': 'seattle', 'date': 'tomorrow', 'ticket': 'UNK'}}]
+
+    def check_batch_counts(kb_helper, batch_kb_helper):
+        counts = batch_kb_helper.database_results_for_agent_batch(current_slots_batch, slot_set)
+        assert counts.shape == (len(current_slots_batch), len(slot_set) + 1)
+
+        for row, current_slots in enumerate(current_slots_batch):
+            kb_results = kb_helper.database_results_for_agent(current_slots)
+
+            assert counts[row, -1] == kb_results[const.KB_MATCHING_ALL_CONSTRAINTS_KEY]
+            for slot in current_slots[const.INFORM_SLOTS_KEY]:
+                assert counts[row, slot_set[slot]] == kb_results[slot]
+
+    check_batch_counts(kb_helper, batch_kb_helper)
+
+    # the cached and the newly counted sets of constraints are mixed in one batch
+    current_slots_batch.append({const.INFORM_SLOTS_KEY: {'moviename': 'deadpool', 'city': 'seattle'}})
+    check_batch_counts(kb_helper, batch_kb_helper)
+
+    # the updated knowledge base, with a removed entity row
+    for helper in [kb_helper, batch_kb_helper]:
+        helper.add_entity('new entity', {'moviename': 'zootopia', 'city': 'seattle', 'date': 'tomorrow'})
+        helper.remove_entity(sorted(knowledge_dict.keys())[0])
+    check_batch_counts(kb_helper, batch_kb_helper)
+
+    kb_dir = tempfile.mkdtemp()
+    try:
+        sqlite_path = os.path.join(kb_dir, 'kb.sqlite')
+        convert_pickle_kb_to_sqlite(knowledge_dict_path, sqlite_path)
+        check_batch_counts(GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict),
+                           GOSQLiteKBHelper(ultimate_request_slot, special_slots, filter_slots, sqlite_path))
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test9_persistent_cache():
+    """
+    Method for testing that the saved query caches are loaded only for the same knowledge base
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'date': 'tomorrow'}}
+    results = kb_helper.available_results_from_kb(current_slots)
+    kb_results = kb_helper.database_results_for_agent(current_slots)
+
+    kb_dir = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(kb_dir, 'kb_cache.p')
+        kb_helper.save_cache(cache_path)
+
+        # the same knowledge base starts with warm caches
+        warm_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+        assert warm_kb_helper.load_cache(cache_path)
+        assert warm_kb_helper.available_results_from_kb(current_slots) == results
+        assert warm_kb_helper.database_results_for_agent(current_slots) == kb_results
+        assert warm_kb_helper.cache_stats()['cached_kb']['misses'] == 0
+        assert warm_kb_helper.cache_stats()['cached_kb_slot']['misses'] == 0
+
+        # a changed knowledge base invalidates the cache file
+        del knowledge_dict[results.keys()[0]]
+        changed_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+        assert not changed_kb_helper.load_cache(cache_path)
+        assert len(changed_kb_helper.cached_kb) == 0
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test10_canonical_queries():
+    """
+    Method for testing that the queries having the same meaning share their cache entries
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'date': 'tomorrow', 'numberofpeople': '2'}}
+    same_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'Zootopia', 'date': 'tomorrow', 'numberofpeople': '3',
+                                           'ticket': 'UNK', 'genre': const.I_DO_NOT_CARE}}
+
+    results = kb_helper.available_results_from_kb(current_slots)
+    kb_results = kb_helper.database_results_for_agent(current_slots)
+    assert kb_helper.available_results_from_kb(same_slots) == results
+
+    same_kb_results = kb_helper.database_results_for_agent(same_slots)
+    assert same_kb_results['ticket'] == 0 and same_kb_results['genre'] == 0
+    assert all(same_kb_results[slot] == kb_results[slot] for slot in kb_results)
+
+    cache_stats = kb_helper.cache_stats()
+    assert cache_stats['cached_kb']['hits'] == 1 and cache_stats['cached_kb']['misses'] == 1
+    assert cache_stats['cached_kb_slot']['hit_rate'] == 0.5
+
+    # all queries with an unknown value share the same (empty) result
+    kb_helper.available_results_from_kb({const.INFORM_SLOTS_KEY: {'moviename': 'unknown movie'}})
+    assert len(kb_helper.available_results_from_kb({const.INFORM_SLOTS_KEY: {'city': 'unknown city'}})) == 0
+    assert kb_helper.cache_stats()['cached_kb']['hits'] == 2
+
+
+def test11_precompute_caches():
+    """
+    Method for testing that the precomputed caches answer the queries of the user goal constraints
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    inform_slots_list = [{}, {'moviename': 'zootopia'}, {'moviename': 'zootopia', 'numberofpeople': '2'},
+                         {'moviename': 'zootopia', 'date': 'tomorrow'}, {'city': 'seattle', 'date': 'tomorrow'}]
+
+    for nb_workers in [1, 2]:
+        precomputed_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+        precomputed_kb_helper.precompute_caches(inform_slots_list, nb_workers)
+        cache_stats = precomputed_kb_helper.cache_stats()
+
+        for inform_slots in inform_slots_list:
+            current_slots = {const.INFORM_SLOTS_KEY: inform_slots}
+            assert precomputed_kb_helper.available_results_from_kb(current_slots) == \
+                   kb_helper.available_results_from_kb(current_slots)
+            assert precomputed_kb_helper.database_results_for_agent(current_slots) == \
+                   kb_helper.database_results_for_agent(current_slots)
+
+        # all queries were answered from the caches
+        for cache_name in ['cached_kb', 'cached_kb_slot']:
+            assert precomputed_kb_helper.cache_stats()[cache_name]['misses'] == cache_stats[cache_name]['misses']
+
+
+def test12_live_updates():
+    """
+    Method for testing that the updated knowledge base answers as a knowledge base built with the updates, and that
+    only the cache entries touching the updated values are removed
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_dir = tempfile.mkdtemp()
+
+    try:
+        GOKBColumns.from_knowledge_dict(knowledge_dict).save(kb_dir)
+
+        inform_slots_list = [{}, {'moviename': 'zootopia'}, {'moviename': 'zootopia', 'city': 'seattle'},
+                             {'city': 'seattle', 'date': 'tomorrow'}, {'moviename': 'deadpool'},
+                             {'genre': 'new genre'}]
+        request_slots = {'ticket': 'UNK', 'starttime': 'UNK', 'theater': 'UNK'}
+
+        def check_updated_kb(kb_helper, updated_dict, same_ids=True):
+            rebuilt_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, dict(updated_dict))
+            for inform_slots in inform_slots_list + [{'city': 'city 1'}, {'moviename': 'deadpool', 'city': 'seattle'}]:
+                current_slots = {const.INFORM_SLOTS_KEY: inform_slots}
+                results = kb_helper.available_results_from_kb(current_slots)
+                rebuilt_results = rebuilt_kb_helper.available_results_from_kb(current_slots)
+                if same_ids:
+                    assert results == rebuilt_results
+                else:
+                    assert sorted(results.values()) == sorted(rebuilt_results.values())
+                assert kb_helper.database_results_for_agent(current_slots) == \
+                       rebuilt_kb_helper.database_results_for_agent(current_slots)
+                assert kb_helper.suggest_slot_values(request_slots, current_slots) == \
+                       rebuilt_kb_helper.suggest_slot_values(request_slots, current_slots)
+
+        for kb_helper in [GOKBHelper(ultimate_request_slot, special_slots, filter_slots, dict(knowledge_dict)),
+                          GOKBHelper(ultimate_request_slot, special_slots, filter_slots, None,
+                                     kb_columns=GOKBColumns.load(kb_dir))]:
+            updated_dict = dict(knowledge_dict)
+            entity_id = sorted(entity_id for entity_id in knowledge_dict
+                               if knowledge_dict[entity_id].get('moviename') == 'zootopia')[0]
+
+            for inform_slots in inform_slots_list:
+                kb_helper.available_results_from_kb({const.INFORM_SLOTS_KEY: inform_slots})
+            unrelated_key = kb_helper.canonical_query_key(kb_helper.canonical_constraints({'moviename': 'deadpool'},
+                                                                                          []))
+
+            updated_dict[entity_id] = dict(knowledge_dict[entity_id], city='seattle', genre='new genre')
+            kb_helper.update_entity(entity_id, updated_dict[entity_id])
+            updated_dict['new entity'] = {'moviename': 'zootopia', 'city': 'seattle', 'date': 'tomorrow'}
+            kb_helper.add_entity('new entity', updated_dict['new entity'])
+            removed_entity_id = sorted(updated_dict.keys())[1]
+            del updated_dict[removed_entity_id]
+            kb_helper.remove_entity(removed_entity_id)
+
+            # the queries of the other movies are still cached
+            assert unrelated_key in kb_helper.cached_kb
+
+            check_updated_kb(kb_helper, updated_dict)
+
+            # more updates than the initial capacity of the row and the posting buffers
+            for idx in xrange(40):
+                added_entity_id = 'added entity {0}'.format(idx)
+                updated_dict[added_entity_id] = dict(knowledge_dict[entity_id], city='city {0}'.format(idx % 3))
+                kb_helper.add_entity(added_entity_id, updated_dict[added_entity_id])
+
+                if idx % 5 == 0:
+                    updated_dict[added_entity_id] = {'moviename': 'deadpool', 'city': 'seattle'}
+                    kb_helper.update_entity(added_entity_id, updated_dict[added_entity_id])
+                if idx % 7 == 0:
+                    del updated_dict[added_entity_id]
+                    kb_helper.remove_entity(added_entity_id)
+
+            check_updated_kb(kb_helper, updated_dict)
+
+            # the updated postings are merged in the saved inverted index
+            updated_kb_dir = os.path.join(kb_dir, 'updated')
+            kb_helper.kb_columns.save(updated_kb_dir)
+            check_updated_kb(kb_helper, updated_dict)
+            # the ids of the added entities are strings, so all ids are saved as strings
+            check_updated_kb(GOKBHelper(ultimate_request_slot, special_slots, filter_slots, None,
+                                        kb_columns=GOKBColumns.load(updated_kb_dir)), updated_dict, same_ids=False)
+            shutil.rmtree(updated_kb_dir)
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test13_fuzzy_values():
+    """
+    Method for testing that the noisy values are matched to the most similar values of the knowledge base
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+    kb_dir = tempfile.mkdtemp()
+
+    try:
+        sqlite_path = os.path.join(kb_dir, 'kb.sqlite')
+        save_sqlite_kb(GOKBColumns.from_knowledge_dict(knowledge_dict), sqlite_path)
+
+        current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'theater': 'amc pacific place'}}
+        noisy_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'Zootopa!', 'theater': 'amc pacific'}}
+        assert len(kb_helper.available_results_from_kb(noisy_slots)) == 0
+
+        for fuzzy_kb_helper in [GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict,
+                                           fuzzy_threshold=0.5),
+                                GOSQLiteKBHelper(ultimate_request_slot, special_slots, filter_slots, sqlite_path,
+                                                 fuzzy_threshold=0.5)]:
+            assert fuzzy_kb_helper.available_results_from_kb(noisy_slots) == \
+                   kb_helper.available_results_from_kb(current_slots)
+            assert fuzzy_kb_helper.database_results_for_agent(noisy_slots) == \
+                   kb_helper.database_results_for_agent(current_slots)
+
+            # the values without a similar enough value, as the other numbers, still match nothing
+            assert fuzzy_kb_helper.value_code('numberofpeople', '7') == const.KB_NO_MATCH_CODE
+            assert fuzzy_kb_helper.value_code('moviename', 'a completely different movie') == const.KB_NO_MATCH_CODE
+
+        # a value added to the knowledge base is also found by the approximate matching
+        fuzzy_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, dict(knowledge_dict),
+                                     fuzzy_threshold=0.5)
+        assert fuzzy_kb_helper.value_code('moviename', 'the new movie!') == const.KB_NO_MATCH_CODE
+        fuzzy_kb_helper.add_entity('new entity', {'moviename': 'The New Movie', 'city': 'seattle'})
+        assert len(fuzzy_kb_helper.available_results_from_kb({const.INFORM_SLOTS_KEY:
+                                                                  {'moviename': 'the new movie!'}})) == 1
+    finally:
+        shutil.rmtree(kb_dir)
+
+
+def test14_shared_caches():
+    """
+    Method for testing that the query results of one process are reused by the other processes sharing the caches
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    # distinct queries, all of them matching some entities
+    movie_theaters = sorted(set((entity['moviename'].lower(), entity['theater'].lower())
+                                for entity in knowledge_dict.values() if 'moviename' in entity and 'theater' in entity))
+
+    manager = multiprocessing.Manager()
+    kb_dir = tempfile.mkdtemp()
+    try:
+        kb_columns = GOKBColumns.from_knowledge_dict(knowledge_dict)
+        assert kb_columns.share(kb_dir) == kb_dir and kb_columns.kb_dir == kb_dir
+
+        shared_caches = create_shared_kb_caches(manager)
+        kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, None, kb_columns=kb_columns,
+                               shared_caches=shared_caches)
+        other_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, None,
+                                     kb_columns=GOKBColumns.load(kb_dir), shared_caches=shared_caches)
+
+        # the new entries are written to the shared caches in batches
+        flush_size = kb_helper.cached_kb.flush_size
+        queries = [{const.INFORM_SLOTS_KEY: {'moviename': movie_name, 'theater': theater}}
+                   for movie_name, theater in movie_theaters[:flush_size + 1]]
+        results = [kb_helper.available_results_from_kb(current_slots) for current_slots in queries]
+        assert len(shared_caches['cached_kb']) == flush_size
+        assert len(kb_helper.cached_kb.pending_entries) == 1
+
+        kb_helper.flush_caches()
+        assert len(shared_caches['cached_kb']) == flush_size + 1
+        assert kb_helper.cache_stats()['cached_kb']['shared_size'] == flush_size + 1
+
+        # the other process finds all results in the shared caches
+        assert [other_kb_helper.available_results_from_kb(current_slots) for current_slots in queries] == results
+        assert other_kb_helper.cache_stats()['cached_kb']['shared_hits'] == flush_size + 1
+
+        # the knowledge base is not updated while its caches are shared, the other process would answer stale results
+        entity_id = kb_columns.entity_ids_at([0])[0]
+        for update in [lambda: kb_helper.add_entity('new entity', {'moviename': 'zootopia'}),
+                       lambda: kb_helper.update_entity(entity_id, {'moviename': 'zootopia'}),
+                       lambda: kb_helper.remove_entity(entity_id)]:
+            try:
+                update()
+                assert False
+            except Exception as e:
+                assert 'shared' in str(e)
+
+        assert kb_columns.nb_entities() == len(knowledge_dict)
+        assert [other_kb_helper.available_results_from_kb(current_slots) for current_slots in queries] == results
+    finally:
+        manager.shutdown()
+        shutil.rmtree(kb_dir)
+
+
+def test15_new_cache_entries():
+    """
+    Method for testing that the new entries of the query caches of a process are merged into the caches of another one
+    """
+
+    ultimate_request_slot = 'ticket'
+    special_slots = ['numberofpeople']
+    filter_slots = ['ticket', 'numberofpeople', 'taskcomplete', 'closing']
+    knowledge_dict_path = os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p')
+
+    knowledge_dict = pickle.load(open(knowledge_dict_path, 'rb'))
+    kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+    other_kb_helper = GOKBHelper(ultimate_request_slot, special_slots, filter_slots, knowledge_dict)
+
+    # the entries put before the recording are not taken
+    current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia'}}
+    kb_helper.database_results_for_agent(current_slots)
+    kb_helper.record_new_cache_entries()
+    assert kb_helper.take_new_cache_entries() == []
+
+    new_current_slots = {const.INFORM_SLOTS_KEY: {'moviename': 'zootopia', 'date': 'tomorrow'}}
+    results = kb_helper.available_results_from_kb(new_current_slots)
+    kb_results = kb_helper.database_results_for_agent(new_current_slots)
+
+    entries = kb_helper.take_new_cache_entries()
+    assert set(cache_name for cache_name, _, _ in entries) == set(['cached_kb', 'cached_kb_slot'])
+    assert kb_helper.take_new_cache_entries() == []
+
+    # the other helper answers from the merged entries
+    other_kb_helper.put_cache_entries(entries)
+    assert other_kb_helper.available_results_from_kb(new_current_slots) == results
+    assert other_kb_helper.database_results_for_agent(new_current_slots) == kb_results
+    assert other_kb_helper.cache_stats()['cached_kb']['misses'] == 0
+    assert other_kb_helper.cache_stats()['cached_kb_slot']['misses'] == 0
 
 
 logging.basicConfig(filename='kb_helper_test.log', format='%(asctime)s %(levelname)s:%(message)s', level=logging.DEBUG)
 logging.info('Started')
 test1_kb_helper()
+test2_inverted_index()
+test3_slot_counts()
+test4_bounded_cache()
+test5_memory_mapped_kb()
+test6_incremental_refinement()
+test7_sqlite_kb()
+test8_batch_counts()
+test9_persistent_cache()
+test10_canonical_queries()
+test11_precompute_caches()
+test12_live_updates()
+test13_fuzzy_values()
+test14_shared_caches()
+test15_new_cache_entries()
 logging.info('Finished')
\ No newline at end of file
@@ -4,13 +4,18 @@ Author: Vladimir Ilievski <ilievski.vladimir@live.com>
 A Python file for testing the state trackers in the Goal-Oriented Dialogue Systems
 """
 
-import os, sys, logging
+import os, sys, logging, shutil, tempfile
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from core import constants as const
 from core import util
-from core.dst.state_tracker import GORuleBasedStateTracker
+from core import dialog_config
+from core.dst.state_tracker import GORuleBasedStateTracker, GOBatchRuleBasedStateTracker, GOModelBasedStateTracker, \
+    GOBatchModelBasedStateTracker
+from core.dst.model import GOGRUModel, sigmoid
+from core.dst.sparse import sparse_to_dense, sparse_states_to_csr, csr_to_dense, csr_dot
 from core.dm.kb_helper import GOKBHelper
+import numpy as np
 import cPickle as pickle
 
 def test1_actions():
@@ -116,8 +121,363 @@ def test1_rule_based_state_tracker():
     state = state_tracker.produce_state()
 
 
+def test2_state_segments():
+    """
+    Method for testing that the state is written in its segments, and in a caller-provided output row
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30, kb_helper=kb_helper)
+    state_tracker.reset()
+
+    init_usr_action, agt_action, usr_action = test1_actions()
+    state_tracker.update(init_usr_action, const.USR_SPEAKER_VAL)
+    state_tracker.update(agt_action, const.AGT_SPEAKER_VAL)
+    state_tracker.update(usr_action, const.USR_SPEAKER_VAL)
+
+    state = state_tracker.produce_state()
+    assert state.shape == (1, state_tracker.state_dim)
+
+    # the segments cover the whole state, one after the other
+    segments = state_tracker.state_segments.values()
+    assert segments[0].start == 0 and segments[-1].stop == state_tracker.state_dim
+    assert all(segment.stop == next_segment.start for segment, next_segment in zip(segments, segments[1:]))
+
+    usr_act_encoding = state[0, state_tracker.state_segments['usr_act']]
+    assert usr_act_encoding[act_set[const.INFORM_DIA_ACT_KEY]] == 1. and usr_act_encoding.sum() == 1.
+    agt_request_slots_encoding = state[0, state_tracker.state_segments['agt_request_slots']]
+    assert agt_request_slots_encoding[slot_set['date']] == 1. and agt_request_slots_encoding.sum() == 1.
+    assert state[0, state_tracker.state_segments['turn']][state_tracker.current_turn_nb] == 1.
+
+    # the state is written in a row of a batch, the other rows are not changed
+    batch = np.ones((3, state_tracker.state_dim))
+    state_tracker.produce_state(out=batch[1])
+    assert np.array_equal(batch[1], state[0]) and np.all(batch[0] == 1.) and np.all(batch[2] == 1.)
+
+
+def test3_sparse_state():
+    """
+    Method for testing that the sparse states and their CSR batches are equal to the dense states
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30, kb_helper=kb_helper)
+    state_tracker.reset()
+
+    dense_states = []
+    sparse_states = []
+    for action, speaker in zip(test1_actions(), [const.USR_SPEAKER_VAL, const.AGT_SPEAKER_VAL, const.USR_SPEAKER_VAL]):
+        state_tracker.update(action, speaker)
+
+        dense_states.append(state_tracker.produce_state())
+        sparse_states.append(state_tracker.produce_sparse_state())
+
+        indices, values = sparse_states[-1]
+        assert np.all(np.diff(indices) > 0) and np.all(values != 0.)
+        assert np.array_equal(sparse_to_dense(sparse_states[-1], state_tracker.state_dim), dense_states[-1])
+
+    dense_batch = np.vstack(dense_states)
+    csr = sparse_states_to_csr(sparse_states)
+    assert np.array_equal(csr_to_dense(csr, state_tracker.state_dim), dense_batch)
+
+    weights = np.random.RandomState(0).randn(state_tracker.state_dim, 8)
+    assert np.allclose(csr_dot(csr, weights), dense_batch.dot(weights))
+
+
+def test4_turn_records():
+    """
+    Method for testing that the history keeps read-only records of the actions, independent of the actions
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30, kb_helper=kb_helper)
+    state_tracker.reset()
+
+    init_usr_action, agt_action, usr_action = test1_actions()
+    state_tracker.update(init_usr_action, const.USR_SPEAKER_VAL)
+    state_tracker.update(agt_action, const.AGT_SPEAKER_VAL)
+    state_tracker.update(usr_action, const.USR_SPEAKER_VAL)
+
+    last_usr_action = state_tracker.get_last_usr_action()
+    last_agt_action = state_tracker.get_last_agt_action()
+    assert last_usr_action == {const.TURN_NB_KEY: 2, const.SPEAKER_TYPE_KEY: const.USR_SPEAKER_VAL,
+                               const.DIA_ACT_KEY: const.INFORM_DIA_ACT_KEY,
+                               const.INFORM_SLOTS_KEY: {'date': 'today'}, const.REQUEST_SLOTS_KEY: {}}
+    assert last_agt_action[const.SPEAKER_TYPE_KEY] == const.AGT_SPEAKER_VAL
+    assert last_agt_action.request_slots == agt_action[const.REQUEST_SLOTS_KEY]
+
+    # changing the action does not change its record, and the records cannot be changed
+    usr_action[const.INFORM_SLOTS_KEY]['starttime'] = '8pm'
+    assert 'starttime' not in last_usr_action[const.INFORM_SLOTS_KEY]
+
+    for change_record in [lambda: last_usr_action[const.INFORM_SLOTS_KEY].update({'starttime': '8pm'}),
+                          lambda: setattr(last_usr_action, 'dia_act', const.REQUEST_DIA_ACT_KEY)]:
+        try:
+            change_record()
+            assert False
+        except TypeError:
+            pass
+
+    assert pickle.loads(pickle.dumps(last_usr_action, pickle.HIGHEST_PROTOCOL)) == last_usr_action
+
+
+def test5_batch_state_tracker():
+    """
+    Method for testing that the batch state tracker produces the states of the rule-based state tracker
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    batch_state_tracker = GOBatchRuleBasedStateTracker(nb_dialogues=3, act_set=act_set, slot_set=slot_set,
+                                                       max_nb_turns=30, kb_helper=kb_helper)
+    state_trackers = [GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30,
+                                              kb_helper=kb_helper) for _ in xrange(3)]
+    batch_state_tracker.reset()
+    for state_tracker in state_trackers:
+        state_tracker.reset()
+
+    # the dialogues are at different turns, the last one has not started
+    speakers = [const.USR_SPEAKER_VAL, const.AGT_SPEAKER_VAL, const.USR_SPEAKER_VAL]
+    for dialogue_idx, nb_actions in enumerate([3, 1, 0]):
+        for action, speaker in zip(test1_actions(), speakers)[:nb_actions]:
+            batch_state_tracker.update(dialogue_idx, action, speaker)
+            state_trackers[dialogue_idx].update(action, speaker)
+
+    states = batch_state_tracker.produce_state()
+    assert states.shape == (3, batch_state_tracker.state_dim) and states.dtype == np.float32
+    for dialogue_idx, state_tracker in enumerate(state_trackers):
+        assert np.array_equal(states[dialogue_idx], state_tracker.produce_state()[0].astype(np.float32))
+        assert batch_state_tracker.get_current_slots(dialogue_idx) == state_tracker.current_slots
+
+    # resetting a dialogue does not change the others
+    batch_state_tracker.reset([0])
+    state_trackers[0].reset()
+    assert np.array_equal(batch_state_tracker.produce_state(),
+                          np.vstack([state_tracker.produce_state() for state_tracker in state_trackers]).astype(np.float32))
+
+
+def test6_incremental_state():
+    """
+    Method for testing that the patched states are equal to the fully encoded states
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           dict(knowledge_dict))
+    # every patched state is checked against the full encoding
+    state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30, kb_helper=kb_helper,
+                                            check_incremental_state=True)
+    state_tracker.reset()
+
+    speakers = [const.USR_SPEAKER_VAL, const.AGT_SPEAKER_VAL, const.USR_SPEAKER_VAL]
+    for action, speaker in zip(test1_actions(), speakers):
+        state_tracker.update(action, speaker)
+        state = state_tracker.produce_state()
+
+    # the kb segments are patched after an update of the knowledge base
+    kb_helper.add_entity('new_entity', {'moviename': 'deadpool', 'date': 'today'})
+    assert not np.array_equal(state_tracker.produce_state(), state)
+
+    # the returned states are copies of the kept state
+    state[0, :] = -1.
+    assert not np.array_equal(state_tracker.produce_state(), state)
+
+    # a wrongly patched state is detected
+    state_tracker.state[state_tracker.state_segments['all_inform_slots']] = 1.
+    is_detected = False
+    try:
+        state_tracker.produce_state()
+    except AssertionError:
+        is_detected = True
+    assert is_detected
+
+
+def test7_action_encodings():
+    """
+    Method for testing that the precomputed and the memoized action encodings are equal to the encoded actions
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30, kb_helper=kb_helper,
+                                            feasible_actions=dialog_config.feasible_actions)
+    assert len(state_tracker.feasible_action_encodings) == len(dialog_config.feasible_actions)
+
+    usr_act_segment = state_tracker.state_segments['usr_act']
+    for feasible_action in dialog_config.feasible_actions:
+        encoding = state_tracker.action_encoding(feasible_action)
+        assert encoding.sum() == 1 + len(feasible_action[const.INFORM_SLOTS_KEY]) + \
+                                 len(feasible_action[const.REQUEST_SLOTS_KEY])
+        assert encoding[act_set[feasible_action[const.DIA_ACT_KEY]]] == 1.
+        assert not encoding.flags.writeable
+
+    # the user actions are memoized, the values of the slots do not matter
+    init_usr_action, agt_action, usr_action = test1_actions()
+    encoding = state_tracker.action_encoding(init_usr_action)
+    init_usr_action[const.INFORM_SLOTS_KEY]['moviename'] = 'zootopia'
+    assert state_tracker.action_encoding(init_usr_action) is encoding
+    assert state_tracker.cached_action_encodings.hits == 1 and state_tracker.cached_action_encodings.misses == 1
+
+    state_tracker.reset()
+    state_tracker.update(init_usr_action, const.USR_SPEAKER_VAL)
+    state = state_tracker.produce_state()
+    assert np.array_equal(state[0, usr_act_segment.start:state_tracker.state_segments['usr_request_slots'].stop],
+                          encoding)
+
+
+def test8_model_based_state_tracker():
+    """
+    Method for testing the model-based state trackers against a step by step evaluation of the model
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+
+    input_dim = len(act_set) + 2 * len(slot_set) + 1
+    model = GOGRUModel.create(input_dim, 16, np.random.RandomState(0))
+    model.bias[:] = np.random.RandomState(1).randn(len(model.bias))
+
+    # the weights are saved and loaded from a `.npz` file
+    model_dir = tempfile.mkdtemp()
+    try:
+        model_path = os.path.join(model_dir, 'dst_model.npz')
+        model.save(model_path)
+        state_tracker = GOModelBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30,
+                                                 kb_helper=kb_helper, model_path=model_path)
+    finally:
+        shutil.rmtree(model_dir)
+
+    rule_based_state_tracker = GORuleBasedStateTracker(act_set=act_set, slot_set=slot_set, max_nb_turns=30,
+                                                       kb_helper=kb_helper)
+    batch_state_tracker = GOBatchModelBasedStateTracker(nb_dialogues=2, act_set=act_set, slot_set=slot_set,
+                                                        max_nb_turns=30, kb_helper=kb_helper, model=model)
+    state_tracker.reset()
+    rule_based_state_tracker.reset()
+
+    hidden = np.zeros(16)
+    hidden_size = model.hidden_size
+    speakers = [const.USR_SPEAKER_VAL, const.AGT_SPEAKER_VAL, const.USR_SPEAKER_VAL]
+    for action, speaker in zip(test1_actions(), speakers):
+        state_tracker.update(action, speaker)
+        rule_based_state_tracker.update(action, speaker)
+        # the second dialogue of the batch is updated with the first one
+        batch_state_tracker.update_batch([1, 0], [action, action], [speaker, speaker])
+
+        # the input is the encoding of the action followed by the speaker
+        x = np.zeros(input_dim)
+        x[:input_dim - 1] = rule_based_state_tracker.action_encoding(action)
+        x[input_dim - 1] = speaker == const.AGT_SPEAKER_VAL
+        gates = x.dot(model.input_weights) + model.bias
+        z = sigmoid(gates[:hidden_size] + hidden.dot(model.recurrent_weights[:, :hidden_size]))
+        r = sigmoid(gates[hidden_size:2 * hidden_size] +
+                    hidden.dot(model.recurrent_weights[:, hidden_size:2 * hidden_size]))
+        n = np.tanh(gates[2 * hidden_size:] + (r * hidden).dot(model.recurrent_weights[:, 2 * hidden_size:]))
+        hidden = (1 - z) * n + z * hidden
+
+        state = state_tracker.produce_state()
+        assert state.shape == (1, state_tracker.get_state_dimension()) and state.dtype == np.float32
+        assert np.allclose(state[0, state_tracker.batch_state_tracker.state_segments['hidden']], hidden, atol=1e-5)
+        assert state_tracker.current_slots == rule_based_state_tracker.current_slots
+
+        # the kb segments are the ones of the rule-based state
+        rule_based_state = rule_based_state_tracker.produce_state()[0]
+        assert np.array_equal(state[0, hidden_size:],
+                              rule_based_state[rule_based_state_tracker.state_segments['kb_binary'].start:].astype(np.float32))
+
+        batch_states = batch_state_tracker.produce_state()
+        assert np.allclose(batch_states, np.vstack([state, state]), atol=1e-6)
+
+    assert len(state_tracker.get_history()) == 3 and state_tracker.current_turn_nb == 3
+
+
+def test9_keras_gru_export():
+    """
+    Method for testing that the model exported from the weights of a Keras GRU layer computes the Keras GRU
+    """
+
+    input_dim, hidden_size, batch_size = 12, 5, 2
+    random_state = np.random.RandomState(0)
+    kernel = random_state.randn(input_dim, 3 * hidden_size)
+    recurrent_kernel = random_state.randn(hidden_size, 3 * hidden_size)
+    bias = random_state.randn(3 * hidden_size)
+
+    def keras_gru_step(x, h):
+        # the Keras GRU with `reset_after=False` and `recurrent_activation='sigmoid'`, the gates in the order z, r, h
+        x_z = x.dot(kernel[:, :hidden_size]) + bias[:hidden_size]
+        x_r = x.dot(kernel[:, hidden_size:2 * hidden_size]) + bias[hidden_size:2 * hidden_size]
+        x_h = x.dot(kernel[:, 2 * hidden_size:]) + bias[2 * hidden_size:]
+        z = sigmoid(x_z + h.dot(recurrent_kernel[:, :hidden_size]))
+        r = sigmoid(x_r + h.dot(recurrent_kernel[:, hidden_size:2 * hidden_size]))
+        hh = np.tanh(x_h + (r * h).dot(recurrent_kernel[:, 2 * hidden_size:]))
+        return z * h + (1 - z) * hh
+
+    keras_1_weights = []
+    for gate in xrange(3):
+        gate_slice = slice(gate * hidden_size, (gate + 1) * hidden_size)
+        keras_1_weights += [kernel[:, gate_slice], recurrent_kernel[:, gate_slice], bias[gate_slice]]
+
+    for model in [GOGRUModel.from_keras_weights([kernel, recurrent_kernel, bias]),
+                  GOGRUModel.from_keras_weights(keras_1_weights)]:
+        hidden = model.initial_hidden(batch_size)
+        keras_hidden = np.zeros((batch_size, hidden_size))
+        for _ in xrange(5):
+            input_indices = [sorted(random_state.choice(input_dim, 3, replace=False)) for _ in xrange(batch_size)]
+            x = np.zeros((batch_size, input_dim))
+            for row, indices in enumerate(input_indices):
+                x[row, indices] = 1.
+
+            hidden = model.step(np.array([model.input_projection(indices) for indices in input_indices]), hidden)
+            keras_hidden = keras_gru_step(x, keras_hidden)
+            assert np.allclose(hidden, keras_hidden, atol=1e-5)
+
+    # the weights without bias get a zero bias, the ones of `reset_after=True` are not supported
+    assert np.array_equal(GOGRUModel.from_keras_weights([kernel, recurrent_kernel]).bias, np.zeros(3 * hidden_size))
+    try:
+        GOGRUModel.from_keras_weights([kernel, recurrent_kernel, np.stack([bias, bias])])
+        assert False
+    except Exception as e:
+        assert 'reset_after' in str(e)
+
 
 logging.basicConfig(filename='dst_test.log', format='%(asctime)s %(levelname)s:%(message)s', level=logging.DEBUG)
 logging.info('Started')
 test1_rule_based_state_tracker()
+test2_state_segments()
+test3_sparse_state()
+test4_turn_records()
+test5_batch_state_tracker()
+test6_incremental_state()
+test7_action_encodings()
+test8_model_based_state_tracker()
+test9_keras_gru_export()
 logging.info('Finished')
@@ -9,8 +9,11 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from core import constants as const
 from core import util
-from core.environment.environment import GOEnv
+from core.environment.environment import GOEnv, GOVecEnv
+from core.environment.rollout import GORolloutWorkers, summarize_episodes
+from core.agent.policy import GOPolicySnapshot
 from core.dm.kb_helper import GOKBHelper
+import numpy as np
 import cPickle as pickle
 
 
@@ -125,7 +128,152 @@ def test1_environment():
     env.step(agt_action)
 
 
+def test2_vec_environment():
+    """
+    Method for testing the vectorized Environment class for the movie booking data set
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    goal_set = util.load_goal_set(os.path.join(util.project_path, 'resources', 'data',
+                                               'user_goals_first_turn_template.part.movie.v1.p'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    test_feasible_actions = test1_feasible_actions()
+
+    # all params
+    params = {}
+    params[const.SIMULATION_MODE_KEY] = const.SEMANTIC_FRAME_SIMULATION_MODE
+    params[const.IS_TRAINING_KEY] = True
+    params[const.USER_TYPE_KEY] = const.RULE_BASED_USER
+    params[const.STATE_TRACKER_TYPE_KEY] = const.RULE_BASED_STATE_TRACKER
+    params[const.MAX_NB_TURNS] = 30
+    params[const.SUCCESS_REWARD_KEY] = 2 * params[const.MAX_NB_TURNS]
+    params[const.FAILURE_REWARD_KEY] = - params[const.MAX_NB_TURNS]
+    params[const.PER_TURN_REWARD_KEY] = -1
+    params[const.NLU_PATH_KEY] = os.path.join(util.project_path, 'resources', 'models', 'nlu',
+                                              'lstm_[1468447442.91]_39_80_0.921.p')
+    params[const.DIAACT_NL_PAIRS_PATH_KEY] = os.path.join(util.project_path, 'resources', 'data',
+                                                          'dia_act_nl_pairs.v6.json')
+    params[const.NLG_PATH_KEY] = os.path.join(util.project_path, 'resources', 'models', 'nlg',
+                                              'lstm_tanh_relu_[1468202263.38]_2_0.610.p')
+
+    nb_envs = 8
+    vec_env = GOVecEnv(nb_envs=nb_envs, act_set=act_set, slot_set=slot_set, goal_set=goal_set,
+                       init_inform_slots=['moviename'], ultimate_request_slot='ticket',
+                       feasible_actions=test_feasible_actions, kb_helper=kb_helper, params=params)
+
+    states = vec_env.reset()
+    assert states.shape == (nb_envs, vec_env.get_state_dimension())
+
+    random_state = np.random.RandomState(0)
+    for _ in xrange(2 * params[const.MAX_NB_TURNS]):
+        actions = random_state.randint(len(test_feasible_actions), size=nb_envs)
+        states, rewards, dones, infos = vec_env.step(actions)
+        assert states.shape == (nb_envs, vec_env.get_state_dimension())
+        assert rewards.shape == (nb_envs,) and dones.shape == (nb_envs,)
+
+        # every info has the status of its dialogue, only the finished dialogues have an outcome
+        for env_idx, info in enumerate(infos):
+            assert (info[const.DIALOGUE_STATUS_KEY] != const.NO_OUTCOME_YET) == dones[env_idx]
+            assert ('terminal_observation' in info) == dones[env_idx]
+
+        # the finished dialogues are started again
+        for env_idx in np.flatnonzero(dones):
+            assert infos[env_idx]['terminal_observation'].shape == (vec_env.get_state_dimension(),)
+            assert vec_env.current_turn_nb[env_idx] == 1
+
+
+def test3_rollout_workers():
+    """
+    Method for testing the simulation of the dialogues in parallel worker processes for the movie booking data set
+    """
+
+    act_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'dia_acts.txt'))
+    slot_set = util.text_to_dict(os.path.join(util.project_path, 'resources', 'data', 'slot_set.txt'))
+    goal_set = util.load_goal_set(os.path.join(util.project_path, 'resources', 'data',
+                                               'user_goals_first_turn_template.part.movie.v1.p'))
+    knowledge_dict = pickle.load(open(os.path.join(util.project_path, 'resources', 'data', 'movie_kb.1k.p'), 'rb'))
+
+    kb_helper = GOKBHelper('ticket', ['numberofpeople'], ['ticket', 'numberofpeople', 'taskcomplete', 'closing'],
+                           knowledge_dict)
+    test_feasible_actions = test1_feasible_actions()
+
+    # all params
+    params = {}
+    params[const.SIMULATION_MODE_KEY] = const.SEMANTIC_FRAME_SIMULATION_MODE
+    params[const.IS_TRAINING_KEY] = True
+    params[const.USER_TYPE_KEY] = const.RULE_BASED_USER
+    params[const.STATE_TRACKER_TYPE_KEY] = const.RULE_BASED_STATE_TRACKER
+    params[const.MAX_NB_TURNS] = 30
+    params[const.SUCCESS_REWARD_KEY] = 2 * params[const.MAX_NB_TURNS]
+    params[const.FAILURE_REWARD_KEY] = - params[const.MAX_NB_TURNS]
+    params[const.PER_TURN_REWARD_KEY] = -1
+    params[const.NLU_PATH_KEY] = os.path.join(util.project_path, 'resources', 'models', 'nlu',
+                                              'lstm_[1468447442.91]_39_80_0.921.p')
+    params[const.DIAACT_NL_PAIRS_PATH_KEY] = os.path.join(util.project_path, 'resources', 'data',
+                                                          'dia_act_nl_pairs.v6.json')
+    params[const.NLG_PATH_KEY] = os.path.join(util.project_path, 'resources', 'models', 'nlg',
+                                              'lstm_tanh_relu_[1468202263.38]_2_0.610.p')
+
+    env = GOEnv(act_set=act_set, slot_set=slot_set, goal_set=goal_set, init_inform_slots=['moviename'],
+                ultimate_request_slot='ticket', feasible_actions=test_feasible_actions, kb_helper=kb_helper,
+                params=params)
+
+    # a snapshot of a randomly initialized Q-network, taking random actions half of the time
+    random_state = np.random.RandomState(0)
+    weights = [random_state.randn(env.get_state_dimension(), 16), np.zeros(16),
+               random_state.randn(16, len(test_feasible_actions)), np.zeros(len(test_feasible_actions))]
+    policy = GOPolicySnapshot(weights, const.RELU, eps=.5)
+
+    nb_episodes = 20
+    assert len(kb_helper.cached_kb_slot) == 0
+    rollout_workers = GORolloutWorkers(env, nb_workers=2)
+    try:
+        episodes = list(rollout_workers.run_episodes(policy, nb_episodes))
+
+        # the same workers serve the next simulation
+        episodes += list(rollout_workers.run_episodes(policy, nb_episodes))
+
+        # the query results of the workers are merged into the caches of this process
+        assert len(kb_helper.cached_kb_slot) > 0
+
+        # the workers would answer from the knowledge base as it was before its update
+        kb_helper.add_entity('new movie', {'moviename': 'zootopia', 'theater': 'carmike summit 16'})
+        assert rollout_workers.is_stale()
+        try:
+            list(rollout_workers.run_episodes(policy, nb_episodes))
+            assert False
+        except Exception as e:
+            assert 'updated after the rollout workers were forked' in str(e)
+    finally:
+        rollout_workers.close()
+
+    # a single worker simulates the dialogues in this process, with the updated knowledge base
+    rollout_workers = GORolloutWorkers(env, nb_workers=1)
+    assert rollout_workers.pool is None and not rollout_workers.is_stale()
+    assert len(list(rollout_workers.run_episodes(policy, 3))) == 3
+    rollout_workers.close()
+
+    assert len(episodes) == 2 * nb_episodes
+    for transitions, episode_stats in episodes:
+        assert len(transitions) > 0 and transitions[-1][4]
+        assert not any(done for _, _, _, _, done in transitions[:-1])
+        assert episode_stats['reward'] == sum(reward for _, _, reward, _, _ in transitions)
+        assert episode_stats[const.DIALOGUE_STATUS_KEY] in [const.SUCCESS_DIALOG, const.FAILED_DIALOG]
+
+    # the tasks are seeded differently, so the dialogues differ
+    assert len(set(tuple(action for _, action, _, _, _ in transitions) for transitions, _ in episodes)) > 1
+
+    res = summarize_episodes([episode_stats for _, episode_stats in episodes])
+    assert 0. <= res['success_rate'] <= 1. and res['ave_turns'] > 0
+
+
 logging.basicConfig(filename='env_test.log', format='%(asctime)s %(levelname)s:%(message)s', level=logging.DEBUG)
 logging.info('Started')
 test1_environment()
+test2_vec_environment()
+test3_rollout_workers()
 logging.info('Finished')
@@ -27,7 +27,7 @@ RL: python run.py --agt 9 --usr 1 --max_turn 40 --movie_kb_path .\deep_dialog\da
 """
 
 
-import argparse, json, copy, os
+import argparse, json, copy, os, sys, multiprocessing
 import cPickle as pickle
 
 from deep_dialog.dialog_system import DialogManager, text_to_dict
@@ -88,6 +88,7 @@ if __name__ == "__main__":
     parser.add_argument('--gamma', dest='gamma', type=float, default=0.9, help='gamma for DQN')
     parser.add_argument('--predict_mode', dest='predict_mode', type=bool, default=False, help='predict model for DQN')
     parser.add_argument('--simulation_epoch_size', dest='simulation_epoch_size', type=int, default=100, help='the size of validation set')
+    parser.add_argument('--nb_rollout_workers', dest='nb_rollout_workers', type=int, default=1, help='the number of processes simulating the dialogues of a simulation epoch')
     parser.add_argument('--warm_start', dest='warm_start', type=int, default=1, help='0: no warm start; 1: warm start for training')
     parser.add_argument('--warm_start_epochs', dest='warm_start_epochs', type=int, default=100, help='the number of epochs for warm start')
 
@@ -315,6 +316,48 @@ def save_performance_records(path, agt, records):
         print 'Error: Writing model fails: %s' % (filepath, )
         print e
 
+""" Run one simulation Dialogue, returning its new experiences, its reward, its success and its number of turns """
+def simulation_episode():
+    nb_experiences = len(agent.experience_replay_pool)
+    episode_reward = 0
+    
+    dialog_manager.initialize_episode()
+    episode_over = False
+    while(not episode_over):
+        episode_over, reward = dialog_manager.next_turn()
+        episode_reward += reward
+    
+    return agent.experience_replay_pool[nb_experiences:], episode_reward, reward > 0, dialog_manager.state_tracker.turn_count
+
+""" Run a slice of the simulation Dialogues in a worker process, the task is the DQN and mode of the agent, a seed and the number of Dialogues """
+def simulation_worker_episodes(task):
+    dqn, agent.predict_mode, agent.warm_start, seed, nb_episodes = task
+    if dqn is not None:
+        agent.dqn = dqn
+    agent.experience_replay_pool = []
+    random.seed(seed)
+    
+    return [simulation_episode() for episode in xrange(nb_episodes)]
+
+""" Run N simulation Dialogues, split in one task per rollout worker if any, such that the DQN is sent once to every worker """
+def simulation_episodes(nb_episodes):
+    if rollout_pool is None:
+        return [simulation_episode() for episode in xrange(nb_episodes)]
+    
+    # the rule policy of the warm start does not use the DQN, so it is not sent
+    dqn = None if agent.warm_start == 1 else agent.dqn
+    nb_tasks = min(nb_rollout_workers, nb_episodes)
+    tasks = [(dqn, agent.predict_mode, agent.warm_start, random.randint(0, sys.maxint), (nb_episodes + task_idx) // nb_tasks) for task_idx in xrange(nb_tasks)]
+    
+    episodes = []
+    for worker_episodes in rollout_pool.imap_unordered(simulation_worker_episodes, tasks):
+        # the experiences of the workers go to the pool of the agent, in process they are already there
+        for experiences, episode_reward, success, turn_count in worker_episodes:
+            agent.experience_replay_pool.extend(experiences)
+        episodes.extend(worker_episodes)
+    
+    return episodes
+
 """ Run N simulation Dialogues """
 def simulation_epoch(simulation_epoch_size):
     successes = 0
@@ -322,18 +365,13 @@ def simulation_epoch(simulation_epoch_size):
     cumulative_turns = 0
     
     res = {}
-    for episode in xrange(simulation_epoch_size):
-        dialog_manager.initialize_episode()
-        episode_over = False
-        while(not episode_over):
-            episode_over, reward = dialog_manager.next_turn()
-            cumulative_reward += reward
-            if episode_over:
-                if reward > 0: 
-                    successes += 1
-                    print ("simulation episode %s: Success" % (episode))
-                else: print ("simulation episode %s: Fail" % (episode))
-                cumulative_turns += dialog_manager.state_tracker.turn_count
+    for episode, (experiences, episode_reward, success, turn_count) in enumerate(simulation_episodes(simulation_epoch_size)):
+        cumulative_reward += episode_reward
+        cumulative_turns += turn_count
+        if success: 
+            successes += 1
+            print ("simulation episode %s: Success" % (episode))
+        else: print ("simulation episode %s: Fail" % (episode))
     
     res['success_rate'] = float(successes)/simulation_epoch_size
     res['ave_reward'] = float(cumulative_reward)/simulation_epoch_size
@@ -349,20 +387,18 @@ def warm_start_simulation():
     
     res = {}
     warm_start_run_epochs = 0
-    for episode in xrange(warm_start_epochs):
-        dialog_manager.initialize_episode()
-        episode_over = False
-        while(not episode_over):
-            episode_over, reward = dialog_manager.next_turn()
-            cumulative_reward += reward
-            if episode_over:
-                if reward > 0: 
-                    successes += 1
-                    print ("warm_start simulation episode %s: Success" % (episode))
-                else: print ("warm_start simulation episode %s: Fail" % (episode))
-                cumulative_turns += dialog_manager.state_tracker.turn_count
-        
-        warm_start_run_epochs += 1
+    # the episodes run in batches of one per rollout worker, until the experience replay pool is full
+    while warm_start_run_epochs < warm_start_epochs:
+        batch_size = min(nb_rollout_workers, warm_start_epochs - warm_start_run_epochs)
+        for experiences, episode_reward, success, turn_count in simulation_episodes(batch_size):
+            cumulative_reward += episode_reward
+            cumulative_turns += turn_count
+            if success: 
+                successes += 1
+                print ("warm_start simulation episode %s: Success" % (warm_start_run_epochs))
+            else: print ("warm_start simulation episode %s: Fail" % (warm_start_run_epochs))
+            
+            warm_start_run_epochs += 1
         
         if len(agent.experience_replay_pool) >= agent.experience_replay_pool_size:
             break
@@ -371,7 +407,7 @@ def warm_start_simulation():
     res['success_rate'] = float(successes)/warm_start_run_epochs
     res['ave_reward'] = float(cumulative_reward)/warm_start_run_epochs
     res['ave_turns'] = float(cumulative_turns)/warm_start_run_epochs
-    print ("Warm_Start %s epochs, success rate %s, ave reward %s, ave turns %s" % (episode+1, res['success_rate'], res['ave_reward'], res['ave_turns']))
+    print ("Warm_Start %s epochs, success rate %s, ave reward %s, ave turns %s" % (warm_start_run_epochs, res['success_rate'], res['ave_reward'], res['ave_turns']))
     print ("Current experience replay buffer size %s" % (len(agent.experience_replay_pool)))
 
 
@@ -491,6 +527,10 @@ def run_test_episodes(test_user_goals, num_test_repetition):
     return test_performance
 
 
+# the workers are forked once all the functions are defined, with their own copy of the dialog manager, the agent and the user simulator
+nb_rollout_workers = params['nb_rollout_workers']
+rollout_pool = multiprocessing.Pool(nb_rollout_workers) if nb_rollout_workers > 1 else None
+
 if params['testing']:
     test_performance = run_test_episodes(goal_set['all'], 10)
 
@@ -500,3 +540,7 @@ if params['testing']:
 
 else:
     run_episodes(num_episodes, status)
+
+if rollout_pool is not None:
+    rollout_pool.close()
+    rollout_pool.join()